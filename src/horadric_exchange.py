@@ -12,10 +12,15 @@ Literature:
   https://www.python-kurs.eu/tkinter_menus.php
 
 Markus-Hermann Koch, mhk@markuskoch.eu, 2025/02/06"""
+from __future__ import annotations
+
 import os.path
 import sys
+import mmap
 import shutil
 import logging
+import threading
+import queue
 from pathlib import Path
 from copy import deepcopy
 
@@ -24,7 +29,13 @@ from copy import deepcopy
 default =\
 {
     'pname_work': r'~/tmp',
-    'pname_d2': r'~/.wine/drive_c/Program Files/Diablo II/Save'
+    'pname_d2': r'~/.wine/drive_c/Program Files/Diablo II/Save',
+    # If True, backups go into a deduplicating store within the working directory instead of loose .backup files.
+    'use_backup_store': False,
+    # With the backup store: Store only every n-th backup of a character in full, binary diffs in between. 0 for always full.
+    'backup_delta_interval': 16,
+    # If True (and use_backup_store is False), backups are appended to compressed per-character archives within the working directory.
+    'use_backup_archive': False
 }
 # < ------------------------------------------------------------------
 
@@ -38,16 +49,19 @@ pfname_icon2 = Path(pfname_script.parent, "potion_of_life.png")
 colors = { 'button': '#009999', 'red'   : '#ff5050', 'green' : '#90ee90' }
 
 
-try:
-    import tkinter as tk
-    import tkinter.filedialog
-    import tkinter.messagebox
-    from tkinter import ttk
-    from tkinter.filedialog import askopenfile
-    from idlelib.tooltip import Hovertip
-except ModuleNotFoundError:
-    _log.warning(f"""{pfname_script.name}: Failure to import tkinter, which is necessary for opening this GUI.
-    
+def import_tkinter():
+    """Imports tkinter on demand, so that importing this module for anything but the GUI never touches GUI code."""
+    global tk, tkinter, ttk, askopenfile, Hovertip
+    try:
+        import tkinter as tk
+        import tkinter.filedialog
+        import tkinter.messagebox
+        from tkinter import ttk
+        from tkinter.filedialog import askopenfile
+        from idlelib.tooltip import Hovertip
+    except ModuleNotFoundError:
+        _log.warning(f"""{pfname_script.name}: Failure to import tkinter, which is necessary for opening this GUI.
+
 You now have three options:
 
 1.: Ensure that your python interpreter has tkinter available. This usually is not that complicated to achieve.
@@ -60,7 +74,8 @@ to have python pull in that package itself (the repository option is preferable
 3.: If you are not afraid of the command line, consider using the main script, 'horazons_folly.py' directly.
 Say "python horazons_folly.py --help" and you will receive a detailed manual page.
 """)
-    sys.exit(1)
+        sys.exit(1)
+
 
 from horazons_folly import *
 
@@ -88,10 +103,75 @@ class TextWindow:
         self.root.update()
 
 
+class ArchiveRestoreWindow:
+    """Lists the backup history of all characters with an archive, read from the archive indices. Same-named
+    characters of different directories have archives of their own. See BackupArchive.get_key(..). Restores the
+    selected version into the save-game directory."""
+    def __init__(self, parent: tk.Tk, archive: BackupArchive, pname_d2: str):
+        self.archive = archive
+        self.pname_d2 = pname_d2
+        self.entries = list()  # type: List[ArchiveEntry]
+        self.root = tk.Toplevel(parent)
+        self.root.wm_transient(parent)
+        self.root.title("Reinstate Backup")
+
+        self.combo_character = ttk.Combobox(self.root, values=archive.get_characters(), state='readonly', width=40)
+        self.combo_character.grid(row=0, column=0, sticky='ew')
+        self.combo_character.bind('<<ComboboxSelected>>', lambda event: self.list_entries())
+
+        self.list_backups = tk.Listbox(self.root, width=60, height=20)
+        self.list_backups.grid(row=1, column=0, sticky='ewns')
+
+        self.button_restore = tk.Button(self.root, text='Restore', command=self.restore, bg='#009999')
+        self.button_restore.grid(row=2, column=0, sticky='ew')
+        if self.combo_character['values']:
+            self.combo_character.current(0)
+            self.list_entries()
+
+    def list_entries(self):
+        """Newest first."""
+        key = self.combo_character.get()
+        self.entries = list(reversed(self.archive.read_index(key)))
+        self.list_backups.delete(0, tk.END)
+        origin = self.archive.get_origin(key)
+        if origin:
+            self.list_backups.insert(tk.END, f"Backups of '{origin}':")
+        for entry in self.entries:
+            self.list_backups.insert(tk.END, str(entry))
+
+    def restore(self):
+        selection = self.list_backups.curselection()
+        if not selection:
+            return
+        key = self.combo_character.get()
+        character = self.archive.get_character(key)
+        index = selection[0] - (len(self.list_backups.get(0, tk.END)) - len(self.entries))
+        if index < 0:
+            return  # << The origin line.
+        entry = self.entries[index]
+        pfname_target = os.path.expanduser(os.path.join(self.pname_d2, character + '.d2s'))
+        verb = "to replace active save-game" if os.path.isfile(pfname_target) else "into Diablo II save-game directory as"
+        if not tk.messagebox.askokcancel("Reinstating Backup", f"Restoring backup '{entry}' of {character} {verb} '{pfname_target}'."):
+            return
+        try:
+            self.archive.restore(key, entry, pfname_target)
+        except (OSError, ValueError, zlib.error) as e:
+            tk.messagebox.showerror("Reinstating Backup Failed.", str(e))
+            return
+        self.root.destroy()
+
+
 class Horadric_GUI:
     def __init__(self):
+        import_tkinter()
+        # [Note: Warming the static tables while the window is being built. Accessors are thread-safe.]
+        threading.Thread(target=preload, daemon=True).start()
         self.horadric_exchange = Horadric()
         self.horadric_horazon = Horadric()
+        self.backup_writer = BackupWriter()
+        self.watcher = None  # type: Optional[SaveDirWatcher]
+        self.queue_save_events = queue.Queue()  # type: queue.Queue
+        """Events of self.watcher, handed over to the Tk main loop. See self.poll_save_events()."""
 
         self.width_column = 40
         self.padding_columns = 10
@@ -160,6 +240,9 @@ class Horadric_GUI:
             self.root.mainloop()
         else:
             _log.warning("No GUI available.")
+        self.backup_writer.close()
+        if self.watcher is not None:
+            self.watcher.stop()
 
     @property
     def pfname_1(self) -> str:
@@ -271,11 +354,84 @@ that fit your system.""", dim=(60,17))
         if not pname_d2:
             return
         self.replace_entry_text(self.entry_pname_d2, pname_d2)
+        self.start_watcher()
+
+    def start_watcher(self):
+        """(Re-)starts watching the save-game directory. See self.poll_save_events()."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        pname_d2 = os.path.expanduser(self.pname_d2)
+        if not os.path.isdir(pname_d2):
+            return
+        self.watcher = SaveDirWatcher(pname_d2)
+        self.watcher.subscribe(lambda event, pfname, data: self.queue_save_events.put((event, pfname)))
+        self.watcher.start()
+
+    def poll_save_events(self):
+        """Refreshes the hero tab when the loaded hero's file has been changed on disk, e.g. by the game.
+        [Note: Hypothetical, uncommitted alterations are dropped then. Committing them would overwrite the game's save.]"""
+        while not self.queue_save_events.empty():
+            event, pfname = self.queue_save_events.get_nowait()
+            hero = self.horadric_horazon.data_all[0] if self.horadric_horazon.data_all else None
+            if (hero is None) or (event == E_SaveEvent.SE_REMOVED):
+                continue
+            if os.path.realpath(os.path.expanduser(hero.pfname)) == os.path.realpath(pfname):
+                print(f"'{pfname}' has been changed on disk. Reloading {hero.get_name(True)}.")
+                self.open_hero(hero.pfname)
+        self.root.after(500, self.poll_save_events)
+
+    @property
+    def backup_store(self) -> Optional[BackupStore]:
+        """:returns the deduplicating backup store within the working directory. None, if loose .backup files are used."""
+        if not default['use_backup_store']:
+            return None
+        return BackupStore(os.path.join(os.path.expanduser(self.pname_work), 'horadric_store'), delta_interval=default['backup_delta_interval'])
+
+    @property
+    def backup_archive(self) -> Optional[BackupArchive]:
+        """:returns the per-character backup archives within the working directory. None, if not configured."""
+        if default['use_backup_store'] or not default['use_backup_archive']:
+            return None
+        return BackupArchive(os.path.join(os.path.expanduser(self.pname_work), 'horadric_archive'))
 
     def pfname2pfname_backup(self, pfname) -> str:
         tm = Data.get_time()
         return str(Path(self.pname_work).joinpath(Path(tm + '_' + Path(pfname).name + '.backup').name))
 
+    def submit_backup(self, data: Data, pfname_backup: str) -> BackupTicket:
+        """Queues a backup of data on the background writer. Into the backup store or archive, if configured.
+        Otherwise as loose file pfname_backup. The original file must not be overwritten before the ticket is done."""
+        store = self.backup_store
+        archive = self.backup_archive
+
+        def job() -> str:
+            # [Note: data may map the original file. The map has to be gone before that file is replaced. Windows
+            #  refuses to replace mapped files.]
+            try:
+                if store:
+                    return f"{store.pname} ({store.put(data).digest})"
+                if archive:
+                    archive.put(data)
+                    return archive.get_pfname_archive(archive.get_key(data))
+                return data.save2disk(expanduser(pfname_backup))
+            finally:
+                data.close()
+        return self.backup_writer.submit(job, f"{data.get_name(True)} -> {pfname_backup}")
+
+    def after_backups(self, tickets: List[BackupTicket], proceed: Callable[[List[str]], None], on_failure: Callable[[], None]):
+        """Polls the tickets from the Tk main loop, which stays responsive meanwhile. Once all are done, calls proceed
+        with the backup locations. If any backup has failed, nothing is overwritten. Calls on_failure instead."""
+        if not all(ticket.is_done() for ticket in tickets):
+            self.root.after(50, lambda: self.after_backups(tickets, proceed, on_failure))
+            return
+        errors = [f"{ticket.description}: {ticket.error}" for ticket in tickets if ticket.error is not None]
+        if errors:
+            on_failure()
+            tkinter.messagebox.showerror("Backup Failed.", "Failure to write backups. The original files have not been touched.\n" + '\n'.join(errors))
+            return
+        proceed([ticket.result for ticket in tickets])
+
     def do_horadric_exchange(self):
         data_1 = self.horadric_exchange.get_data_by_pfname(self.pfname_1)
         data_2 = self.horadric_exchange.get_data_by_pfname(self.pfname_2)
@@ -283,22 +439,26 @@ that fit your system.""", dim=(60,17))
             _log.error("Failure to exchange two valid candidates. This should be impossible and indicates a bug.")
             return
         self.horadric_exchange.data_all = [data_1, data_2]
-        pfname_backup1 = self.pfname2pfname_backup(self.pfname_1)
-        pfname_backup2 = self.pfname2pfname_backup(self.pfname_2)
-        print(f"Writing backup files '{pfname_backup1}' and '{pfname_backup2}'.")
-        shutil.copyfile(expanduser(self.pfname_1), expanduser(pfname_backup1))
-        shutil.copyfile(expanduser(self.pfname_2), expanduser(pfname_backup2))
-        if self.horadric_exchange.exchange_horadric():
+        self.horadric_exchange.results.clear()
+        tickets = [self.submit_backup(Data(expanduser(pfname), read_only=True), self.pfname2pfname_backup(pfname))
+                   for pfname in [self.pfname_1, self.pfname_2]]
+        self.button_horadric.config(state='disabled')
+        self.after_backups(tickets, lambda locations: self.finish_horadric_exchange(data_1, data_2, locations), self.update_button_horadric)
+
+    def finish_horadric_exchange(self, data_1: Data, data_2: Data, locations_backup: List[str]):
+        """Second half of do_horadric_exchange(..), once both backups are durable."""
+        print(f"Backups written to '{locations_backup[0]}' and '{locations_backup[1]}'.")
+        self.update_button_horadric()
+        if self.horadric_exchange.exchange_horadric().err:
             tkinter.messagebox.showerror("Exchange Failed.", "Horadric Exchange has failed for unknown reasons.")
         else:
             data_1.update_all()
             data_2.update_all()
-            data_1.save2disk()
-            data_2.save2disk()
+            Data.flush_all([data_1, data_2])
             self.ta_insert_character_data(self.horadric_exchange, self.pfname_1, self.ta_desc1)
             self.ta_insert_character_data(self.horadric_exchange, self.pfname_2, self.ta_desc2)
             tkinter.messagebox.showinfo("Success.", f"Horadric Exchange Succeeded! Backup files have been written into '{self.pname_work}'"
-                                        f" ({pfname_backup1} and {pfname_backup2})")
+                                        f" ({locations_backup[0]} and {locations_backup[1]})")
 
     def ta_insert_character_data(self, horadric: Horadric, pfname: str, ta: tk.Text) -> int:
         """Load a character's file information into the given text area.
@@ -352,6 +512,10 @@ February 2025, Markus-H. Koch ( https://github.com/kochsoft/diablo2 )"""
         TextWindow(self.root, msg, self.icon_horadric_exchange, (70,18))
 
     def load_backup(self):
+        archive = self.backup_archive
+        if archive:
+            ArchiveRestoreWindow(self.root, archive, self.pname_d2)
+            return
         pfname_backup = tkinter.filedialog.askopenfilename(parent=self.root, title="Select backup file.",
                                            filetypes=[("d2s backup", "*.backup")], initialdir=self.pname_work)
         if not pfname_backup:
@@ -370,6 +534,9 @@ February 2025, Markus-H. Koch ( https://github.com/kochsoft/diablo2 )"""
         shutil.copyfile(pfname_backup, pfname_target)
 
     def verify_hero(self) -> Optional[Data]:
+        """Called ahead of every hero operation. Also drops the results of former operations.
+        :returns the hero, or None if none has been loaded."""
+        self.horadric_horazon.results.clear()
         if self.horadric_horazon.data_all:
             return self.horadric_horazon.data_all[0]
         else:
@@ -384,19 +551,22 @@ February 2025, Markus-H. Koch ( https://github.com/kochsoft/diablo2 )"""
         self.replace_entry_text(self.entry_pname_hero, pfname_hero)
         # >> Loading a cube for pure review. -------------------------
         if pfname_hero.lower().endswith(".cube"):
-            with open(pfname_hero, 'rb') as IN:
-                code = IN.read()
-            n = len(code)
-            items = list()  # type: List[Item]
-            index0 = 0
-            while index0 != n:
-                index1 = code.find(b"JM", index0+2)
-                index1 = index1 if index1 > 0 else n
-                items.append(Item(code, index0, index1))
-                index0 = index1
             info = 'Cube content.\n=============\n'
-            for item in items:
-                info += f"{item}\n"
+            with open(pfname_hero, 'rb') as IN:
+                # [Note: Mapped for pure review. Only the parsed item strings outlive the mapping.]
+                try:
+                    code = mmap.mmap(IN.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    code = IN.read()
+                n = len(code)
+                index0 = 0
+                while index0 != n:
+                    index1 = code.find(b"JM", index0+2)
+                    index1 = index1 if index1 > 0 else n
+                    info += f"{Item(code, index0, index1)}\n"
+                    index0 = index1
+                if isinstance(code, mmap.mmap):
+                    code.close()
             self.ta_hero.delete(0.0, tk.END)
             self.ta_hero.insert(0.0, info)
             self.horadric_horazon.data_all.clear()
@@ -405,14 +575,21 @@ February 2025, Markus-H. Koch ( https://github.com/kochsoft/diablo2 )"""
         # << ---------------------------------------------------------
         # >> Loading a character. ------------------------------------
         else:
-            self.horadric_horazon.data_all = [Data(pfname_hero, pname_backup=os.path.expanduser(self.pname_work))]
-            self.data_hero_backup = deepcopy(self.horadric_horazon.data_all[0])
-            self.data_hero_backup.pfname = self.pfname2pfname_backup(pfname_hero)
-            err = self.ta_insert_character_data(self.horadric_horazon, pfname_hero, self.ta_hero)
-            if err == 0:
-                self.update_hero_widgets(err == 0)
+            if self.open_hero(pfname_hero) == 0:
                 self.tabControl.select(self.tab2)
         # << ---------------------------------------------------------
+
+    def open_hero(self, pfname_hero: str) -> int:
+        """(Re-)loads the hero from pfname_hero into the hero tab. The state as loaded is the backup for the next commit.
+        :returns 0 on success."""
+        self.horadric_horazon.data_all = [Data(pfname_hero, pname_backup=os.path.expanduser(self.pname_work))]
+        self.data_hero_backup = deepcopy(self.horadric_horazon.data_all[0])
+        self.data_hero_backup.pfname = self.pfname2pfname_backup(pfname_hero)
+        err = self.ta_insert_character_data(self.horadric_horazon, pfname_hero, self.ta_hero)
+        if err == 0:
+            self.update_hero_widgets(err == 0)
+        return err
+
     def load_cube(self):
         data = self.verify_hero()
         if not data:
@@ -855,16 +1032,25 @@ February 2025, Markus-H. Koch ( https://github.com/kochsoft/diablo2 )"""
                 self.check_wp_hop.deselect()
 
     def do_commit_horazon(self):
-        """Save the current hero to disk. A backup has been made earlier, during self.update_hero_widgets(..)."""
+        """Save the current hero to disk. The backup is the state of the hero as loaded, see self.load_hero(..).
+        It is written first, by the background writer. The hero is saved only once that has succeeded."""
         data = self.verify_hero()
         if not data:
             return
-        for d in [data, self.data_hero_backup]:
-            d.update_all()
-            d.save2disk()
+        self.data_hero_backup.update_all()
+        ticket = self.submit_backup(self.data_hero_backup, self.data_hero_backup.pfname)
+        self.button_horazon.config(state='disabled')
+        self.after_backups([ticket], lambda locations: self.finish_commit_horazon(data, locations[0]),
+                           lambda: self.button_horazon.config(state='normal'))
+
+    def finish_commit_horazon(self, data: Data, location_backup: str):
+        """Second half of do_commit_horazon(..), once the backup is durable."""
+        self.button_horazon.config(state='normal')
+        data.update_all()
+        Data.flush_all([data])
         self.ta_insert_character_data(self.horadric_horazon, data.pfname, self.ta_hero)
         tk.messagebox.showinfo("Modifications Saved.", f"Alteration of the Hero has been saved to '{data.pfname}'. "
-                               f"A backup file may be found at '{self.data_hero_backup.pfname}'.")
+                               f"A backup file may be found at '{location_backup}'.")
 
     def build_gui(self):
         # > Main Window. ---------------------------------------------
@@ -1109,6 +1295,8 @@ Beware!"""
         self.validate_pname_work()
 
         self.update_hero_widgets(False)
+        self.start_watcher()
+        self.root.after(500, self.poll_save_events)
         # < ----------------------------------------------------------
 
 
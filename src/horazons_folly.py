@@ -24,20 +24,29 @@ Markus-Hermann Koch, mhk@markuskoch.eu, 2025/01/29.
 
 from __future__ import annotations
 
-from incubus import ModificationSet
+import time
+t_import_start = time.perf_counter()  # << For --startup_report.
 
 import re
 import os
 import sys
-import time
+import json
+import mmap
+import stat
+import marshal
+import struct
+import zlib
 import logging
+import threading
+import queue
 import argparse
 from os.path import expanduser
 from collections import OrderedDict as odict
+from collections import Counter
 from argparse import RawTextHelpFormatter
 from pathlib import Path
 from math import ceil, floor
-from typing import List, Dict, Optional, Union, Tuple, OrderedDict, Any
+from typing import List, Dict, Optional, Union, Tuple, OrderedDict, Any, Iterator, Callable
 from enum import Enum
 
 
@@ -138,9 +147,12 @@ class E_ItemGrade(Enum):
     def __str__(self):
         return re.sub("^IG_", "", self.name).lower()
 
-"""Based on [3]. Maps item type codes to actual items. Also gives insight in some meta-information on the topic."""
-# [Note: This is a forward-declaration! https://medium.com/lets-learn-python/forward-declarations-in-python-cad6c736da6a ]
-l_item_families: list  # type: List[ItemFamily]
+"""Lock guarding the lazy, on-demand loading of the static tables below. See get_item_families() and get_armor_weapons()."""
+_lock_tables = threading.RLock()
+
+"""Based on [3]. Maps item type codes to actual items. Also gives insight in some meta-information on the topic.
+Loaded on first use. Access via get_item_families(). Module attribute l_item_families remains available, too."""
+_l_item_families = None  # type: Optional[List[ItemFamily]]
 
 class ItemFamily:
     def __init__(self, code_names: OrderedDict[str, str], item_class: E_ItemClass, *, rows: Optional[int]=None, cols: Optional[int]=None):
@@ -198,7 +210,7 @@ class ItemFamily:
         if not code:
             return None
         if not data:
-            data = l_item_families
+            data = get_item_families()
         for item_family in data:
             if code in item_family.code_names:
                 return item_family
@@ -228,7 +240,7 @@ class ItemFamily:
         if not code:
             return None
         if not data:
-            data = l_item_families
+            data = get_item_families()
         it_fam = ItemFamily.get_family_by_code(code, data)
         if not it_fam:
             return None
@@ -240,13 +252,22 @@ class ItemFamily:
         if not code:
             return None
         if not data:
-            data = l_item_families
+            data = get_item_families()
         it_fam = ItemFamily.get_family_by_code(code, data)
         if not it_fam:
             return None
         else:
             return it_fam.code_names[code]
 
+    def to_snapshot(self) -> Tuple[List[Tuple[str, str]], str, Optional[int], Optional[int]]:
+        """:returns this ItemFamily as marshal-friendly tuple. For the table snapshot."""
+        return list(self.code_names.items()), self.item_class.name, self._rows, self._cols
+
+    @staticmethod
+    def from_snapshot(entry: Tuple[List[Tuple[str, str]], str, Optional[int], Optional[int]]) -> ItemFamily:
+        """Inverse of to_snapshot(..)."""
+        return ItemFamily(odict(entry[0]), E_ItemClass[entry[1]], rows=entry[2], cols=entry[3])
+
     @staticmethod
     def load_item_family_list(pfname: Optional[str] = None) -> List[ItemFamily]:
         if not pfname:
@@ -283,19 +304,31 @@ class ItemFamily:
                     res.append(ItemFamily(od, current_class))
             return res
 
-l_item_families = ItemFamily.load_item_family_list()
-
-"""Maps item 3 letter codes to durability, armor class min, armor class max. As encoded in armor_weapons.tsv."""
-d_armor_weapons = dict()  # type: Dict[str, Tuple[int, int, int]]
-
-def load_armor_weapons_dict():
+def get_item_families() -> List[ItemFamily]:
+    """:returns the list of ItemFamilies from item_codes.tsv. Loaded on first call. Thread-safe."""
+    global _l_item_families
+    if _l_item_families is None:
+        with _lock_tables:
+            if _l_item_families is None:
+                pfname = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'item_codes.tsv')
+                from incubus import TableSnapshot
+                data = TableSnapshot.get('item_families', pfname, lambda: [fam.to_snapshot() for fam in ItemFamily.load_item_family_list(pfname)])
+                _l_item_families = [ItemFamily.from_snapshot(entry) for entry in data]
+    return _l_item_families
+
+"""Maps item 3 letter codes to durability, armor class min, armor class max. As encoded in armor_weapons.tsv.
+Loaded on first use. Access via get_armor_weapons(). Module attribute d_armor_weapons remains available, too."""
+_d_armor_weapons = None  # type: Optional[Dict[str, Tuple[int, int, int]]]
+
+def load_armor_weapons_dict(pfname: Optional[str] = None) -> Dict[str, Tuple[int, int, int]]:
     """Reads the given armor-weapon file and exposes it as a dict with item code as key and a 3-tuple
     of (durability, ac min, ac max) as value."""
-    pfname = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'armor_weapons.tsv')
+    if not pfname:
+        pfname = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'armor_weapons.tsv')
+    res = dict()  # type: Dict[str, Tuple[int, int, int]]
     if not os.path.isfile(pfname):
         _log.warning(f"Failure to open armor weapons file '{pfname}' for reading.")
-        return
-    d_armor_weapons.clear()
+        return res
     with open(pfname, 'r') as IN:
         for line in IN:
             if re.findall("^\\s*#", line) or re.findall("^\\s*$", line):
@@ -311,9 +344,45 @@ def load_armor_weapons_dict():
             except ValueError:
                 _log.warning(f"Invalid line encountered: {line}")
                 continue
-            d_armor_weapons[code] = durability, ac_min, ac_max
-
-load_armor_weapons_dict()
+            res[code] = durability, ac_min, ac_max
+    return res
+
+def get_armor_weapons() -> Dict[str, Tuple[int, int, int]]:
+    """:returns the dict from armor_weapons.tsv. Loaded on first call. Thread-safe."""
+    global _d_armor_weapons
+    if _d_armor_weapons is None:
+        with _lock_tables:
+            if _d_armor_weapons is None:
+                pfname = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'armor_weapons.tsv')
+                from incubus import TableSnapshot
+                _d_armor_weapons = TableSnapshot.get('armor_weapons', pfname, lambda: load_armor_weapons_dict(pfname))
+    return _d_armor_weapons
+
+def preload() -> Dict[str, float]:
+    """Loads all static tables right away. For long-running processes (GUI, servers, pool workers) that would rather
+    pay the loading cost up front than on first use.
+    :returns the seconds spent per table. Near zero for tables that had been loaded before."""
+    res = dict()  # type: Dict[str, float]
+    t0 = time.perf_counter()
+    get_item_families()
+    t1 = time.perf_counter()
+    get_armor_weapons()
+    t2 = time.perf_counter()
+    from incubus import ModificationSet
+    ModificationSet.get_table_mods()
+    t3 = time.perf_counter()
+    res['item_families'] = t1 - t0
+    res['armor_weapons'] = t2 - t1
+    res['mods'] = t3 - t2
+    return res
+
+def __getattr__(name: str) -> Any:
+    """Lazy module attributes. Keeps l_item_families and d_armor_weapons accessible without loading them on import."""
+    if name == 'l_item_families':
+        return get_item_families()
+    elif name == 'd_armor_weapons':
+        return get_armor_weapons()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 class E_Rune(Enum):
     ER_NORUNE = 0
@@ -1343,6 +1412,13 @@ class Item:
             return
         self.data_item = set_bitrange_value_to_bytes(self.data_item, 73, 76, code.value)
 
+    @property
+    def data_item_unplaced(self) -> Optional[bytes]:
+        """Bits 58,..,75 (parent, equipment slot, column, row, storage) zeroed. The same for an item, wherever it is."""
+        if self.is_analytical:
+            return self.data_item
+        return set_bitrange_value_to_bytes(self.data_item, 58, 76, 0)
+
     @property
     def type_code(self) -> Optional[str]:
         if self.is_analytical:
@@ -1692,6 +1768,7 @@ class Item:
     def durability2default(self):
         """Sets this items durability to the default defined by armor_weapons.tsv."""
         code = self.type_code
+        d_armor_weapons = get_armor_weapons()
         if not code in d_armor_weapons:
             return
         self.durability = d_armor_weapons[code][0]
@@ -1699,6 +1776,7 @@ class Item:
     def defense2default(self, p: float = 0.5):
         """Sets this item's armor value (if any is present) to (p * ac_max + (1-p) * ac_min)."""
         code = self.type_code
+        d_armor_weapons = get_armor_weapons()
         if not code in d_armor_weapons:
             return
         val = round((1.0 - p) * d_armor_weapons[code][1] + p * d_armor_weapons[code][2])  # type: int
@@ -1982,7 +2060,8 @@ class Item:
             res += f"  {key}: [{indices[key][0]}:{indices[key][1]}], "
             # [Note: ]
             if key in (E_ExtProperty.EP_MODS, E_ExtProperty.EP_MODS_RUNEWORD) and self.type_code not in ('ibk', 'tbk', 'key'):
-                mod_parsing = str(ModificationSet(binary))
+                from incubus import ModificationSet
+                mod_parsing = str(ModificationSet(self.data_item, indices[key][0], indices[key][1]))
                 mod_parsing = re.sub('\\n', "\n    * ", mod_parsing)
                 res += mod_parsing
             else:
@@ -2322,16 +2401,182 @@ class Item:
                 f"{bm_col_row_split}\n{self.data_item}"
 
 
+class ItemBlockLayout:
+    """Count-aware model of the item blocks within a .d2s data blob. Scans the block structure once and knows, for
+    each item block, where it lives and where its declared item count is stored within the preceding header.
+    Subsequent insertions and removals are done by splice(..), that rewrites the items and the declared count in one
+    go and shifts the offsets of all following blocks arithmetically. No re-scanning for 'JM', 'jf' or 'kf' is needed
+    as long as self.data is the very bytes object handed out by the last splice.
+    Declared count sites (see [1]):
+    * Player: 'JM' + 2 bytes item count.
+    * Corpse: 'JM' + 2 bytes corpse count (0 or 1). If there is a corpse, 12 unknown bytes and 'JM' + 2 bytes item count follow.
+    * Mercenary: 'jf'. If a mercenary has been hired, 'JM' + 2 bytes item count follow.
+    * Iron Golem: 'kf' + 1 byte. 1 if there is a golem, whose item follows, else 0."""
+    def __init__(self, data: bytes):
+        """:param data: Binary block describing the entirety of a .d2s file."""
+        self.data = data
+        self.index = dict()  # type: Dict[E_ItemBlock, List[int]]
+        """Keys: All E_ItemBlocks present in data. Values: [index_start, index_end] of that block. Non-header blocks
+        are present even if they are empty, as long as their header exists."""
+        self.sites_count = dict()  # type: Dict[E_ItemBlock, Tuple[int, int]]
+        """Keys: Non-header E_ItemBlocks. Values: Byte range of the declared item count relative to the header start."""
+        block_index = Item(data).get_block_index()
+        for block in block_index:
+            self.index[block] = list(block_index[block])
+        for block in (E_ItemBlock.IB_PLAYER, E_ItemBlock.IB_CORPSE, E_ItemBlock.IB_MERCENARY, E_ItemBlock.IB_IRONGOLEM):
+            block_hd = E_ItemBlock(block.value - 1)
+            if block_hd not in self.index:
+                continue
+            index0_hd, index1_hd = self.index[block_hd]
+            if block not in self.index:
+                self.index[block] = [index1_hd, index1_hd]
+            sz_hd = index1_hd - index0_hd
+            if block == E_ItemBlock.IB_PLAYER:
+                self.sites_count[block] = 2, 4
+            elif block == E_ItemBlock.IB_CORPSE and sz_hd == 20:
+                self.sites_count[block] = 18, 20
+            elif block == E_ItemBlock.IB_MERCENARY and sz_hd == 6:
+                self.sites_count[block] = 4, 6
+            elif block == E_ItemBlock.IB_IRONGOLEM and sz_hd == 3:
+                self.sites_count[block] = 2, 3
+
+    @staticmethod
+    def get_block_for_header(block: E_ItemBlock) -> E_ItemBlock:
+        """:returns the item block that is counted by the given header block. Non-header blocks are returned as is."""
+        return E_ItemBlock(block.value + 1) if block.is_header else block
+
+    def has_count(self, block: E_ItemBlock) -> bool:
+        """:returns True if and only if the given block (or header) has a declared item count site within data."""
+        return self.get_block_for_header(block) in self.sites_count
+
+    def get_index_count(self, block: E_ItemBlock) -> Optional[Tuple[int, int]]:
+        """:returns the absolute byte range of the declared item count for the given block (or header). None if n.a."""
+        block = self.get_block_for_header(block)
+        if block not in self.sites_count:
+            return None
+        index0_hd = self.index[E_ItemBlock(block.value - 1)][0]
+        return index0_hd + self.sites_count[block][0], index0_hd + self.sites_count[block][1]
+
+    def get_count(self, block: E_ItemBlock) -> int:
+        """:returns the declared number of direct items for the given block (or header). 0 if there is no such count."""
+        index_count = self.get_index_count(block)
+        if index_count is None:
+            return 0
+        return int.from_bytes(self.data[index_count[0]:index_count[1]], 'little')
+
+    def splice(self, block: E_ItemBlock, index_start: int, index_end: int, bts: bytes, delta_count: int) -> bytes:
+        """Replaces data[index_start:index_end] within the given block by bts and adds delta_count to the declared
+        item count of that block. Both within the same rewrite of the data.
+        :param block: Target item block. Headers are translated into the block they count.
+        :param index_start: Byte index within data. Needs to lie within the target block.
+        :param index_end: Byte index within data. index_start <= index_end <= end of the target block.
+        :param bts: Replacement bytes. May be empty, for dropping items.
+        :param delta_count: Number of direct items added (positive) or removed (negative).
+        :returns the new data block. Also stored as self.data."""
+        block = self.get_block_for_header(block)
+        if block not in self.index:
+            raise ValueError(f"Item block '{block.name}' is not present in this data.")
+        index0_block, index1_block = self.index[block]
+        if not (index0_block <= index_start <= index_end <= index1_block):
+            raise ValueError(f"Splice range [{index_start}:{index_end}] exceeds block '{block.name}' [{index0_block}:{index1_block}].")
+        index_count = self.get_index_count(block)
+        if index_count is None:
+            if delta_count:
+                raise ValueError(f"Item block '{block.name}' has no item count to be changed by {delta_count}.")
+            self.data = self.data[:index_start] + bts + self.data[index_end:]
+        else:
+            count = self.get_count(block) + delta_count
+            sz_count = index_count[1] - index_count[0]
+            if not (0 <= count < 2**(8 * sz_count)):
+                raise ValueError(f"Item count {count} is out of range for block '{block.name}'.")
+            self.data = self.data[:index_count[0]] + int.to_bytes(count, sz_count, 'little') + \
+                self.data[index_count[1]:index_start] + bts + self.data[index_end:]
+        delta = len(bts) - (index_end - index_start)
+        self.index[block][1] += delta
+        for key in self.index:
+            if key.value > block.value:
+                self.index[key][0] += delta
+                self.index[key][1] += delta
+        return self.data
+
+
+class ItemSelector:
+    """Predicate on stored player items, by type code, quality and storage. Criteria not given match everything.
+    Spec syntax: ';' separated 'key=value[,value...]', with keys 'type', 'quality' and 'storage'. E.g.
+    'type=rin,amu;quality=unique,set;storage=stash'. Qualities are named like E_Quality without the 'EQ_'
+    (e.g. 'magically_enhanced', or any unique prefix, like 'magic'). Storages are 'inventory', 'cube' and 'stash'."""
+    def __init__(self, type_codes: Optional[List[str]] = None, qualities: Optional[List[E_Quality]] = None,
+                 storages: Optional[List[E_ItemStorage]] = None):
+        self.type_codes = type_codes  # type: Optional[List[str]]
+        self.qualities = qualities  # type: Optional[List[E_Quality]]
+        self.storages = storages  # type: Optional[List[E_ItemStorage]]
+
+    @staticmethod
+    def parse(spec: str) -> ItemSelector:
+        """:raises ValueError on syntax errors and unknown names."""
+        selector = ItemSelector()
+        for part in [x for x in spec.split(';') if x.strip()]:
+            if '=' not in part:
+                raise ValueError(f"Item selection '{part}' lacks the '=' between key and values.")
+            key, values = part.split('=', 1)
+            values = [x.strip() for x in values.split(',') if x.strip()]
+            key = key.strip()
+            if key == 'type':
+                selector.type_codes = values
+            elif key == 'quality':
+                selector.qualities = [ItemSelector.parse_enum(E_Quality, 'EQ_', val) for val in values]
+            elif key == 'storage':
+                selector.storages = ItemSelector.parse_storages(','.join(values))
+            else:
+                raise ValueError(f"Unknown item selection key '{key}'. Expected 'type', 'quality' or 'storage'.")
+        return selector
+
+    @staticmethod
+    def parse_enum(enum, prefix: str, name: str):
+        """:returns the member of enum whose name is prefix + name, or the only one starting with that."""
+        name = prefix + name.upper()
+        candidates = [member for member in enum if member.name == name] or [member for member in enum if member.name.startswith(name)]
+        if len(candidates) != 1:
+            raise ValueError(f"'{name}' does not name exactly one of {[member.name for member in enum]}.")
+        return candidates[0]
+
+    @staticmethod
+    def parse_storages(code: str) -> List[E_ItemStorage]:
+        """:param code: Comma separated storage names. E.g. 'stash,inventory'."""
+        storages = [ItemSelector.parse_enum(E_ItemStorage, 'IS_', val.strip()) for val in code.split(',')]
+        if E_ItemStorage.IS_UNSPECIFIED in storages:
+            raise ValueError("Storage 'unspecified' can not be selected.")
+        return storages
+
+    def matches(self, item: Item) -> bool:
+        """Only stored items match. Never socketed ones, which go wherever their parent goes."""
+        if item.item_parent != E_ItemParent.IP_STORED:
+            return False
+        if (self.storages is not None) and (item.stash_type not in self.storages):
+            return False
+        if (self.type_codes is not None) and (item.type_code not in self.type_codes):
+            return False
+        return (self.qualities is None) or (item.quality in self.qualities)
+
+
 class Data:
     """Data object concerned with the binary content of the entirety of a .d2s save game file."""
-    def __init__(self, pfname: str, pname_backup: Optional[str] = None):
-        """:param pfname: Path and filename to target .d2s save game file."""
+    def __init__(self, pfname: str, pname_backup: Optional[str] = None, *, read_only: bool = False):
+        """:param pfname: Path and filename to target .d2s save game file.
+        :param read_only: If True, the file is memory-mapped rather than read into the heap. For inspection.
+          The parser works directly on the mapping. The first write replaces the mapping by a mutable copy."""
         if not pfname:
             raise ValueError("pfname required for Data object.")
         self.pfname = pfname
         self.pname_backup = os.path.expanduser(pname_backup if pname_backup else os.path.dirname(pfname))
+        self._data = b''  # type: Union[bytes, mmap.mmap]
+        self._block_layout = None  # type: Optional[ItemBlockLayout]
         with open(os.path.expanduser(pfname), 'rb') as IN:
-            self.data = IN.read()
+            try:
+                self._data = mmap.mmap(IN.fileno(), 0, access=mmap.ACCESS_READ) if read_only else IN.read()
+            except (ValueError, OSError):
+                # [Note: E.g., empty files or file systems that cannot map. Reading is always an option.]
+                self._data = IN.read()
         ver = self.get_file_version()
         if ver != 96:
             print(f"""Invalid save game version '{ver}'. Sorry. This script so far only supports version code '96' (v1.10-v1.14d) save game files.
@@ -2339,6 +2584,49 @@ Fixing this is mostly updating the sites in the .d2s file, where the action take
 this page was an excellent source for that: https://github.com/WalterCouto/D2CE/blob/main/d2s_File_Format.md""")
             sys.exit(1)
 
+    @property
+    def data(self) -> Union[bytes, mmap.mmap]:
+        """Binary content of the entire .d2s file. A read-only memory map for read_only Data that were never written."""
+        return self._data
+
+    @data.setter
+    def data(self, value: bytes):
+        if self.is_mapped:
+            self._data.close()
+        self._data = value
+
+    @property
+    def is_mapped(self) -> bool:
+        """:returns True if and only if self.data still is the read-only memory map of the file."""
+        return isinstance(self._data, mmap.mmap)
+
+    def materialize(self):
+        """Replaces a read-only memory map by a copy in the heap. Required before the mapped file is overwritten."""
+        if self.is_mapped:
+            self.data = self._data[:]
+
+    def close(self):
+        """Releases the memory map, if any. This Data object will keep working on a copy."""
+        self.materialize()
+
+    def __del__(self, _type_mmap: type = mmap.mmap):
+        """Releases the memory map, if any, once this Data object is dropped. E.g., by the GUI or by a server cache.
+        [Note: The type is bound at definition. At interpreter shutdown, module globals like mmap may be gone.]"""
+        data = self.__dict__.get('_data')
+        if isinstance(data, _type_mmap):
+            try:
+                data.close()
+            except BufferError:
+                pass  # << Still exported somewhere. Then the map goes with its last view.
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Memory maps can neither be pickled nor deep-copied. Their content can."""
+        state = self.__dict__.copy()
+        if self.is_mapped:
+            state['_data'] = self._data[:]
+        state['_block_layout'] = None
+        return state
+
     def __eq__(self, other: Data) -> bool:
         """Two Data blocks are deemed equal if their pfnames match."""
         return self.pfname == other.pfname
@@ -2360,12 +2648,8 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
 
     @property
     def has_iron_golem(self) -> bool:
-        item_analysis = Item(self.data)
-        hd = item_analysis.get_block_items(E_ItemBlock.IB_IRONGOLEM)
-        if not hd:
-            return False
-        data = hd[0].data_item[2]
-        return data > 0
+        """:returns True if and only if the golem flag within the 'kf' header is set."""
+        return self.get_item_count(E_ItemBlock.IB_IRONGOLEM_HD, True) > 0
 
     @property
     def level_by_header(self) -> int:
@@ -2583,6 +2867,22 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         skill points. Allowing for cheats 200 is a natural limit."""
         return sum(self.get_skills()) >= 200
 
+    def get_fields(self, *, with_items: bool = True) -> OrderedDict[str, Any]:
+        """:returns the header fields, attributes ('attr:<name>') and quest blocks that operations may alter, by name.
+        Meant for comparisons of states, e.g. by Horadric.dry_run(..).
+        :param with_items: Also the fields that require parsing the items: iron_golem, horadric_cube."""
+        res = odict([('name', self.get_name(True)), ('class', self.get_class(True)), ('hardcore', self.is_hardcore()),
+                     ('dead', self.is_dead()), ('progression', self.progression), ('waypoints', self.waypoint_map),
+                     ('skills', self.get_skills()), ('mercenary_dead', self.is_dead_mercenary)])  # type: OrderedDict[str, Any]
+        if with_items:
+            res['iron_golem'] = self.has_iron_golem
+            res['horadric_cube'] = self.has_horadric_cube
+        for attr, val in self.get_attributes().items():
+            res[f"attr:{attr.name}"] = val
+        for prog in [E_Progression.EP_NORMAL, E_Progression.EP_NIGHTMARE, E_Progression.EP_HELL]:
+            res[f"quests:{prog.name}"] = E_Quest.get_quest_block(self.data, prog)
+        return res
+
     def compute_checksum(self) -> bytes:
         """:returns a newly computed checksum for self.data."""
         csum = 0
@@ -2598,7 +2898,6 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         :returns the checksum in a 4-byte binary string. Also updates the self.data accordingly."""
         csum = self.compute_checksum()
         self.data = self.data[0:12] + csum + self.data[16:]
-        print("Updated checksum.")
         return csum
 
     def get_checksum(self) -> bytes:
@@ -2622,35 +2921,32 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         """:returns the file size as it is written within self.data."""
         return int.from_bytes(self.data[8:12], 'little')
 
+    @property
+    def block_layout(self) -> ItemBlockLayout:
+        """Count-aware item block model of self.data. Is rebuilt lazily, whenever self.data has been replaced by
+        anything else than the result of the last ItemBlockLayout.splice(..)."""
+        if (self._block_layout is None) or (self._block_layout.data is not self.data):
+            self._block_layout = ItemBlockLayout(self.data)
+        return self._block_layout
+
+    def get_item_count(self, block: E_ItemBlock, as_int = False) -> Union[int, bytes]:
+        """:returns the declared number of direct items of the given block (or its header). 0 if there is none."""
+        val = self.block_layout.get_count(block)
+        return val if as_int else int.to_bytes(val, 2, 'little')
+
     def get_item_count_mercenary(self, as_int = False) -> Union[int, bytes]:
-        index_hd = self.data.find(b'jfJM', 765)
-        if index_hd < 0:
-            return 0 if as_int else b'\x00\x00'
-        else:
-            val = self.data[(index_hd + 4):(index_hd + 6)]
-            if not as_int:
-                return val
-            else:
-                return int.from_bytes(val, 'little')
+        return self.get_item_count(E_ItemBlock.IB_MERCENARY_HD, as_int)
 
     def get_item_count_player(self, as_int = False) -> Union[int, bytes]:
-        index_hd = self.data.find(b'JM', 765)
-        if index_hd < 0:
-            return 0 if as_int else b'\x00\x00'
-        else:
-            val = self.data[(index_hd + 2):(index_hd + 4)]
-            if not as_int:
-                return val
-            else:
-                return int.from_bytes(val, 'little')
+        return self.get_item_count(E_ItemBlock.IB_PLAYER_HD, as_int)
 
     def set_item_count(self, block: E_ItemBlock, val: int):
-        if block == E_ItemBlock.IB_PLAYER_HD:
-            index_begin = self.data.find(b'JM', 765) + 2
-            index_end = index_begin + 2
-            self.data = self.data[0:index_begin] + int.to_bytes(val, 2, 'little') + self.data[index_end:]
-        else:
-            _log.warning(f"Failure to set item count for hitherto unsupported block '{block.name}'.")
+        layout = self.block_layout
+        if not layout.has_count(block):
+            _log.warning(f"Failure to set item count for block '{block.name}' that has no item count in '{self.pfname}'.")
+            return
+        index_start = layout.index[layout.get_block_for_header(block)][0]
+        self.data = layout.splice(block, index_start, index_start, b'', val - layout.get_count(block))
 
     def get_rank(self, add_trailing_space_to_non_empty: bool = True) -> str:
         hc = self.is_hardcore()
@@ -2763,21 +3059,21 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
                           (E_Attributes.AT_EXPERIENCE, 14641810),
                           (E_Attributes.AT_STASHED_GOLD, 1000000)])
         self._enable_higher_difficulty(attr_new, E_Progression.EP_NIGHTMARE)
-        print(f"{self.get_name(True)} is no longer scared by nightmares.")
+        _log.info(f"{self.get_name(True)} is no longer scared by nightmares.")
 
     def enable_hell(self):
         attr_new = odict([(E_Attributes.AT_LEVEL, 68),
                           (E_Attributes.AT_EXPERIENCE, 250161148),
                           (E_Attributes.AT_STASHED_GOLD, 1750000)])
         self._enable_higher_difficulty(attr_new, E_Progression.EP_HELL)
-        print(f"{self.get_name(True)} is prepared to go to hell!")
+        _log.info(f"{self.get_name(True)} is prepared to go to hell!")
 
     def enable_nirvana(self):
         attr_new = odict([(E_Attributes.AT_LEVEL, 86),
                           (E_Attributes.AT_EXPERIENCE, 1196977515),
                           (E_Attributes.AT_STASHED_GOLD, 2200000)])
         self._enable_higher_difficulty(attr_new, E_Progression.EP_MASTER)
-        print(f"{self.get_name(True)} has done {'her' if self.get_class_enum().is_female() else 'his'} bit for king and country.")
+        _log.info(f"{self.get_name(True)} has done {'her' if self.get_class_enum().is_female() else 'his'} bit for king and country.")
 
     def get_class(self, as_str: bool = False) -> Union[bytes, str]:
         """:returns this character's class as a byte or string."""
@@ -2869,15 +3165,17 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
             _log.warning("No attributes have been found.")
             return odict()
         res = odict()  # type: OrderedDict[E_Attributes, int]
+        # [Note: The bitmap is built once, for the attributes section only. Not for the entire file per value.]
+        index_end = self.data.find(b'if', index_start)
+        bm = bytes2bitmap(self.data[index_start:(index_end if index_end >= 0 else len(self.data))])
         c = 0
-        index_current = index_start * 8
+        index_current = 0
         while c < 16:
             c = c + 1
-            key = get_bitrange_value_from_bytes(self.data, index_current, index_current + 9)
+            key = get_range_from_bitmap(bm, index_current, index_current + 9)
             if 0 <= key < 16:
                 attr = E_Attributes(key)
-                res[attr] = get_bitrange_value_from_bytes(self.data,
-                                                          index_current + 9, index_current + 9 + attr.get_attr_sz_bits())
+                res[attr] = get_range_from_bitmap(bm, index_current + 9, index_current + 9 + attr.get_attr_sz_bits())
                 index_current = index_current + 9 + attr.get_attr_sz_bits()
             else:
                 if key != 511:
@@ -2929,10 +3227,20 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         return pfname + '.humanity'
 
     def _update_godmode_backup(self) -> int:
+        backup = self.get_godmode_backup()
+        if backup is None:
+            return 1
+        with open(expanduser(self.pfname_humanity), 'wb') as OUT:
+            OUT.write(backup)
+            _log.info(f"Wrote humanity backup '{self.pfname_humanity}' for {self.get_name(True)}.")
+        return 0
+
+    def get_godmode_backup(self) -> Optional[bytes]:
+        """:returns the content of the .humanity backup for the current state. None, if god mode is active already."""
         skills = self.get_skills()
         if self.is_demi_god:
             _log.warning("God mode seems to be active already. Cannot backup the gods!")
-            return 1
+            return None
         attr = self.get_attributes()
         keys = list(d_god_attr.keys())
         # Backup data structure following keys in d_god_attr.
@@ -2943,11 +3251,7 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         # [Note: Since I am making up my own section of save game code I take the luxury of 16 bits per attr und 8 bit per skill.]
         for val in [int.to_bytes(x,3,'little') for x in bu_attr]:
             a += val
-        backup = a + bytes(skills)
-        with open(expanduser(self.pfname_humanity), 'wb') as OUT:
-            OUT.write(backup)
-            print(f"Wrote humanity backup '{self.pfname_humanity}' for {self.get_name(True)}.")
-        return 0
+        return a + bytes(skills)
 
     def _restore_godmode_backup(self) -> int:
         if not os.path.isfile(self.pfname_humanity):
@@ -2980,15 +3284,20 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         self.set_skills(skills_human)
         return 0
 
-    def enable_godmode(self):
+    def enable_godmode(self, *, do_backup: bool = True) -> Optional[bytes]:
+        """:param do_backup: Write the .humanity backup, which disable_godmode() will restore.
+        :returns the content of the .humanity backup. None, if god mode had been active already."""
         if self.is_demi_god:
-            return
+            return None
         attrs = self.get_attributes()
         for key in d_god_attr:
             attrs[key] = d_god_attr[key]
-        self._update_godmode_backup()
+        backup = self.get_godmode_backup()
+        if do_backup:
+            self._update_godmode_backup()
         self.set_attributes(attrs)
         self.set_skills(d_god_skills)
+        return backup
 
     def disable_godmode(self) -> int:
         if not self.is_demi_god:
@@ -3015,24 +3324,24 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         else:
             val &= 251
         self.data = self.data[0:36] + val.to_bytes(1, 'little') + self.data[37:]
-        print(f"Set {self.get_name(True)} to {'hard' if to_hardcore else 'soft'}core.")
+        _log.info(f"Set {self.get_name(True)} to {'hard' if to_hardcore else 'soft'}core.")
 
     def drop_item(self, item: Item) -> int:
-        """Removes target item from this data object. Does no deeper checks and does no updates of stuff like the checksum."""
+        """Removes target item from this data object, correcting the item count of its block in the same go.
+        Does no deeper checks and does no updates of stuff like the checksum."""
         index_start = item.index_start
         index_end = item.index_end
         if index_start >= index_end:
             _log.warning(f"Will refrain from dropping weird item '{item}'.")
-        else:
-            if item.item_parent != E_ItemParent.IP_ITEM:
-                if item.item_block == E_ItemBlock.IB_PLAYER:
-                    self.set_item_count(E_ItemBlock.IB_PLAYER_HD, self.get_item_count_player(True) - 1)
-                elif item.item_block == E_ItemBlock.IB_MERCENARY:
-                    self.set_item_count(E_ItemBlock.IB_MERCENARY_HD, self.get_item_count_mercenary(True) - 1)
-                else:
-                    _log.warning(f"Unsupported drop target block: {item.item_block.name}. Doing nothing.")
-                    return 1
-            self.data = self.data[0:index_start] + self.data[index_end:]
+            return 1
+        layout = self.block_layout
+        delta_count = 0
+        if item.item_parent != E_ItemParent.IP_ITEM:
+            if not layout.has_count(item.item_block):
+                _log.warning(f"Unsupported drop target block: {item.item_block.name}. Doing nothing.")
+                return 1
+            delta_count = -1
+        self.data = layout.splice(item.item_block, index_start, index_end, b'', delta_count)
         return 0
 
     def drop_items(self, items: List[Item]):
@@ -3089,18 +3398,26 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
     def add_items_to_player(self, items: bytes):
         """Warning: Be sure to add multiple items in a sensible order!
         :param items: Byte string of JM...-items."""
+        self.add_items_to_block(E_ItemBlock.IB_PLAYER, items)
+
+    def add_items_to_block(self, block: E_ItemBlock, items: bytes) -> int:
+        """Prepends the given items to the given item block, correcting the block's item count in the same go.
+        Warning: Be sure to add multiple items in a sensible order!
+        :param block: Target item block. E.g., E_ItemBlock.IB_MERCENARY.
+        :param items: Byte string of JM...-items.
+        :returns 0 in case of success. Else 1, e.g., if no mercenary has been hired."""
         # [Note: For backwards-compatibility. Delete all bytes prior to the first b'JM'.]
         items = re.sub(b'^.*?JM', b'JM', items)
         count = self.count_main_items(items)
-        block_index = Item(self.data).get_block_index()
-        try:
-            index_start = block_index[E_ItemBlock.IB_PLAYER][0]
-        except KeyError:
-            # [Note: This can happen in the admittedly pathological case of the player not having any items at all.]
-            index_start = block_index[E_ItemBlock.IB_PLAYER_HD][1]
-        self.data = self.data[0:index_start] + items + self.data[index_start:]
-        self.set_item_count(E_ItemBlock.IB_PLAYER_HD, self.get_item_count_player(True) + count)
+        layout = self.block_layout
+        if not layout.has_count(block):
+            _log.warning(f"Unable to add items to block '{block.name}' that has no item count in '{self.pfname}'.")
+            return 1
+        # [Note: The player block may be empty in the admittedly pathological case of the player not having any items at all.]
+        index_start = layout.index[layout.get_block_for_header(block)][0]
+        self.data = layout.splice(block, index_start, index_start, items, count)
         # print(f"Attempting to add {count} new items to the player's inventory.")
+        return 0
 
     def find_space_for_item(self, item: Item, storage: E_ItemStorage, smap: Optional[str] = None) -> Optional[Tuple[int,int]]:
         """:returns the coordinates of the top left corner for the item where it would fit."""
@@ -3331,7 +3648,7 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
             return  # << Nothing to do.
         item.is_ethereal = enable
         self.data = self.data[:item.index_start] + item.data_item + self.data[item.index_end:]
-        print(f"Attempting to set item '{item.type_name}' to {'' if enable else 'not '}ethereal.")
+        _log.info(f"Attempting to set item '{item.type_name}' to {'' if enable else 'not '}ethereal.")
 
     def jewelize(self, item: Item, *, do_replace=True, tpl: E_ItemTpl = E_ItemTpl.IT_JEWEL) -> Optional[Item]:
         """Will verify if the given item has intrinsic magic power. If so, clone that power into a jewel.
@@ -3437,6 +3754,7 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         # Ensure that a good normal item will be a good exceptional item, will be a good elite item.
         p = 0.5
         ac = item.defense
+        d_armor_weapons = get_armor_weapons()
         if ac and ac > 0 and type_code_old in d_armor_weapons:
             dur, ac_min, ac_max = d_armor_weapons[type_code_old]
             if ac_max > ac_min:
@@ -3461,11 +3779,16 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         unix_time_s = int(time.time()) if unix_time_s is None else int(unix_time_s)
         return time.strftime(frmt, time.localtime(unix_time_s))
 
-    def save2disk(self, pfname: str = None, prefix_timestamp: bool = False):
+    def save2disk(self, pfname: str = None, prefix_timestamp: bool = False, *, do_fsync: bool = True, do_fsync_dir: bool = False) -> str:
         """:param pfname: Target pfname. If not given, will use the original pfname, overwriting the original file.
         :param prefix_timestamp: If False, no effect. If True, the fname wil lbe prefixed with a timestamp
           and suffixed with '.backup'.
-        Write this data structure's current state to disk. As is. E.g., no checksums are updated automatically."""
+        :param do_fsync: Flush the written file to the storage device before it replaces the target.
+        :param do_fsync_dir: Also flush the directory, making the rename itself durable.
+        Write this data structure's current state to disk. As is. E.g., no checksums are updated automatically.
+        The target is replaced atomically: Either it holds the old state, or the new one. Never a truncated mix.
+        If the target is a symbolic link, the file it points to is replaced. The link stays.
+        :returns the pfname that has been written."""
         if pfname is None:
             pfname = self.pfname
         if prefix_timestamp:
@@ -3474,9 +3797,125 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
             fname = parts[1]
             fname = re.sub(regexp_invalid_pfname_chars, '_', fname)
             pfname = os.path.join(pname, Data.get_time() + '_' + fname + '.backup')
-        with open(expanduser(pfname), 'wb') as OUT:
-            OUT.write(self.data)
-        print(f"Wrote {self.get_class(True)} {self.get_name(True)} to disk: {pfname}")
+        pfname_real = os.path.realpath(expanduser(pfname))
+        pfname_tmp = self.write_tmp(pfname_real, do_fsync=do_fsync)
+        os.replace(pfname_tmp, pfname_real)
+        if do_fsync_dir:
+            Data.fsync_dir(os.path.dirname(pfname_real))
+        return pfname
+
+    def write_tmp(self, pfname: str, *, do_fsync: bool = True) -> str:
+        """Writes self.data into a hidden temporary file next to pfname. Copies the permissions of pfname, if it exists,
+        and its ownership, where permitted.
+        :param pfname: Real path of the target, see os.path.realpath(..). Else, renaming over a symbolic link would
+          replace the link rather than the file it points to.
+        :returns the pfname of the temporary file. It is the caller's job to rename it into place.
+        :raises OSError in case of failure. No temporary file is left behind then."""
+        if os.path.realpath(pfname) == os.path.realpath(expanduser(self.pfname)):
+            self.materialize()
+        pname, fname = os.path.split(pfname)
+        pfname_tmp = os.path.join(pname, f".{fname}.{os.getpid()}.tmp")
+        try:
+            with open(pfname_tmp, 'wb') as OUT:
+                OUT.write(self.data)
+                OUT.flush()
+                if do_fsync:
+                    os.fsync(OUT.fileno())
+            if os.path.isfile(pfname):
+                Data.copy_mode_owner(pfname, pfname_tmp)
+        except OSError:
+            if os.path.exists(pfname_tmp):
+                os.remove(pfname_tmp)
+            raise
+        return pfname_tmp
+
+    _syncfs = False  # type: Any
+    """syncfs(2) of the C library. None, where it is not available. False, if not looked up yet."""
+
+    @staticmethod
+    def sync_files(pfnames: List[str]):
+        """Flushes several written files to the storage device. Where syncfs(2) is available (Linux), files sharing a
+        file system are flushed by one syncfs(..). Else, and for files alone on their file system, by one fsync each.
+        :raises OSError in case of failure."""
+        if Data._syncfs is False:
+            try:
+                import ctypes  # << Deferred. Only bulk commits need it.
+                import ctypes.util
+                Data._syncfs = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True).syncfs
+            except (OSError, AttributeError):
+                Data._syncfs = None
+        by_device = dict()  # type: Dict[int, List[str]]
+        for pfname in pfnames:
+            by_device.setdefault(os.stat(pfname).st_dev, list()).append(pfname)
+        for pfnames_device in by_device.values():
+            if (Data._syncfs is not None) and (len(pfnames_device) > 1):
+                fd = os.open(pfnames_device[0], os.O_RDONLY)
+                try:
+                    if Data._syncfs(fd) != 0:
+                        import ctypes
+                        raise OSError(ctypes.get_errno(), f"syncfs failed for '{pfnames_device[0]}'.")
+                finally:
+                    os.close(fd)
+                continue
+            for pfname in pfnames_device:
+                fd = os.open(pfname, os.O_RDWR | getattr(os, 'O_BINARY', 0))  # << Windows flushes writable handles only.
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    @staticmethod
+    def copy_mode_owner(pfname_src: str, pfname_dst: str):
+        """Copies the permissions of pfname_src to pfname_dst. Also its owner and group, unless that is not permitted
+        (e.g., for other users' files without privileges) or not supported (e.g., Windows).
+        :raises OSError if the permissions cannot be copied."""
+        st = os.stat(pfname_src)
+        os.chmod(pfname_dst, stat.S_IMODE(st.st_mode))
+        if hasattr(os, 'chown'):
+            try:
+                os.chown(pfname_dst, st.st_uid, st.st_gid)
+            except OSError:
+                pass
+
+    @staticmethod
+    def fsync_dir(pname: str):
+        """Flushes a directory, making renames within it durable. Silently skipped where directories cannot be
+        opened (e.g., Windows)."""
+        try:
+            fd = os.open(pname if pname else '.', os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def flush_all(data_all: List[Data], *, do_fsync_dir: bool = True) -> List[str]:
+        """Commits many Data objects to their own pfnames behind one durability barrier. First all temporary files are
+        written, unflushed. Only if that succeeded for every file, they are flushed together by sync_files(..) and then
+        renamed into place. Finally, each involved directory is flushed once. So, e.g., a Horadric exchange never
+        leaves one character updated and the other not for any reason but a crash in between two renames.
+        :returns the list of written pfnames.
+        :raises OSError in case of failure. No target file has been touched then."""
+        pfnames_tmp = list()  # type: List[Tuple[str, str]]
+        try:
+            for data in data_all:
+                pfname = os.path.realpath(expanduser(data.pfname))
+                pfnames_tmp.append((data.write_tmp(pfname, do_fsync=False), pfname))
+            Data.sync_files([pfname_tmp for pfname_tmp, _ in pfnames_tmp])
+        except OSError:
+            for pfname_tmp, _ in pfnames_tmp:
+                os.remove(pfname_tmp)
+            raise
+        for pfname_tmp, pfname in pfnames_tmp:
+            os.replace(pfname_tmp, pfname)
+        if do_fsync_dir:
+            for pname in sorted(set([os.path.dirname(pfname) for _, pfname in pfnames_tmp])):
+                Data.fsync_dir(pname)
+        return [data.pfname for data in data_all]
 
     def __str__(self) -> str:
         core = 'hardcore' if self.is_hardcore() else 'softcore'
@@ -3522,69 +3961,1426 @@ this page was an excellent source for that: https://github.com/WalterCouto/D2CE/
         return msg
 
 
+class BackupEntry:
+    """One line of a BackupStore manifest: Which character (of which file) had which state (blob) at which time."""
+    def __init__(self, timestamp: float, character: str, digest: str, size: int, level: int, class_name: str,
+                 origin: str = ''):
+        self.timestamp = timestamp  # type: float
+        self.character = character  # type: str
+        self.digest = digest  # type: str
+        """sha256 hex digest of the complete .d2s content. Names the blob."""
+        self.size = size  # type: int
+        self.level = level  # type: int
+        self.class_name = class_name  # type: str
+        self.origin = origin  # type: str
+        """Real path of the backed up file. Tells apart same-named characters of different directories. Empty for
+        entries of manifests predating it."""
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """:returns the identity of the backed up character: Its name and origin. Heads and delta chains are per key."""
+        return self.character, self.origin
+
+    def to_line(self) -> str:
+        return f"{self.timestamp:.6f}\t{self.character}\t{self.digest}\t{self.size}\t{self.level}\t{self.class_name}\t{self.origin}\n"
+
+    @staticmethod
+    def from_line(line: str) -> Optional[BackupEntry]:
+        """:returns the entry for a manifest line. None for comments, empty or broken lines."""
+        parts = line.rstrip('\n').split('\t')
+        if len(parts) < 6 or parts[0].startswith('#'):
+            return None
+        try:
+            return BackupEntry(float(parts[0]), parts[1], parts[2], int(parts[3]), int(parts[4]), parts[5],
+                               parts[6] if len(parts) > 6 else '')
+        except ValueError:
+            return None
+
+    def __str__(self) -> str:
+        return f"{Data.get_time(unix_time_s=self.timestamp)} {self.character} ({self.class_name}, level {self.level}): {self.digest[:12]}"
+
+
+class BackupStore:
+    """Content-addressed, deduplicating backup store. Every distinct save game state is stored once, as a blob named
+    by its sha256 hash. The append-only manifest maps (character, origin, timestamp) to blobs. So backing up an
+    unchanged character costs a hash and a manifest line. The origin is the real path of the backed up file, so
+    same-named characters of different directories never share heads or delta chains.
+    In delta mode (delta_interval > 0) only every delta_interval-th backup of a character is stored in full. The ones
+    in between are stored as binary diffs against the character's previous state. Restoring replays the chain from
+    the last full snapshot, which bounds every chain to delta_interval links.
+    Layout: pname/manifest.tsv, pname/blobs/<2 hex chars>/<64 hex chars>[.delta], and pname/.lock (see lock())."""
+    fname_manifest = 'manifest.tsv'
+    fname_lock = '.lock'
+    n_bytes_match_min = 8
+    """Shortest run of bytes that a delta will copy from its base rather than insert literally."""
+
+    def __init__(self, pname: str, *, delta_interval: int = 0):
+        """:param pname: Directory of the store. Created on first backup.
+        :param delta_interval: 0 stores every state in full. N > 0 stores a full snapshot every N backups per character."""
+        self.pname = os.path.expanduser(pname)
+        self.pfname_manifest = os.path.join(self.pname, self.fname_manifest)
+        self.delta_interval = delta_interval  # type: int
+        self._lock = threading.Lock()
+        self._heads = None  # type: Optional[Dict[Tuple[str, str], str]]
+        """Latest digest per BackupEntry.key. Read from the manifest on first need."""
+        self._size_heads = 0
+        """Size of the manifest that self._heads reflects. Another process may have appended since."""
+        self._cache_states = odict()  # type: OrderedDict[str, bytes]
+        """Small LRU of recently restored states. Makes replaying neighbouring versions cheap."""
+
+    def get_pfname_blob(self, digest: str, is_delta: bool = False) -> str:
+        return os.path.join(self.pname, 'blobs', digest[:2], digest + ('.delta' if is_delta else ''))
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.isfile(self.get_pfname_blob(digest)) or os.path.isfile(self.get_pfname_blob(digest, True))
+
+    def write_blob(self, digest: str, bts: bytes, is_delta: bool = False):
+        """Writes bts as blob. Atomically, so that a blob is either complete or absent."""
+        pfname = self.get_pfname_blob(digest, is_delta)
+        os.makedirs(os.path.dirname(pfname), exist_ok=True)
+        BackupStore.write_atomic(pfname, bts)
+
+    @staticmethod
+    def write_atomic(pfname: str, bts: bytes):
+        """Writes bts into a temporary sibling of pfname, then renames that over pfname. Symbolic links are resolved
+        first, and the permissions and ownership of an existing pfname are kept, see Data.copy_mode_owner(..)."""
+        pfname = os.path.realpath(expanduser(pfname))
+        pfname_tmp = f"{pfname}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(pfname_tmp, 'wb') as OUT:
+            OUT.write(bts)
+            OUT.flush()
+            os.fsync(OUT.fileno())
+        if os.path.isfile(pfname):
+            Data.copy_mode_owner(pfname, pfname_tmp)
+        os.replace(pfname_tmp, pfname)
+
+    def put(self, data: Data, timestamp: Optional[float] = None) -> BackupEntry:
+        """Backs up the current state of data.
+        :returns the manifest entry that has been appended."""
+        import hashlib  # << Deferred. Not worth its import time for commands that never back up into a store.
+        bts = bytes(data.data)
+        entry = BackupEntry(time.time() if timestamp is None else timestamp, data.get_name(True),
+                            hashlib.sha256(bts).hexdigest(), len(bts), data.level_by_header, data.get_class(True),
+                            os.path.realpath(expanduser(data.pfname)))
+        fd_lock = self.lock()
+        try:
+            heads = self.get_heads()
+            if not self.has_blob(entry.digest):
+                digest_base = heads.get(entry.key) if self.delta_interval > 0 else None
+                depth = (self.get_depth(digest_base) + 1) if digest_base else self.delta_interval
+                if depth < self.delta_interval:
+                    ops = BackupStore.diff(self.get_bytes(digest_base), bts)
+                    self.write_blob(entry.digest, marshal.dumps((digest_base, depth, ops)), True)
+                else:
+                    self.write_blob(entry.digest, bts)
+            self.append_entry(entry)
+            heads[entry.key] = entry.digest
+            self._size_heads = os.path.getsize(self.pfname_manifest)
+        finally:
+            self.unlock(fd_lock)
+        return entry
+
+    def lock(self) -> int:
+        """Excludes other threads and other processes (e.g., a --serve daemon and a --gc_backups call) from altering
+        the store: Takes the thread lock, then an exclusive flock(..) on pname/.lock. Where fcntl is not available
+        (Windows), only threads are excluded. Release by unlock(..).
+        :returns the descriptor of the lock file."""
+        self._lock.acquire()
+        try:
+            os.makedirs(self.pname, exist_ok=True)
+            fd = os.open(os.path.join(self.pname, self.fname_lock), os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            self._lock.release()
+            raise
+        try:
+            BackupStore.flock_exclusive(fd)
+        except OSError:
+            os.close(fd)
+            self._lock.release()
+            raise
+        return fd
+
+    @staticmethod
+    def flock_exclusive(fd: int):
+        """Blocks until this process holds an exclusive flock(..) on the open file fd. It is released by closing fd.
+        No-op where fcntl is not available (Windows).
+        :raises OSError on failure."""
+        try:
+            import fcntl  # << Deferred. Not available on Windows.
+        except ImportError:
+            return
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def unlock(self, fd: int):
+        """Releases what lock() has taken."""
+        os.close(fd)  # << Also releases the flock(..).
+        self._lock.release()
+
+    def get_heads(self) -> Dict[Tuple[str, str], str]:
+        """:returns the latest digest per BackupEntry.key. Streams the manifest once, then is kept up to date by put(..).
+        Streamed again, if the manifest has been altered by another process in between. Call with the lock held."""
+        size = os.path.getsize(self.pfname_manifest) if os.path.isfile(self.pfname_manifest) else 0
+        if (self._heads is None) or (size != self._size_heads):
+            self._heads = dict()
+            for entry in self.iter_entries():
+                self._heads[entry.key] = entry.digest
+            self._size_heads = size
+        return self._heads
+
+    def get_depth(self, digest: str) -> int:
+        """:returns the number of deltas between the given state and its full snapshot. 0 for full snapshots."""
+        if os.path.isfile(self.get_pfname_blob(digest)):
+            return 0
+        with open(self.get_pfname_blob(digest, True), 'rb') as IN:
+            return marshal.loads(IN.read())[1]
+
+    @staticmethod
+    def diff(base: bytes, target: bytes) -> List[Union[Tuple[int, int], bytes]]:
+        """Computes a binary diff, turning base into target. Greedy and linear: Every 8-byte window of base is indexed.
+        Matches are looked for at the continuation of the previous copy first, since most save game edits keep
+        the surrounding bytes in place.
+        :returns list of ops. Either (offset, length) for copying from base, or bytes for inserting literally."""
+        n = BackupStore.n_bytes_match_min
+        index = dict()  # type: Dict[bytes, int]
+        for j in range(len(base) - n, -1, -1):
+            index[base[j:(j + n)]] = j
+        ops = list()  # type: List[Union[Tuple[int, int], bytes]]
+        literal = bytearray()
+        i = 0
+        index_continue = 0
+        while i < len(target):
+            window = target[i:(i + n)]
+            if len(window) == n and base[index_continue:(index_continue + n)] == window:
+                j = index_continue
+            else:
+                j = index.get(window, -1) if len(window) == n else -1
+            if j < 0:
+                literal.append(target[i])
+                i += 1
+                continue
+            length = n
+            while (i + length) < len(target) and (j + length) < len(base) and target[i + length] == base[j + length]:
+                length += 1
+            if literal:
+                ops.append(bytes(literal))
+                literal = bytearray()
+            ops.append((j, length))
+            i += length
+            index_continue = j + length
+        if literal:
+            ops.append(bytes(literal))
+        return ops
+
+    @staticmethod
+    def patch(base: bytes, ops: List[Union[Tuple[int, int], bytes]]) -> bytes:
+        """Inverse of diff(..). Applies ops to base."""
+        parts = list()  # type: List[bytes]
+        for op in ops:
+            parts.append(op if isinstance(op, bytes) else base[op[0]:(op[0] + op[1])])
+        return b''.join(parts)
+
+    def gc(self, policy: RetentionPolicy, now: Optional[float] = None) -> Dict[str, int]:
+        """Drops the manifest entries that the policy does not keep, then deletes all blobs that are no longer
+        referenced, directly or as base of a kept delta. The newest entry of every character (per origin) is always kept.
+        Memory is bounded by the number of kept entries, not by the size of the store: The manifest is streamed
+        (assuming it is in order of time per character, as put(..) writes it) and the blobs are swept per directory.
+        :returns counts 'entries_kept', 'entries_dropped', 'blobs_deleted' and 'bytes_freed'."""
+        now = time.time() if now is None else now
+        stats = {'entries_kept': 0, 'entries_dropped': 0, 'blobs_deleted': 0, 'bytes_freed': 0}
+        digests_live = set()  # type: set
+        if not os.path.isfile(self.pfname_manifest):
+            return stats
+        fd_lock = self.lock()
+        try:
+            if not os.path.isfile(self.pfname_manifest):
+                return stats
+            pending = dict()  # type: Dict[Tuple[str, str], Tuple[BackupEntry, Optional[Tuple[int, int]]]]
+            """Per BackupEntry.key: Its latest entry so far, and that entry's bucket. Kept only if no newer entry shares the bucket."""
+            pfname_tmp = f"{self.pfname_manifest}.{os.getpid()}.tmp"
+            with open(pfname_tmp, 'w') as OUT:
+                def keep(e: BackupEntry):
+                    OUT.write(e.to_line())
+                    digests_live.add(e.digest)
+                    stats['entries_kept'] += 1
+
+                for entry in self.iter_entries():
+                    bucket = policy.get_bucket(entry.timestamp, now)
+                    if entry.key in pending:
+                        entry_prior, bucket_prior = pending[entry.key]
+                        if (bucket_prior is not None) and ((bucket_prior[1] == -1) or (bucket_prior != bucket)):
+                            keep(entry_prior)
+                        else:
+                            stats['entries_dropped'] += 1
+                    pending[entry.key] = (entry, bucket)
+                for entry, _ in pending.values():
+                    keep(entry)
+                OUT.flush()
+                os.fsync(OUT.fileno())
+            os.replace(pfname_tmp, self.pfname_manifest)
+            self._heads = None
+            # > Delta bases of live states are live too. ------------------
+            for digest in list(digests_live):
+                while not os.path.isfile(self.get_pfname_blob(digest)):
+                    pfname_delta = self.get_pfname_blob(digest, True)
+                    if not os.path.isfile(pfname_delta):
+                        _log.warning(f"Backup store '{self.pname}' lacks the blob {digest}.")
+                        break
+                    with open(pfname_delta, 'rb') as IN:
+                        digest = marshal.loads(IN.read())[0]
+                    if digest in digests_live:
+                        break
+                    digests_live.add(digest)
+            # < ----------------------------------------------------------
+            pname_blobs = os.path.join(self.pname, 'blobs')
+            if os.path.isdir(pname_blobs):
+                for dir_prefix in os.scandir(pname_blobs):
+                    if not dir_prefix.is_dir():
+                        continue
+                    for file_blob in os.scandir(dir_prefix.path):
+                        if file_blob.name.endswith('.tmp') or file_blob.name.split('.')[0] in digests_live:
+                            continue
+                        stats['bytes_freed'] += file_blob.stat().st_size
+                        stats['blobs_deleted'] += 1
+                        os.remove(file_blob.path)
+            self._cache_states.clear()
+        finally:
+            self.unlock(fd_lock)
+        return stats
+
+    def append_entry(self, entry: BackupEntry):
+        """Appends entry to the manifest. Call with the lock held, see lock()."""
+        os.makedirs(self.pname, exist_ok=True)
+        with open(self.pfname_manifest, 'a') as OUT:
+            OUT.write(entry.to_line())
+            OUT.flush()
+            os.fsync(OUT.fileno())
+
+    def iter_entries(self, character: Optional[str] = None) -> Iterator[BackupEntry]:
+        """Streams the manifest, in order of appending. Never holds more than one line in memory.
+        :param character: If given, only entries of this character are yielded."""
+        if not os.path.isfile(self.pfname_manifest):
+            return
+        with open(self.pfname_manifest, 'r') as IN:
+            for line in IN:
+                entry = BackupEntry.from_line(line)
+                if entry is not None and (character is None or entry.character == character):
+                    yield entry
+
+    def get_bytes(self, digest: str) -> bytes:
+        """:returns the save game content stored under the given digest. Replays delta chains as needed.
+        :raises FileNotFoundError if there is no such blob, or a chain is broken."""
+        chain = list()  # type: List[List[Union[Tuple[int, int], bytes]]]
+        current = digest
+        while current not in self._cache_states:
+            pfname = self.get_pfname_blob(current)
+            if os.path.isfile(pfname):
+                with open(pfname, 'rb') as IN:
+                    self.cache_state(current, IN.read())
+                break
+            with open(self.get_pfname_blob(current, True), 'rb') as IN:
+                digest_base, _, ops = marshal.loads(IN.read())
+            chain.append((current, ops))
+            current = digest_base
+        bts = self._cache_states[current]
+        for current, ops in reversed(chain):
+            bts = BackupStore.patch(bts, ops)
+            self.cache_state(current, bts)
+        return bts
+
+    def cache_state(self, digest: str, bts: bytes, n_max: int = 8):
+        self._cache_states[digest] = bts
+        self._cache_states.move_to_end(digest)
+        while len(self._cache_states) > n_max:
+            self._cache_states.popitem(last=False)
+
+    def restore(self, entry: BackupEntry, pfname: str) -> str:
+        """Writes the state of the given entry to pfname. Atomically, like Data.save2disk(..).
+        :returns pfname."""
+        pfname = os.path.expanduser(pfname)
+        BackupStore.write_atomic(pfname, self.get_bytes(entry.digest))
+        return pfname
+
+
+class ArchiveEntry:
+    """One index record of a BackupArchive."""
+    def __init__(self, timestamp: float, offset: int, length: int, checksum: int, level: int, class_id: int):
+        self.timestamp = timestamp  # type: float
+        self.offset = offset  # type: int
+        """Position of the compressed payload within the archive file."""
+        self.length = length  # type: int
+        """Length of the compressed payload."""
+        self.checksum = checksum  # type: int
+        """crc32 of the uncompressed .d2s content."""
+        self.level = level  # type: int
+        self.class_id = class_id  # type: int
+
+    @property
+    def class_name(self) -> str:
+        return str(E_Characters(self.class_id))
+
+    def __str__(self) -> str:
+        return f"{Data.get_time(unix_time_s=self.timestamp)} ({self.class_name}, level {self.level}): {self.length} bytes"
+
+
+class BackupArchive:
+    """Directory of append-only backup archives, one file per character, replacing heaps of loose .backup files.
+    Archives are keyed by character name and origin, see get_key(..), so that same-named characters of different
+    directories never share one. Each archive's origin is noted in a sibling text file, see get_origin(..).
+    Archive layout: file magic, then records of (record header, zlib-compressed .d2s), then an index of all
+    records, then a fixed size footer pointing at the index. Listing the history takes two seeks. Extracting any
+    version takes one more.
+    Appending overwrites the old index and footer by the new record, a new index and a new footer. Should that be
+    interrupted, the record headers allow for rebuilding the index by a scan. See read_index(..)."""
+    suffix = '.d2a'
+    suffix_origin = '.origin'
+    separator_key = '~'
+    """Between character name and origin hash within keys. Never part of valid character names."""
+    magic_file = b'D2ARCHV1'
+    magic_record = b'D2AR'
+    magic_footer = b'D2AI'
+    struct_record = struct.Struct('<4sdIIBB')
+    """magic, timestamp, length, checksum, level, class."""
+    struct_index = struct.Struct('<dQIIBB')
+    """timestamp, offset, length, checksum, level, class."""
+    struct_footer = struct.Struct('<QI4s')
+    """index offset, number of entries, magic."""
+
+    def __init__(self, pname: str, *, level_compression: int = 9):
+        """:param pname: Directory of the archives. Created on first backup.
+        :param level_compression: zlib compression level for new entries."""
+        self.pname = os.path.expanduser(pname)
+        self.level_compression = level_compression  # type: int
+        self._lock = threading.Lock()
+
+    def get_pfname_archive(self, key: str) -> str:
+        """:param key: See get_key(..). Plain character names address archives predating keys."""
+        return os.path.join(self.pname, key + self.suffix)
+
+    @staticmethod
+    def get_key(data: Data) -> str:
+        """:returns the archive key of data: Its character name, and a hash of the real path of its file."""
+        origin = os.path.realpath(expanduser(data.pfname))
+        return f"{data.get_name(True)}{BackupArchive.separator_key}{zlib.crc32(origin.encode('utf-8')):08x}"
+
+    @staticmethod
+    def get_character(key: str) -> str:
+        """:returns the character name within the given key."""
+        return key.split(BackupArchive.separator_key, 1)[0]
+
+    def get_origin(self, key: str) -> Optional[str]:
+        """:returns the real path of the file backed up under key. None, if unknown."""
+        try:
+            with open(os.path.join(self.pname, key + self.suffix_origin), 'r', encoding='utf-8') as IN:
+                return IN.read().strip()
+        except OSError:
+            return None
+
+    def get_characters(self) -> List[str]:
+        """:returns the keys of all archives, sorted. See get_key(..)."""
+        if not os.path.isdir(self.pname):
+            return list()
+        return sorted(fname[:-len(self.suffix)] for fname in os.listdir(self.pname) if fname.endswith(self.suffix))
+
+    def put(self, data: Data, timestamp: Optional[float] = None) -> ArchiveEntry:
+        """Appends the current state of data to the archive of its character and origin, see get_key(..).
+        Holds an exclusive flock(..) on the archive meanwhile, so that other processes (e.g., the GUI and a command
+        line call) never interleave their appends.
+        :returns the new index entry."""
+        bts = bytes(data.data)
+        payload = zlib.compress(bts, self.level_compression)
+        key = self.get_key(data)
+        pfname = self.get_pfname_archive(key)
+        with self._lock:
+            os.makedirs(self.pname, exist_ok=True)
+            # [Note: Never truncating on open. Another process may just have created the archive.]
+            with os.fdopen(os.open(pfname, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666), 'r+b') as IO:
+                BackupStore.flock_exclusive(IO.fileno())
+                entries, offset_index = self.read_index_from(IO)
+                if offset_index == 0:
+                    with open(os.path.join(self.pname, key + self.suffix_origin), 'w', encoding='utf-8') as OUT:
+                        OUT.write(os.path.realpath(expanduser(data.pfname)) + "\n")
+                    IO.seek(0)
+                    IO.write(self.magic_file)
+                    offset_index = len(self.magic_file)
+                entry = ArchiveEntry(time.time() if timestamp is None else timestamp,
+                                     offset_index + self.struct_record.size, len(payload), zlib.crc32(bts),
+                                     data.level_by_header, int.from_bytes(data.get_class(), 'little'))
+                entries.append(entry)
+                IO.seek(offset_index)
+                IO.write(self.struct_record.pack(self.magic_record, entry.timestamp, entry.length, entry.checksum, entry.level, entry.class_id))
+                IO.write(payload)
+                offset_index = IO.tell()
+                IO.write(b''.join(self.struct_index.pack(e.timestamp, e.offset, e.length, e.checksum, e.level, e.class_id) for e in entries))
+                IO.write(self.struct_footer.pack(offset_index, len(entries), self.magic_footer))
+                IO.truncate()
+                IO.flush()
+                os.fsync(IO.fileno())
+        return entry
+
+    def read_index(self, key: str) -> List[ArchiveEntry]:
+        """:returns the history of the given character (key, see get_key(..)), in order of appending. Empty, if there
+        is no archive."""
+        pfname = self.get_pfname_archive(key)
+        if not os.path.isfile(pfname):
+            return list()
+        with open(pfname, 'rb') as IN:
+            return self.read_index_from(IN)[0]
+
+    def read_index_from(self, IN) -> Tuple[List[ArchiveEntry], int]:
+        """Reads the index via the footer. Falls back to scanning the records if the footer is damaged.
+        :returns the entries and the offset where the next record would go. That offset is 0 for empty files."""
+        size = IN.seek(0, os.SEEK_END)
+        if size < len(self.magic_file):
+            return list(), 0
+        if size >= len(self.magic_file) + self.struct_footer.size:
+            IN.seek(size - self.struct_footer.size)
+            offset_index, n, magic = self.struct_footer.unpack(IN.read(self.struct_footer.size))
+            if magic == self.magic_footer and offset_index + n * self.struct_index.size + self.struct_footer.size == size:
+                IN.seek(offset_index)
+                bts = IN.read(n * self.struct_index.size)
+                return [ArchiveEntry(*t) for t in self.struct_index.iter_unpack(bts)], offset_index
+        _log.warning(f"Index of backup archive '{IN.name}' is damaged. Rebuilding it from the record headers.")
+        return self.scan_records(IN, size)
+
+    def scan_records(self, IN, size: int) -> Tuple[List[ArchiveEntry], int]:
+        """Walks all complete records from the start of the archive.
+        :returns the entries and the end of the last complete record."""
+        entries = list()  # type: List[ArchiveEntry]
+        offset = len(self.magic_file)
+        while offset + self.struct_record.size <= size:
+            IN.seek(offset)
+            magic, timestamp, length, checksum, level, class_id = self.struct_record.unpack(IN.read(self.struct_record.size))
+            if magic != self.magic_record or offset + self.struct_record.size + length > size:
+                break
+            entries.append(ArchiveEntry(timestamp, offset + self.struct_record.size, length, checksum, level, class_id))
+            offset += self.struct_record.size + length
+        return entries, offset
+
+    def get_bytes(self, key: str, entry: ArchiveEntry) -> bytes:
+        """:param key: See get_key(..).
+        :returns the .d2s content of the given entry.
+        :raises ValueError if the content does not match its checksum."""
+        with open(self.get_pfname_archive(key), 'rb') as IN:
+            IN.seek(entry.offset)
+            bts = zlib.decompress(IN.read(entry.length))
+        if zlib.crc32(bts) != entry.checksum:
+            raise ValueError(f"Backup of {self.get_character(key)} from {Data.get_time(unix_time_s=entry.timestamp)} fails its checksum.")
+        return bts
+
+    def restore(self, key: str, entry: ArchiveEntry, pfname: str) -> str:
+        """Writes the state of the given entry of the archive key to pfname. Atomically.
+        :returns pfname."""
+        pfname = os.path.expanduser(pfname)
+        BackupStore.write_atomic(pfname, self.get_bytes(key, entry))
+        return pfname
+
+
+class RetentionPolicy:
+    """Decides which backups to keep, by their age. A list of rules (max_age, width), checked in order of max_age:
+    Of all backups younger than max_age, keep one per time bucket of the given width. Width 0 keeps all.
+    Backups older than the last rule's max_age are dropped.
+    Spec syntax: comma separated 'max_age:width' with durations like '90m', '12h', '7d', '4w', and 'all' for width 0.
+    E.g. '1d:all,7d:1h,30d:1d' keeps all from the last day, hourly for a week, daily for a month."""
+    spec_default = '1d:all,7d:1h,30d:1d'
+    seconds_by_unit = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+    def __init__(self, rules: List[Tuple[float, float]]):
+        self.rules = sorted(rules)  # type: List[Tuple[float, float]]
+
+    @staticmethod
+    def parse(spec: str) -> RetentionPolicy:
+        """:raises ValueError on syntax errors."""
+        rules = list()  # type: List[Tuple[float, float]]
+        for part in spec.split(','):
+            if ':' not in part:
+                raise ValueError(f"Retention rule '{part}' lacks the ':' between maximum age and bucket width.")
+            age, width = part.strip().split(':', 1)
+            rules.append((RetentionPolicy.parse_duration(age), 0 if width.strip() == 'all' else RetentionPolicy.parse_duration(width)))
+        return RetentionPolicy(rules)
+
+    @staticmethod
+    def parse_duration(duration: str) -> float:
+        duration = duration.strip()
+        m = re.fullmatch('([0-9.]+)([smhdw]?)', duration)
+        if not m:
+            raise ValueError(f"Invalid duration '{duration}'. Expected e.g. '90m', '12h', '7d'.")
+        return float(m.group(1)) * RetentionPolicy.seconds_by_unit[m.group(2) or 's']
+
+    def get_bucket(self, timestamp: float, now: float) -> Optional[Tuple[int, int]]:
+        """:returns (rule index, bucket index) of a backup from timestamp. Buckets are aligned to the epoch, so they
+          are stable across runs. Bucket index -1 means 'keep'. None means 'expired'."""
+        age = now - timestamp
+        for j, (age_max, width) in enumerate(self.rules):
+            if age <= age_max:
+                return (j, -1) if width <= 0 else (j, int(timestamp // width))
+        return None
+
+
+class BackupTicket:
+    """Handle to a job of a BackupWriter."""
+    def __init__(self, description: str = ''):
+        self.description = description  # type: str
+        self.result = None  # type: Optional[str]
+        """Location of the backup, once done."""
+        self.error = None  # type: Optional[BaseException]
+        self._done = threading.Event()
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> str:
+        """:returns the location of the backup.
+        :raises the job's exception if the backup has failed. TimeoutError, if it has not finished in time."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Backup '{self.description}' has not finished within {timeout} s.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class BackupWriter:
+    """Writes backups on a background thread, in order of submission. The queue is bounded: submit(..) blocks while
+    n_queue_max jobs are pending. A job returns the location of its backup, and must not return before that backup
+    is durable (as Data.save2disk(..), BackupStore.put(..) and BackupArchive.put(..) are). Only then its ticket is done
+    and the callback is called. [Note: On the writer thread. GUIs should poll BackupTicket.is_done() instead.]"""
+    def __init__(self, n_queue_max: int = 16):
+        self._queue = queue.Queue(maxsize=n_queue_max)  # type: queue.Queue
+        self._thread = None  # type: Optional[threading.Thread]
+        self._lock = threading.Lock()
+
+    def submit(self, job: Callable[[], str], description: str = '',
+               callback: Optional[Callable[[BackupTicket], None]] = None) -> BackupTicket:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='BackupWriter', daemon=True)
+                self._thread.start()
+        ticket = BackupTicket(description)
+        self._queue.put((job, ticket, callback))
+        return ticket
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            job, ticket, callback = task
+            try:
+                ticket.result = job()
+            except Exception as e:
+                _log.error(f"Backup '{ticket.description}' has failed: {e}")
+                ticket.error = e
+            # [Note: Dropping the job ahead of signalling. Else, it (and e.g. a mapped Data within its closure) would be
+            #  kept alive while this thread waits for the next task.]
+            task = job = None
+            ticket._done.set()
+            if callback is not None:
+                try:
+                    callback(ticket)
+                except Exception as e:
+                    _log.error(f"Callback of backup '{ticket.description}' has failed: {e}")
+            ticket = callback = None
+
+    def close(self, timeout: Optional[float] = None):
+        """Finishes all pending jobs, then ends the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class E_SaveEvent(Enum):
+    SE_ADDED = 0
+    SE_MODIFIED = 1
+    SE_REMOVED = 2
+
+
+class SaveDirWatcher:
+    """Watches a directory of .d2s files. Keeps an index of parsed Data objects, re-reading only files that have
+    changed (by mtime and size), and publishes one event per change to all subscribers.
+    Uses Linux inotify via ctypes where available. Elsewhere, or if that fails, polls the directory every interval
+    seconds. Either way, changes are confirmed by stat, so a game writing a file in several steps causes one event.
+    [Note: Subscribers are called on the watcher thread. GUIs have to hand the events over to their main loop.]"""
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    struct_inotify_event = struct.Struct('iIII')
+    """wd, mask, cookie, len. Followed by len bytes of name."""
+
+    def __init__(self, pname: str, *, interval: float = 1.0, use_inotify: bool = True):
+        self.pname = os.path.expanduser(pname)
+        self.interval = interval  # type: float
+        self.use_inotify = use_inotify  # type: bool
+        self.index = dict()  # type: Dict[str, Data]
+        """pfname -> parsed Data, of all .d2s files in pname. Data are read into memory, never mapped: The game
+        truncates and rewrites its saves, which would invalidate a mapping."""
+        self._stat_keys = dict()  # type: Dict[str, Tuple[int, int]]
+        self._subscribers = list()  # type: List[Callable[[E_SaveEvent, str, Optional[Data]], None]]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def subscribe(self, callback: Callable[[E_SaveEvent, str, Optional[Data]], None]):
+        """:param callback: Called as callback(event, pfname, data). data is None for SE_REMOVED."""
+        self._subscribers.append(callback)
+
+    def get_index(self) -> Dict[str, Data]:
+        """:returns a snapshot of the index."""
+        with self._lock:
+            return dict(self.index)
+
+    def start(self):
+        """Starts watching the directory. The watcher thread first indexes it, without publishing events."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='SaveDirWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def rescan(self, fnames: Optional[List[str]] = None, do_publish: bool = True) -> List[Tuple[E_SaveEvent, str]]:
+        """Re-indexes the given files of the directory, or all of them. Only files of changed mtime or size are read.
+        :returns the events that have been published."""
+        if fnames is None:
+            try:
+                fnames = [fname for fname in os.listdir(self.pname) if fname.lower().endswith('.d2s')]
+            except OSError:
+                fnames = list()
+            fnames += [os.path.basename(pfname) for pfname in self._stat_keys if os.path.basename(pfname) not in fnames]
+        events = list()  # type: List[Tuple[E_SaveEvent, str, Optional[Data]]]
+        for fname in fnames:
+            pfname = os.path.join(self.pname, fname)
+            try:
+                st = os.stat(pfname)
+                key = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                key = None
+            key_prior = self._stat_keys.get(pfname)
+            if key == key_prior:
+                continue
+            if key is None:
+                with self._lock:
+                    del self._stat_keys[pfname]
+                    self.index.pop(pfname, None)
+                events.append((E_SaveEvent.SE_REMOVED, pfname, None))
+                continue
+            try:
+                data = Data(pfname)
+            except (Exception, SystemExit) as e:
+                # [Note: E.g., a file that is just being written. Not recording its key means: Retry next time.]
+                _log.debug(f"Failure to index '{pfname}': {e}")
+                continue
+            with self._lock:
+                self._stat_keys[pfname] = key
+                self.index[pfname] = data
+            events.append((E_SaveEvent.SE_ADDED if key_prior is None else E_SaveEvent.SE_MODIFIED, pfname, data))
+        if do_publish:
+            for event, pfname, data in events:
+                for callback in self._subscribers:
+                    try:
+                        callback(event, pfname, data)
+                    except Exception as e:
+                        _log.error(f"Subscriber to '{self.pname}' failed on {event.name} of '{pfname}': {e}")
+        return [(event, pfname) for event, pfname, _ in events]
+
+    def _run(self):
+        fd = self.init_inotify() if self.use_inotify else -1
+        self.rescan(do_publish=False)
+        if fd < 0:
+            while not self._stop.wait(self.interval):
+                self.rescan()
+            return
+        import select  # << Only the inotify branch needs it.
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd], [], [], self.interval)
+                if not readable:
+                    continue
+                buffer = os.read(fd, 65536)
+                fnames = set()
+                offset = 0
+                while offset + self.struct_inotify_event.size <= len(buffer):
+                    _, _, _, n = self.struct_inotify_event.unpack_from(buffer, offset)
+                    offset += self.struct_inotify_event.size
+                    fname = buffer[offset:(offset + n)].rstrip(b'\0').decode('utf-8', 'replace')
+                    offset += n
+                    if fname.lower().endswith('.d2s'):
+                        fnames.add(fname)
+                if fnames:
+                    self.rescan(sorted(fnames))
+        finally:
+            os.close(fd)
+
+    def init_inotify(self) -> int:
+        """:returns an inotify file descriptor watching self.pname. -1 if inotify is not available."""
+        if not sys.platform.startswith('linux'):
+            return -1
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return -1
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.pname), mask) < 0:
+                os.close(fd)
+                return -1
+            return fd
+        except (OSError, AttributeError) as e:
+            _log.info(f"inotify is not available ({e}). Polling '{self.pname}' instead.")
+            return -1
+
+
+class OpResult:
+    """Structured outcome of one operation of class Horadric. The library does not print. Its operations return these,
+    and the front-end (command line, GUI, server) decides what to show. Warnings also go to the log, as usual."""
+    def __init__(self, operation: str, *, err: int = 0):
+        self.operation = operation  # type: str
+        self.err = err  # type: int
+        self.messages = list()  # type: List[str]
+        self.warnings = list()  # type: List[str]
+        self.pfnames_written = list()  # type: List[str]
+        self.checksums = dict()  # type: Dict[str, str]
+        self.n_items_moved = 0  # type: int
+        self.n_bytes_changed = 0  # type: int
+        self.value = None  # type: Any
+
+    def warn(self, text: str, *, err: Optional[int] = None):
+        """Records a warning, and logs it. If err is given, it also becomes the error code of this result."""
+        _log.warning(text)
+        self.warnings.append(text)
+        if err is not None:
+            self.err = err
+
+    def add_written(self, data: Data):
+        """Records that data has just been written to its pfname."""
+        self.pfnames_written.append(data.pfname)
+        self.checksums[data.pfname] = data.get_checksum().hex()
+        self.messages.append(f"Wrote {data.get_class(True)} {data.get_name(True)} to disk: {data.pfname}")
+
+    def merge(self, other: OpResult) -> OpResult:
+        """Adds the outcome of a sub-operation to this one.
+        :returns self."""
+        self.err = self.err or other.err
+        self.messages += other.messages
+        self.warnings += other.warnings
+        self.pfnames_written += other.pfnames_written
+        self.checksums.update(other.checksums)
+        self.n_items_moved += other.n_items_moved
+        self.n_bytes_changed += other.n_bytes_changed
+        return self
+
+    @staticmethod
+    def count_bytes_changed(before: bytes, after: bytes) -> int:
+        """:returns the length of the span in which before and after differ, when their common prefix and suffix
+        are stripped. Cheap, and insertions do not count for the whole tail."""
+        if before == after:
+            return 0
+        n = min(len(before), len(after))
+        n_prefix = 0
+        while (n_prefix < n) and (before[n_prefix] == after[n_prefix]):
+            n_prefix += 1
+        n_suffix = 0
+        while (n_suffix < n - n_prefix) and (before[-1 - n_suffix] == after[-1 - n_suffix]):
+            n_suffix += 1
+        return max(len(before), len(after)) - n_prefix - n_suffix
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'operation': self.operation, 'err': self.err, 'messages': self.messages, 'warnings': self.warnings,
+                'written': self.pfnames_written, 'checksums': self.checksums, 'n_items_moved': self.n_items_moved,
+                'n_bytes_changed': self.n_bytes_changed}
+
+    def __str__(self) -> str:
+        return "\n".join(self.messages)
+
+
+class HoradricServer:
+    """Long-running local engine, serving JSON-RPC 2.0 over a Unix socket. One request per line, one response per line.
+    Keeps the static tables and the parsed Data of recently used saves warm, in an LRU of n_cached files. A cached
+    Data is re-read if its file has changed on disk in between (by mtime and size). Requests on the same file are
+    serialized by per-file locks. Requests on different files run in parallel.
+    Methods:
+    * ping: {} -> 'pong'.
+    * info: {'pfname': str} -> str.
+    * list_items: {'pfname': str, 'select': ItemSelector spec (optional)} -> list of dicts per stored item.
+    * run: {'pfnames': [str, ...], 'args': {operation: value, ...}} -> {'written': [pfname, ...], 'results': [...]}.
+      Operations are named like the command line arguments, as in job steps. See Horadric.plan_job(..). The results
+      are those of the single operations, see OpResult.to_dict().
+    * Any operation directly, e.g. exchange_horadric, set_sockets_horadric or dispel_magic:
+      {'pfnames': [str, ...], 'value': value (optional, true for flags)} -> as for run.
+    * With 'dry_run': true, run and the operations return the report of Horadric.dry_run(..) instead. Nothing is written.
+    Altering requests are transactions: All operations succeed and each altered file is written once, or none is. If
+    any operation fails, the request returns an error, and nothing is written.
+    The operations that print to stdout (see ops_printing) are not served. Use info instead."""
+    ops_printing = ('info', 'info_stats')
+    error_method = -32601
+    error_params = -32602
+    error_server = -32000
+
+    def __init__(self, pfname_socket: str, *, n_cached: int = 32, parsed: Optional[argparse.Namespace] = None):
+        """:param parsed: Command line arguments of the server. Their backup settings apply to every altering request."""
+        self.pfname_socket = os.path.expanduser(pfname_socket)
+        self.n_cached = n_cached  # type: int
+        self.parsed = parsed if parsed is not None else Horadric.parse_arguments([])  # type: argparse.Namespace
+        self.cache = odict()  # type: OrderedDict[str, Tuple[Data, Tuple[int, int]]]
+        self._lock_cache = threading.Lock()
+        self._locks_file = dict()  # type: Dict[str, threading.Lock]
+        self.ops_valid = [key for key in vars(self.parsed) if (key not in Horadric.args_control) and (key not in self.ops_printing)]  # type: List[str]
+
+    def get_lock(self, path: str) -> threading.Lock:
+        with self._lock_cache:
+            return self._locks_file.setdefault(path, threading.Lock())
+
+    def get_data(self, path: str) -> Data:
+        """:param path: Real path of a .d2s file. The caller has to hold its lock.
+        :returns the cached Data, re-read if the file has changed on disk."""
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock_cache:
+            if path in self.cache and self.cache[path][1] == key:
+                self.cache.move_to_end(path)
+                return self.cache[path][0]
+        data = Data(path)
+        self.put_data(path, data)
+        return data
+
+    def put_data(self, path: str, data: Data):
+        st = os.stat(path)
+        with self._lock_cache:
+            self.cache[path] = (data, (st.st_mtime_ns, st.st_size))
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.n_cached:
+                self.cache.popitem(last=False)
+
+    def call(self, method: str, params: Dict[str, Any]) -> Any:
+        """Dispatches one request.
+        :raises LookupError for unknown methods, ValueError for invalid parameters."""
+        if method == 'ping':
+            return 'pong'
+        if method in ('info', 'list_items'):
+            pfnames = [params['pfname']] if 'pfname' in params else list()
+        else:
+            pfnames = params.get('pfnames', list())
+        if (not isinstance(pfnames, list)) or (not pfnames):
+            raise ValueError("Parameter 'pfname' or 'pfnames' is required.")
+        paths = [os.path.realpath(os.path.expanduser(pfname)) for pfname in pfnames]
+        # [Note: Locks are always taken in sorted order. Thus, concurrent multi-file requests cannot deadlock.]
+        locks = [self.get_lock(path) for path in sorted(set(paths))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            data_all = [self.get_data(path) for path in paths]
+            if method == 'info':
+                return str(data_all[0])
+            if method == 'list_items':
+                selector = ItemSelector.parse(params.get('select', ''))
+                return [{'type_code': item.type_code, 'quality': item.quality.name if item.quality else None,
+                         'storage': item.stash_type.name if item.stash_type else None,
+                         'row': item.row, 'col': item.col, 'n_sockets_occupied': item.n_sockets_occupied}
+                        for item in Item(data_all[0].data).get_block_items(E_ItemBlock.IB_PLAYER) if selector.matches(item)]
+            if method == 'run':
+                ops = params.get('args', dict())
+                if not isinstance(ops, dict):
+                    raise ValueError("Parameter 'args' has to be a mapping of operations to values.")
+                for key in ops:
+                    if key not in self.ops_valid:
+                        raise ValueError(f"Unknown operation '{key}'.")
+            elif method in self.ops_valid:
+                ops = {method: params.get('value', True)}
+            else:
+                raise LookupError(f"Unknown method '{method}'.")
+            _, args = Horadric.plan_job({'characters': {str(j): path for j, path in enumerate(paths)},
+                                         'steps': [dict(ops, characters=[str(j) for j in range(len(paths))])]})[0]
+            horadric = Horadric(data_all=data_all)
+            if params.get('dry_run'):
+                report = horadric.dry_run(lambda: horadric.apply_operations(args, paths))
+                failed = [f"{res['operation']} ({res['err']}): " + ' '.join(res['warnings']) for res in report['results'] if res['err']]
+                if (report['error'] is not None) or failed:
+                    raise RuntimeError(report['error'] or f"Failed operations: {'; '.join(failed)}")
+                return report
+            if not self.parsed.omit_backup:
+                res = horadric.backup(self.parsed.pfname_backup, self.parsed.backup_store, self.parsed.backup_delta, self.parsed.backup_archive)
+                if res.err:
+                    raise RuntimeError(' '.join(res.warnings))
+            written = horadric.transaction(lambda: horadric.apply_operations(args, paths))
+            for path, data in zip(paths, data_all):
+                self.put_data(path, data)
+            return {'written': written, 'results': [res.to_dict() for res in horadric.results]}
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def handle_line(self, line: bytes) -> Dict[str, Any]:
+        """:returns the JSON-RPC response to one request line."""
+        id_request = None
+        try:
+            request = json.loads(line)
+            id_request = request.get('id')
+            params = request.get('params', dict())
+            if not isinstance(params, dict):
+                raise ValueError("Only named parameters are supported.")
+            if not isinstance(request.get('method'), str):
+                raise ValueError("A request requires a 'method'.")
+            return {'jsonrpc': '2.0', 'id': id_request, 'result': self.call(request['method'], params)}
+        except KeyError as e:
+            _log.error(f"Request failed: KeyError: {e}")
+            return {'jsonrpc': '2.0', 'id': id_request, 'error': {'code': self.error_server, 'message': f"KeyError: {e}"}}
+        except LookupError as e:
+            return {'jsonrpc': '2.0', 'id': id_request, 'error': {'code': self.error_method, 'message': str(e)}}
+        except (ValueError, TypeError) as e:
+            return {'jsonrpc': '2.0', 'id': id_request, 'error': {'code': self.error_params, 'message': str(e)}}
+        except (Exception, SystemExit) as e:
+            _log.error(f"Request failed: {type(e).__name__}: {e}")
+            return {'jsonrpc': '2.0', 'id': id_request, 'error': {'code': self.error_server, 'message': f"{type(e).__name__}: {e}"}}
+
+    def serve_forever(self):
+        """Listens on self.pfname_socket until interrupted. A stale socket file is replaced."""
+        import socketserver
+        if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+            _log.error("Unix sockets are not available on this platform. Unable to serve.")
+            return
+        server_self = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if line.strip():
+                        self.wfile.write(json.dumps(server_self.handle_line(line)).encode('utf-8') + b'\n')
+                        self.wfile.flush()
+
+        if os.path.exists(self.pfname_socket):
+            if not stat.S_ISSOCK(os.stat(self.pfname_socket).st_mode):
+                _log.error(f"'{self.pfname_socket}' exists and is not a socket. Unable to serve.")
+                return
+            os.remove(self.pfname_socket)
+        preload()
+        with socketserver.ThreadingUnixStreamServer(self.pfname_socket, Handler) as server:
+            os.chmod(self.pfname_socket, 0o600)
+            print(f"Serving on '{self.pfname_socket}'.")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(self.pfname_socket)
+
+
 class Horadric:
-    def __init__(self, args: Optional[List[str]] = None):
+    ops_mutating = ('exchange_horadric', 'permute_horadric', 'route_items', 'create_rune_cube', 'drop_horadric', 'load_horadric',
+                    'empty_sockets_horadric', 'set_sockets_horadric', 'dispel_magic', 'toggle_ethereal', 'jewelize',
+                    'regrade_horadric', 'ensure_horadric', 'hardcore', 'softcore', 'revive_self', 'revive_merc', 'revive_cows',
+                    'redeem_golem', 'boost_attributes', 'boost_skills', 'reset_attributes', 'reset_skills', 'enable_nightmare',
+                    'enable_hell', 'enable_nirvana', 'enable_godmode', 'disable_godmode', 'set_waypoints', 'set_quests',
+                    'personalize', 'depersonalize')
+    """Command line arguments that alter the target files. Without any of them, the files are mapped read-only."""
+    ops_arity = {'exchange_horadric': 2, 'save_horadric': 1, 'load_horadric': 1}
+    """Operations that require a fixed number of target characters."""
+    args_control = ('pfnames', 'omit_backup', 'pfname_backup', 'backup_store', 'backup_delta', 'backup_archive', 'gc_backups',
+                    'transaction', 'batch', 'batch_workers', 'batch_summary', 'job', 'job_report', 'roster', 'roster_workers',
+                    'roster_out', 'roster_ordered', 'serve', 'serve_cache', 'dry_run', 'startup_report')
+    """Command line arguments that control how operations are run, rather than being operations."""
+
+    def __init__(self, args: Optional[List[str]] = None, *, data_all: Optional[List[Data]] = None):
+        """:param args: Command line arguments. sys.argv, if not given.
+        :param data_all: If given, serve these Data as library, like for the GUI: No arguments are parsed,
+          and operations neither update nor save by themselves."""
+        self._is_standalone = (data_all is None) and (__name__ == "__main__")  # type: bool
+        self.results = list()  # type: List[OpResult]
+        self._files_deferred = None  # type: Optional[List[Tuple[str, bytes]]]
+        self.is_stdout_json = False  # type: bool
+        """True, if a JSON report has been written to stdout. Nothing else may be printed there then."""
         if not self.is_standalone:
-            self.data_all = list()  # type: List[Data]
+            self.data_all = data_all if data_all is not None else list()  # type: List[Data]
             return
         # > Setting up the data. -------------------------------------
+        t_arguments = time.perf_counter()
         parsed = self.parse_arguments(args)
         pfnames_in = parsed.pfnames if parsed.pfnames else list()  # type: List[str]
-        self.data_all = [Data(pfname) for pfname in pfnames_in]
+        if parsed.batch:
+            self.data_all = list()
+            self.run_batch(parsed)
+            return
+        if parsed.job:
+            self.data_all = list()
+            self.run_job(parsed)
+            return
+        if parsed.roster:
+            self.data_all = list()
+            self.run_roster(parsed)
+            return
+        if parsed.serve:
+            self.data_all = list()
+            HoradricServer(parsed.serve, n_cached=parsed.serve_cache, parsed=parsed).serve_forever()
+            return
+        report = None  # type: Optional[Dict[str, Any]]
+        if parsed.startup_report:
+            report = {'import': t_import_end - t_import_start, 'arguments': time.perf_counter() - t_arguments}
+            report['tables'] = preload()
+        # [Note: Pure inspection maps the files rather than reading them. Writes would still work, copying on demand.]
+        defaults = vars(self.parse_arguments([]))
+        read_only = all([getattr(parsed, key) == defaults[key] for key in self.ops_mutating])
+        self.data_all = list()  # type: List[Data]
+        for pfname in pfnames_in:
+            t_read = time.perf_counter()
+            self.data_all.append(Data(pfname, read_only=read_only))
+            if (report is not None) and ('first_file_read' not in report):
+                report['first_file_read'] = time.perf_counter() - t_read
+        if report is not None:
+            report['total'] = time.perf_counter() - t_import_start
+            self.write_startup_report(report, parsed.startup_report)
         #< -----------------------------------------------------------
+        if parsed.dry_run:
+            self.print_dry_run(self.dry_run(lambda: self.apply_operations(parsed, pfnames_in)))
+            return
         #> Backups. --------------------------------------------------
         do_backup = not parsed.omit_backup  # type: bool
         if do_backup:
-            self.backup(parsed.pfname_backup)
+            if self.backup(parsed.pfname_backup, parsed.backup_store, parsed.backup_delta, parsed.backup_archive).err:
+                _log.error("Failure to write backups. No file has been altered.")
+                sys.exit(1)
         else:
             print("Omitting backups.")
+        if parsed.gc_backups:
+            self.results.append(self.gc_backups(parsed.backup_store, parsed.gc_backups))
         # < ----------------------------------------------------------
+        if parsed.transaction:
+            try:
+                self.run_transaction(parsed, pfnames_in)
+            except Exception as e:
+                _log.error(f"Transaction rolled back. No file has been written: {type(e).__name__}: {e}")
+                sys.exit(1)
+        else:
+            self.apply_operations(parsed, pfnames_in)
+        self.print_results()
+
+    def write_side_file(self, pfname: str, bts: bytes):
+        """Writes a file besides the save games, like a .cube or a .humanity file. Within transaction(..), the write is
+        deferred until the save games have been committed. Within dry_run(..), it is dropped."""
+        if self._files_deferred is not None:
+            self._files_deferred.append((pfname, bts))
+            return
+        with open(expanduser(pfname), 'wb') as OUT:
+            OUT.write(bts)
+
+    def print_results(self):
+        """Command line front-end: Prints the messages of all operation results so far. Warnings have been logged."""
+        for res in self.results:
+            if res.messages:
+                print(res)
+
+    def run_transaction(self, parsed: argparse.Namespace, pfnames_in: List[str]) -> List[str]:
+        """Applies all requested operations in memory. Then each altered file gets one update_all() and one atomic
+        write, all behind one durability barrier (see Data.flush_all(..)).
+        If any operation or write fails, all Data are rolled back to their state before the transaction, and no
+        target file has been touched.
+        :returns the pfnames that have been written.
+        :raises whatever made the transaction fail, after the rollback. RuntimeError, if an operation failed by
+          its result (see OpResult.err)."""
+        return self.transaction(lambda: self.apply_operations(parsed, pfnames_in))
+
+    def transaction(self, apply: Callable[[], None]) -> List[str]:
+        """Calls apply() with operations not saving by themselves, then commits the altered Data of self.data_all.
+        If apply() raises, or any of its operation results has an err, nothing is committed. Side files (see
+        write_side_file(..)) are written after the save games only.
+        See run_transaction(..).
+        :returns the pfnames that have been written."""
+        data_all = list(self.data_all)
+        snapshots = [data.data[:] for data in data_all]  # type: List[bytes]
+        is_standalone = self._is_standalone
+        self._is_standalone = False
+        n_results = len(self.results)
+        self._files_deferred = list()
+        try:
+            apply()
+            failed = [res for res in self.results[n_results:] if res.err]
+            if failed:
+                raise RuntimeError(f"Failed operations: {'; '.join([f'{res.operation} ({res.err}): ' + ' '.join(res.warnings) for res in failed])}")
+            data_changed = [data for data, bts in zip(data_all, snapshots) if data.data != bts]
+            for data in data_changed:
+                data.update_all()
+            written = Data.flush_all(data_changed) if data_changed else list()
+            res = OpResult('transaction')
+            for data in data_changed:
+                res.add_written(data)
+            self.results.append(res)
+        except Exception:
+            for data, bts in zip(data_all, snapshots):
+                data.data = bts
+            raise
+        finally:
+            files_deferred = self._files_deferred
+            self._files_deferred = None
+            self._is_standalone = is_standalone
+            self.data_all = data_all
+        for pfname, bts in files_deferred:
+            BackupStore.write_atomic(expanduser(pfname), bts)
+            res.messages.append(f"Wrote file '{pfname}'.")
+        return written
+
+    def dry_run(self, apply: Callable[[], None]) -> Dict[str, Any]:
+        """Calls apply() like transaction(..) does, but commits nothing: The altered Data get their update_all(), are
+        compared to their state before, and are rolled back. No file is written, and no backup is needed.
+        Items are compared by their byte code: An item that only changed its place within a file has been moved.
+        :returns the report. Per file in 'files': 'pfname', 'character', 'changed', 'fields' (names of altered fields,
+          see Data.get_fields()), 'items_added', 'items_removed', 'items_moved', 'size_delta' and 'checksum' (the new
+          one, as hex). Further 'items_moved_between' (items removed from one file and added to another), 'error'
+          (None, or why apply() failed), and 'results' (see OpResult.to_dict())."""
+        data_all = list(self.data_all)
+        snapshots = [data.data[:] for data in data_all]  # type: List[bytes]
+        is_standalone = self._is_standalone
+        self._is_standalone = False
+        report = {'files': list(), 'items_moved_between': 0, 'error': None, 'results': list()}  # type: Dict[str, Any]
+        n_results = len(self.results)
+        self._files_deferred = list()
+        removed_all = Counter()  # type: Counter
+        added_all = Counter()  # type: Counter
+        try:
+            apply()
+            # [Note: The former states are analysed for altered files only, and their items only if the item blocks
+            #  have changed. For most previews, the bulk of the work is skipped thus.]
+            for data, bts in zip(data_all, snapshots):
+                entry = {'pfname': data.pfname, 'character': data.get_name(True), 'changed': data.data != bts,
+                         'fields': list(), 'items_added': 0, 'items_removed': 0, 'items_moved': 0, 'size_delta': 0,
+                         'checksum': data.get_checksum().hex()}  # type: Dict[str, Any]
+                report['files'].append(entry)
+                if not entry['changed']:
+                    continue
+                data.update_all()
+                bts_after = data.data
+                has_changed_items = bts[ItemBlockLayout(bts).index[E_ItemBlock.IB_PLAYER][0]:] != bts_after[data.block_layout.index[E_ItemBlock.IB_PLAYER][0]:]
+                fields_after = data.get_fields(with_items=has_changed_items)
+                data.data = bts
+                fields = data.get_fields(with_items=has_changed_items)
+                data.data = bts_after
+                entry['fields'] = [key for key in list(fields) + [key for key in fields_after if key not in fields]
+                                   if fields.get(key) != fields_after.get(key)]
+                entry['size_delta'] = len(data.data) - len(bts)
+                entry['checksum'] = data.get_checksum().hex()
+                if not has_changed_items:
+                    continue
+                # > Items: Same bytes are unchanged. Same bytes apart from the place have been moved. --------
+                items = [(item.data_item, item.data_item_unplaced) for item in Item(bts).get_block_items()]  # type: List[Tuple[bytes, bytes]]
+                before = Counter([raw for raw, _ in items])
+                after = Counter([item.data_item for item in Item(data.data).get_block_items()])
+                keys = dict(items)  # type: Dict[bytes, bytes]
+                removed = Counter()  # type: Counter
+                for raw, n in (before - after).items():
+                    removed[keys[raw]] += n
+                added = Counter()  # type: Counter
+                for raw, n in (after - before).items():
+                    added[Item(raw, 0, len(raw)).data_item_unplaced] += n
+                moved = removed & added
+                entry['items_moved'] = sum(moved.values())
+                entry['items_removed'] = sum((removed - moved).values())
+                entry['items_added'] = sum((added - moved).values())
+                removed_all += removed - moved
+                added_all += added - moved
+                # < ---------------------------------------------------------------------------------------
+            report['items_moved_between'] = sum((removed_all & added_all).values())
+        except Exception as e:
+            report['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            for data, bts in zip(data_all, snapshots):
+                data.data = bts
+            self._files_deferred = None
+            self._is_standalone = is_standalone
+            self.data_all = data_all
+        report['results'] = [res.to_dict() for res in self.results[n_results:]]
+        return report
+
+    @staticmethod
+    def print_dry_run(report: Dict[str, Any]):
+        """Command line front-end: Prints the report of dry_run(..), one line per file."""
+        for entry in report['files']:
+            if not entry['changed']:
+                print(f"{entry['character']} ({entry['pfname']}): unchanged.")
+                continue
+            print(f"{entry['character']} ({entry['pfname']}): fields [{', '.join(entry['fields'])}], items "
+                  f"+{entry['items_added']} -{entry['items_removed']} ~{entry['items_moved']}, "
+                  f"size {entry['size_delta']:+d} bytes, checksum {entry['checksum']}.")
+        if report['items_moved_between']:
+            print(f"Items moved between files: {report['items_moved_between']}.")
+        if report['error'] is not None:
+            print(f"Failed: {report['error']}")
+        print("Dry run. Nothing has been written.")
+
+    @staticmethod
+    def plan_job(job: Dict[str, Any]) -> List[Tuple[List[str], argparse.Namespace]]:
+        """Validates a job and compiles its steps, before any file is touched.
+        A job is a dict {'characters': {name: pfname, ...}, 'steps': [step, ...]}. A step names its targets by
+        'character': name or 'characters': [name, ...]. All other keys are operations, named like the command line
+        arguments without the leading '--'. Values are true for flags, else the argument's value. E.g.
+        {"character": "B", "load_horadric": "a.cube"} or {"characters": ["C", "D"], "exchange_horadric": true}.
+        Several operations within one step are applied in the fixed order of the command line.
+        :returns per step: The character names and the arguments.
+        :raises ValueError on invalid jobs."""
+        if not isinstance(job, dict):
+            raise ValueError("A job has to be a JSON object.")
+        characters = job.get('characters')
+        if (not isinstance(characters, dict)) or (not characters) or any([not isinstance(val, str) for val in characters.values()]):
+            raise ValueError("A job requires a non-empty 'characters' mapping of names to .d2s pfnames.")
+        steps = job.get('steps', list())
+        if not isinstance(steps, list):
+            raise ValueError("The 'steps' of a job have to be a list.")
+        ops_valid = [key for key in vars(Horadric.parse_arguments([])) if key not in Horadric.args_control]
+        plan = list()  # type: List[Tuple[List[str], argparse.Namespace]]
+        for j, step in enumerate(steps):
+            if not isinstance(step, dict):
+                raise ValueError(f"Step {j} is no JSON object.")
+            names = step.get('characters', [step['character']] if 'character' in step else list())
+            if (not isinstance(names, list)) or (not names) or any([(not isinstance(name, str)) or (name not in characters) for name in names]):
+                raise ValueError(f"Step {j} targets unknown characters or none at all: {names}")
+            if len(set(names)) != len(names):
+                raise ValueError(f"Step {j} targets characters more than once: {names}")
+            args = list()  # type: List[str]
+            for key, val in step.items():
+                if key in ('character', 'characters'):
+                    continue
+                if key not in ops_valid:
+                    raise ValueError(f"Step {j}: Unknown operation '{key}'.")
+                if (key in Horadric.ops_arity) and (val is not False) and (val is not None) and (len(names) != Horadric.ops_arity[key]):
+                    raise ValueError(f"Step {j}: '{key}' requires {Horadric.ops_arity[key]} characters exactly, not {len(names)}.")
+                if val is True:
+                    args.append(f"--{key}")
+                elif (val is not False) and (val is not None):
+                    args += [f"--{key}", str(val)]
+            try:
+                plan.append((names, Horadric.parse_arguments(args, exit_on_error=False)))
+            except ValueError as e:
+                raise ValueError(f"Step {j}: Invalid arguments {args}: {e}")
+        return plan
+
+    def run_job(self, parsed: argparse.Namespace) -> Optional[Dict[str, Any]]:
+        """Runs the JSON job file parsed.job, see plan_job(..). Every file is read once and backed up once, even if
+        several names refer to it. All steps run in memory. Then every altered file gets one update_all() and one
+        atomic write. If a step fails, no file is written. Writes the report of per-step timings to
+        parsed.job_report ('-' for stdout).
+        :returns the report. None, if the job could not be run."""
+        t_start = time.perf_counter()
+        try:
+            with open(os.path.expanduser(parsed.job), 'r') as IN:
+                job = json.load(IN)
+            plan = self.plan_job(job)
+            data_by_name = dict()  # type: Dict[str, Data]
+            data_by_path = dict()  # type: Dict[str, Data]
+            for name, pfname in job['characters'].items():
+                path = os.path.realpath(os.path.expanduser(pfname))
+                if path not in data_by_path:
+                    data_by_path[path] = Data(pfname)
+                data_by_name[name] = data_by_path[path]
+        except (OSError, ValueError) as e:
+            _log.error(f"Invalid job file '{parsed.job}': {e}")
+            return None
+        self.data_all = list(data_by_path.values())
+        if (not parsed.omit_backup) and self.backup(parsed.pfname_backup, parsed.backup_store, parsed.backup_delta, parsed.backup_archive).err:
+            _log.error(f"Failure to write backups. Job '{parsed.job}' has not been run.")
+            return None
+        report = {'job': parsed.job, 'load': time.perf_counter() - t_start, 'steps': list(), 'error': None}  # type: Dict[str, Any]
+
+        defaults = vars(self.parse_arguments([]))
+
+        def apply():
+            for names, args in plan:
+                t_step = time.perf_counter()
+                self.data_all = [data_by_name[name] for name in names]
+                n_results = len(self.results)
+                self.apply_operations(args, [data.pfname for data in self.data_all])
+                failed = [res for res in self.results[n_results:] if res.err]
+                if failed:
+                    raise RuntimeError(f"Failed operations: {'; '.join([f'{res.operation} ({res.err}): ' + ' '.join(res.warnings) for res in failed])}")
+                ops = [key for key, val in vars(args).items() if (key not in self.args_control) and (val != defaults[key])]
+                report['steps'].append({'characters': names, 'operations': ops, 'seconds': time.perf_counter() - t_step})
+
+        t_commit = None
+        try:
+            report['written'] = self.transaction(apply)
+            t_commit = time.perf_counter() - t_start - report['load'] - sum(step['seconds'] for step in report['steps'])
+        except Exception as e:
+            report['error'] = f"Step {len(report['steps'])}: {type(e).__name__}: {e}"
+            report['written'] = list()
+            _log.error(f"Job rolled back. No file has been written. {report['error']}")
+        report['commit'] = t_commit
+        report['total'] = time.perf_counter() - t_start
+        text = json.dumps(report, indent=2)
+        if parsed.job_report == '-':
+            print(text)
+            self.is_stdout_json = True
+        else:
+            with open(parsed.job_report, 'w') as OUT:
+                OUT.write(text + "\n")
+        return report
+
+    def apply_operations(self, parsed: argparse.Namespace, pfnames_in: List[str]):
+        """Applies the operations requested by the parsed command line arguments to self.data_all, in fixed order.
+        The result of each operation is appended to self.results."""
+        def run(operation: Callable[..., OpResult], *args, **kwargs) -> OpResult:
+            states = [data.data for data in self.data_all]  # type: List[bytes]
+            res = operation(*args, **kwargs)
+            res.n_bytes_changed += sum([OpResult.count_bytes_changed(bts, data.data) for bts, data in zip(states, self.data_all)])
+            self.results.append(res)
+            return res
+
+        def fail(operation: str, text: str) -> OpResult:
+            res = OpResult(operation)
+            res.warn(text, err=1)
+            self.results.append(res)
+            return res
+
         if parsed.info:
-            print(self.get_info())
+            for info in self.iter_info():
+                sys.stdout.write(info)
+            sys.stdout.write("\n")
 
         if parsed.softcore and parsed.hardcore:
-            print("Both, set to hardcore and set to softcore has been requested. Ignoring both.")
+            fail('set_hardcore', "Both, set to hardcore and set to softcore has been requested. Ignoring both.")
         elif parsed.softcore or parsed.hardcore:
-            self.set_hardcore(parsed.hardcore)
+            run(self.set_hardcore, parsed.hardcore)
 
         if parsed.revive_self:
-            self.set_dead_self(False)
+            run(self.set_dead_self, False)
 
         if parsed.revive_merc:
-            self.set_dead_mercenary(False)
+            run(self.set_dead_mercenary, False)
 
         if parsed.revive_cows:
-            self.revive_cows()
+            run(self.revive_cows)
 
         if parsed.redeem_golem:
             for data in self.data_all:
-                self.redeem_golem(data)
+                run(self.redeem_golem, data)
 
         if parsed.drop_horadric:
             for data in self.data_all:
-                self.drop_horadric(data)
+                run(self.drop_horadric, data)
 
         if parsed.save_horadric:
             if len(pfnames_in) == 1:
-                self.save_horadric(parsed.save_horadric)
+                run(self.save_horadric, parsed.save_horadric, do_write=not parsed.dry_run)
             else:
-                _log.warning("Saving of Horadric Cube content requires 1 target character exactly.")
+                fail('save_horadric', "Saving of Horadric Cube content requires 1 target character exactly.")
 
         if parsed.empty_sockets_horadric:
             for data in self.data_all:
-                self.empty_sockets_horadric(data)
+                run(self.empty_sockets_horadric, data)
 
         if isinstance(parsed.set_sockets_horadric, int):
             for data in self.data_all:
-                self.set_sockets_horadric(data, parsed.set_sockets_horadric)
+                run(self.set_sockets_horadric, data, parsed.set_sockets_horadric)
 
         if parsed.dispel_magic:
             for data in self.data_all:
-                self.dispel_magic_horadric(data)
+                run(self.dispel_magic_horadric, data)
 
         if parsed.toggle_ethereal:
             for data in self.data_all:
-                self.toggle_ethereal(data)
+                run(self.toggle_ethereal, data)
 
         if parsed.jewelize:
             for data in self.data_all:
@@ -3595,80 +5391,183 @@ class Horadric:
                     tpl = E_ItemTpl.IT_CHARM
                 elif parsed.jewelize.upper == 'amu':
                     tpl = E_ItemTpl.IT_AMULET
-                self.jewelize_horadric(data, tpl)
+                run(self.jewelize_horadric, data, tpl)
 
         if parsed.set_waypoints:
-            self.set_waypoints(parsed.set_waypoints)
+            run(self.set_waypoints, parsed.set_waypoints)
 
         if parsed.set_quests:
-            self.set_quests(parsed.set_quests)
+            run(self.set_quests, parsed.set_quests)
 
         if parsed.depersonalize:
             for data in self.data_all:
-                self.personalize_horadric(data, None)
+                run(self.personalize_horadric, data, None)
 
         if parsed.personalize:
             for data in self.data_all:
-                self.personalize_horadric(data, parsed.personalize)
+                run(self.personalize_horadric, data, parsed.personalize)
 
         if parsed.ensure_horadric:
             for data in self.data_all:
-                self.ensure_horadric(data)
+                run(self.ensure_horadric, data)
 
         if parsed.regrade_horadric:
             for data in self.data_all:
-                self.regrade_horadric(data)
+                run(self.regrade_horadric, data)
 
         if parsed.create_rune_cube is not None:
-            self.create_rune_cube(parsed.create_rune_cube)
+            run(self.create_rune_cube, parsed.create_rune_cube, do_write=not parsed.dry_run)
 
         if parsed.load_horadric:
             if len(pfnames_in) == 1:
-                self.load_horadric(parsed.load_horadric)
+                run(self.load_horadric, parsed.load_horadric)
             else:
-                _log.warning("Loading of Horadric Cube content requires 1 target character exactly.")
+                fail('load_horadric', "Loading of Horadric Cube content requires 1 target character exactly.")
 
         if parsed.exchange_horadric:
             if len(pfnames_in) == 2:
-                self.exchange_horadric()
+                run(self.exchange_horadric)
+            else:
+                fail('exchange_horadric', "Exchanging Horadric Cube contents requires 2 target characters exactly.")
+
+        if parsed.permute_horadric:
+            try:
+                mapping = self.parse_permutation(parsed.permute_horadric, len(self.data_all))
+            except ValueError:
+                fail('permute_horadric', f"Invalid Horadric permutation '{parsed.permute_horadric}'. Expected 'rotate', or e.g. '1:2,2:3,3:1'.")
+            else:
+                run(self.permute_horadric, mapping)
+
+        if parsed.route_items is not None:
+            try:
+                selector = ItemSelector.parse(parsed.route_items)
+                storages = ItemSelector.parse_storages(parsed.route_storage)
+                targets = [int(x) - 1 for x in parsed.route_targets.split(',')] if parsed.route_targets else [len(self.data_all) - 1]
+                if any([not (0 <= k < len(self.data_all)) for k in targets]):
+                    raise ValueError(f"Route targets '{parsed.route_targets}' exceed the {len(self.data_all)} given characters.")
+            except ValueError as e:
+                fail('route_items', f"Invalid item routing: {e}")
             else:
-                _log.warning("Exchanging Horadric Cube contents requires 2 target characters exactly.")
+                run(self.route_items, selector, targets, storages)
 
         if parsed.boost_attributes is not None:
-            self.boost(E_Attributes.AT_UNUSED_STATS, parsed.boost_attributes)
+            run(self.boost, E_Attributes.AT_UNUSED_STATS, parsed.boost_attributes)
 
         if parsed.boost_skills is not None:
-            self.boost(E_Attributes.AT_UNUSED_SKILLS, parsed.boost_skills)
+            run(self.boost, E_Attributes.AT_UNUSED_SKILLS, parsed.boost_skills)
 
         if parsed.reset_attributes:
-            self.reset_attributes()
+            run(self.reset_attributes)
 
         if parsed.reset_skills:
-            self.reset_skills()
+            run(self.reset_skills)
 
         if parsed.enable_nightmare:
-            self.enable_nightmare()
+            run(self.enable_nightmare)
 
         if parsed.enable_hell:
-            self.enable_hell()
+            run(self.enable_hell)
 
         if parsed.enable_nirvana:
-            self.enable_nirvana()
+            run(self.enable_nirvana)
 
         if parsed.enable_godmode:
-            self.enable_godmode()
+            run(self.enable_godmode)
 
         if parsed.disable_godmode:
-            self.disable_godmode()
+            run(self.disable_godmode)
 
         if parsed.info_stats:
             self.info_stats()
 
+    @staticmethod
+    def write_startup_report(report: Dict[str, Any], pfname: str):
+        """Writes the startup timings as JSON. All values are in seconds.
+        :param report: Keys 'import', 'arguments', 'tables' (a dict per table), 'first_file_read' (if any file was
+          given), and 'total' (since the beginning of the import of this module).
+        :param pfname: Target file. '-' for stdout."""
+        text = json.dumps(report, indent=2)
+        if pfname == '-':
+            print(text)
+            return
+        try:
+            with open(pfname, 'w') as OUT:
+                OUT.write(text + "\n")
+        except OSError as err:
+            _log.warning(f"Failure to write startup report to '{pfname}': {err}")
+
     @property
     def is_standalone(self) -> bool:
-        """Is this script running on its own, or does it serve the Horadric Exchange GUI?
+        """Is this script running on its own, or does it serve the Horadric Exchange GUI (or a batch worker)?
         The greatest effect of this is that a non-standalone script will not autoupdate and autosave."""
-        return __name__ == "__main__"
+        return self._is_standalone
+
+    @staticmethod
+    def get_batch_pfnames(pattern: str) -> List[str]:
+        """:param pattern: A directory (meaning all .d2s files therein) or a glob pattern.
+        :returns the matching pfnames, sorted."""
+        import glob  # << Deferred. Only batch mode needs it.
+        pattern = os.path.expanduser(pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.d2s')
+        return sorted(pfname for pfname in glob.glob(pattern) if os.path.isfile(pfname))
+
+    def run_batch(self, parsed: argparse.Namespace) -> Dict[str, Any]:
+        """Applies the requested operations to every file matching parsed.batch. Files are sharded over a pool of
+        parsed.batch_workers processes. Each file is read once, backed up, altered in memory, and written once.
+        Writes the JSON summary to parsed.batch_summary ('-' for stdout).
+        :returns the summary."""
+        from concurrent.futures import ProcessPoolExecutor
+        t_start = time.perf_counter()
+        pfnames = self.get_batch_pfnames(parsed.batch)
+        n_workers = max(1, min(parsed.batch_workers or os.cpu_count() or 1, len(pfnames) or 1))
+        _log.info(f"Batch: {len(pfnames)} files matching '{parsed.batch}', {n_workers} processes.")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(Horadric.run_batch_file, pfnames, [parsed] * len(pfnames),
+                                        chunksize=max(1, len(pfnames) // (4 * n_workers))))
+        summary = {'pattern': parsed.batch, 'n_files': len(results),
+                   'n_changed': sum(1 for result in results if result['changed']),
+                   'n_failed': sum(1 for result in results if result['error'] is not None),
+                   'seconds': time.perf_counter() - t_start, 'files': results}
+        text = json.dumps(summary, indent=2)
+        if parsed.batch_summary == '-':
+            print(text)
+            self.is_stdout_json = True
+        else:
+            with open(parsed.batch_summary, 'w') as OUT:
+                OUT.write(text + "\n")
+            _log.info(f"Batch: {summary['n_changed']} changed, {summary['n_failed']} failed. Summary written to '{parsed.batch_summary}'.")
+        return summary
+
+    @staticmethod
+    def run_batch_file(pfname: str, parsed: argparse.Namespace) -> Dict[str, Any]:
+        """Batch worker for a single file. Never raises: Failures are reported in the result.
+        :returns dict with keys 'pfname', 'character', 'changed', 'error', 'output' (all that has been printed)
+          and 'seconds'. With parsed.dry_run also 'dry_run', the file's entry of the Horadric.dry_run(..) report."""
+        import io
+        import contextlib
+        t_start = time.perf_counter()
+        result = {'pfname': pfname, 'character': None, 'changed': False, 'error': None}  # type: Dict[str, Any]
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                data = Data(pfname)
+                result['character'] = data.get_name(True)
+                horadric = Horadric(data_all=[data])
+                if parsed.dry_run:
+                    result['dry_run'] = horadric.dry_run(lambda: horadric.apply_operations(parsed, [pfname]))['files'][0]
+                else:
+                    if not parsed.omit_backup:
+                        res = horadric.backup(parsed.pfname_backup, parsed.backup_store, parsed.backup_delta, parsed.backup_archive)
+                        if res.err:
+                            raise RuntimeError(' '.join(res.warnings))
+                    result['changed'] = bool(horadric.run_transaction(parsed, [pfname]))
+                    horadric.print_results()
+        except (Exception, SystemExit) as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['output'] = output.getvalue()
+        result['seconds'] = time.perf_counter() - t_start
+        return result
 
     def get_data_by_pfname(self, pfname: str, *, create_if_missing: bool = False) -> Optional[Data]:
         """:returns the data block with the given pfname. Or None, in case of failure."""
@@ -3729,71 +5628,177 @@ class Horadric:
                 print(f"Val: {s_prefix} {s_suffix}\nraw: {raw}\n")
             print("------------------------------------------------------------------------------")
 
-    def backup(self, pfname_backup: Optional[str] = None):
-        for data in self.data_all:
-            pfname_b = ''
-            if pfname_backup:
-                pfname_b = pfname_backup
-                if len(self.data_all) > 1:
-                    pfname_b += data.get_name(True) + '_' + pfname_b
-            else:
-                pfname_b += data.get_name(True)
-            data.save2disk(pfname_b, prefix_timestamp=pfname_backup is None)
+    def backup(self, pfname_backup: Optional[str] = None, pname_store: Optional[str] = None, delta_interval: int = 0,
+               pname_archive: Optional[str] = None):
+        """Backs up all target files. Either as loose (timestamped) files, into the deduplicating BackupStore
+        at pname_store, or into the per-character BackupArchive files at pname_archive, if one of these is given.
+        See BackupStore for delta_interval.
+        :returns the result, also appended to self.results. Its err is set, if any backup could not be written. The
+          caller must not alter the files then."""
+        res = OpResult('backup')
+        self.results.append(res)
+        try:
+            if pname_archive:
+                archive = BackupArchive(pname_archive)
+                for data in self.data_all:
+                    entry = archive.put(data)
+                    res.messages.append(f"Appended backup of {data.get_name(True)} ({entry.length} bytes compressed) to '{archive.get_pfname_archive(archive.get_key(data))}'.")
+                return res
+            if pname_store:
+                store = BackupStore(pname_store, delta_interval=delta_interval)
+                for data in self.data_all:
+                    entry = store.put(data)
+                    res.messages.append(f"Stored backup of {data.get_name(True)} as {entry.digest} in '{store.pname}'.")
+                return res
+            for data in self.data_all:
+                pfname_b = ''
+                if pfname_backup:
+                    pfname_b = pfname_backup
+                    if len(self.data_all) > 1:
+                        pfname_b += data.get_name(True) + '_' + pfname_b
+                else:
+                    pfname_b += data.get_name(True)
+                data.save2disk(pfname_b, prefix_timestamp=pfname_backup is None)
+        except OSError as e:
+            res.warn(f"Failure to write backups: {e}", err=2)
+        return res
+
+    @staticmethod
+    def gc_backups(pname_store: Optional[str], spec: str) -> OpResult:
+        """Prunes the backup store at pname_store according to the retention policy spec. See RetentionPolicy.
+        :returns a result, holding as value the statistics of BackupStore.gc(..). None, if the store or the policy is invalid."""
+        res = OpResult('gc_backups')
+        if not pname_store:
+            res.warn("Garbage collection of backups requires the backup store to be given by --backup_store.", err=1)
+            return res
+        try:
+            policy = RetentionPolicy.parse(RetentionPolicy.spec_default if spec == 'default' else spec)
+        except ValueError as e:
+            res.warn(str(e), err=1)
+            return res
+        stats = BackupStore(pname_store).gc(policy)
+        res.messages.append(f"Backup store '{pname_store}': Kept {stats['entries_kept']} and dropped {stats['entries_dropped']} backups. "
+                            f"Deleted {stats['blobs_deleted']} blobs, freeing {stats['bytes_freed']} bytes.")
+        res.value = stats
+        return res
 
     def get_info(self) -> str:
-        """Print various info to all files to the console."""
+        """:returns various info to all files."""
+        return ''.join(self.iter_info())
+
+    def iter_info(self) -> Iterator[str]:
+        """Yields the info of one file after the other, with separators in between. See get_info()."""
         n = len(self.data_all)
-        res = ""
         for j in range(n):
-            res += str(self.data_all[j])
+            yield str(self.data_all[j])
             if j < (n-1):
-                res += "\n====================\n"
+                yield "\n====================\n"
+
+    @staticmethod
+    def get_roster_entry(pfname: str) -> Tuple[str, str, Optional[str]]:
+        """Roster worker for a single file. Never raises.
+        :returns pfname, the info of that file, and an error message (None in case of success)."""
+        try:
+            return pfname, str(Data(pfname, read_only=True)), None
+        except (Exception, SystemExit) as e:
+            return pfname, '', f"{type(e).__name__}: {e}"
+
+    def run_roster(self, parsed: argparse.Namespace) -> int:
+        """Writes the info of every file matching parsed.roster, parsed by a pool of parsed.roster_workers processes.
+        Each report is written as soon as it is ready: Either to stdout, or into parsed.roster_out as '<fname>.txt'.
+        With parsed.roster_ordered, reports appear in order of pfnames, else in order of completion. Only reports
+        that have been completed but not yet written are held in memory.
+        :returns the number of files that failed."""
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        pfnames = self.get_batch_pfnames(parsed.roster)
+        n_workers = max(1, min(parsed.roster_workers or os.cpu_count() or 1, len(pfnames) or 1))
+        if parsed.roster_out:
+            os.makedirs(os.path.expanduser(parsed.roster_out), exist_ok=True)
+        n_failed = 0
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            if parsed.roster_ordered:
+                entries = executor.map(Horadric.get_roster_entry, pfnames, chunksize=max(1, len(pfnames) // (16 * n_workers)))
+            else:
+                entries = (future.result() for future in as_completed([executor.submit(Horadric.get_roster_entry, pfname) for pfname in pfnames]))
+            for pfname, info, error in entries:
+                if error is not None:
+                    n_failed += 1
+                    _log.warning(f"Failure to report on '{pfname}': {error}")
+                elif parsed.roster_out:
+                    with open(os.path.join(os.path.expanduser(parsed.roster_out), os.path.basename(pfname) + '.txt'), 'w') as OUT:
+                        OUT.write(info)
+                else:
+                    sys.stdout.write(f"==================== {pfname}\n{info}\n")
+                    sys.stdout.flush()
+        print(f"Roster: {len(pfnames) - n_failed} reports, {n_failed} failures.")
+        return n_failed
+
+    def save(self, data: Data, res: OpResult) -> OpResult:
+        """Standalone only: Updates data and writes it to its own pfname. Recorded in res.
+        :returns res."""
+        if self.is_standalone:
+            data.update_all()
+            data.save2disk()
+            res.add_written(data)
+        return res
+
+    def save_all(self, data_changed: List[Data], res: OpResult) -> OpResult:
+        """Standalone only: Updates the data_changed and writes them behind one durability barrier (see
+        Data.flush_all(..)). Recorded in res.
+        :returns res."""
+        if self.is_standalone and data_changed:
+            for data in data_changed:
+                data.update_all()
+            Data.flush_all(data_changed)
+            for data in data_changed:
+                res.add_written(data)
         return res
 
-    def set_hardcore(self, hardcore: bool):
+    def set_hardcore(self, hardcore: bool) -> OpResult:
+        res = OpResult('set_hardcore')
         for data in self.data_all:
             data.set_hardcore(hardcore)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def set_dead_self(self, val: bool):
+    def set_dead_self(self, val: bool) -> OpResult:
+        res = OpResult('set_dead_self')
         for data in self.data_all:
-            print(f"Attempting to ensure {'death' if val else 'life'} for {data.get_name(True)}.")
+            res.messages.append(f"Attempting to ensure {'death' if val else 'life'} for {data.get_name(True)}.")
             data.set_dead(val)
             if not val:
                 attrs = data.get_attributes()
                 if E_Attributes.AT_MAX_HP in attrs:
-                    print(f"Attempting to heal {data.get_name(True)}'s wounds, too.")
+                    res.messages.append(f"Attempting to heal {data.get_name(True)}'s wounds, too.")
                     attrs[E_Attributes.AT_CURRENT_HP] = attrs[E_Attributes.AT_MAX_HP]
                     data.set_attributes(attrs)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def set_dead_mercenary(self, val: bool):
+    def set_dead_mercenary(self, val: bool) -> OpResult:
+        res = OpResult('set_dead_mercenary')
         for data in self.data_all:
-            print(f"Attempting to ensure {'death' if val else 'life'} for {data.get_name(True)}'s mercenary.")
+            res.messages.append(f"Attempting to ensure {'death' if val else 'life'} for {data.get_name(True)}'s mercenary.")
             data.is_dead_mercenary = val
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def revive_cows(self):
+    def revive_cows(self) -> OpResult:
+        res = OpResult('revive_cows')
         for data in self.data_all:
-            print(f"Attempting to ensure life for {data.get_name(True)}'s cow king.")
+            res.messages.append(f"Attempting to ensure life for {data.get_name(True)}'s cow king.")
             for prog in [E_Progression.EP_NORMAL, E_Progression.EP_NIGHTMARE, E_Progression.EP_HELL]:
                 bts = E_Quest.get_quest_block(data.data, prog)
                 bts = E_Quest.reset_cow_level(bts)
                 data.data = E_Quest.set_quest_block(data.data, bts, prog)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def boost(self, attr: E_Attributes, val: int):
+    def boost(self, attr: E_Attributes, val: int) -> OpResult:
         """Sets the target attribute to the given val."""
+        res = OpResult('boost')
         for data in self.data_all:
-            print(f"Attempting to boost '{attr.name}' to the value of {val}")
+            res.messages.append(f"Attempting to boost '{attr.name}' to the value of {val}")
             attributes = data.get_attributes()
             if val:
                 attributes[attr] = val
@@ -3801,9 +5806,8 @@ class Horadric:
                 if attr in attributes:
                     del attributes[attr]
             data.set_attributes(attributes)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
     @staticmethod
     def _subtract_and_encode_quarter_tuples(a: Tuple[int, int], b: Tuple[int, int]) -> int:
@@ -3814,7 +5818,8 @@ class Horadric:
             main -= 1
         return Data.HMS_encode(main, quarters)
 
-    def reset_attributes(self):
+    def reset_attributes(self) -> OpResult:
+        res = OpResult('reset_attributes')
         for data in self.data_all:
             attr = data.get_attributes()
             character = data.get_class_enum()
@@ -3835,89 +5840,95 @@ class Horadric:
             for key in attr_start:
                 stat_points += attr[key] - attr_start[key]
                 attr[key] = attr_start[key]
-            print(f"Attempting to reset {data.get_name(True)}'s {stat_points} spent attribute points.")
+            res.messages.append(f"Attempting to reset {data.get_name(True)}'s {stat_points} spent attribute points.")
             attr[E_Attributes.AT_UNUSED_STATS] = stat_points
 
             data.set_attributes(attr)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def reset_skills(self):
+    def reset_skills(self) -> OpResult:
+        res = OpResult('reset_skills')
         for data in self.data_all:
             n_skills = sum(data.get_skills())
-            print(f"Attempting to reset {data.get_name(True)}'s {n_skills} learned skills.")
+            res.messages.append(f"Attempting to reset {data.get_name(True)}'s {n_skills} learned skills.")
             skillset = [0] * 30
             data.set_skills(skillset)
             # That boost command also does the updating and saving!
-            self.boost(E_Attributes.AT_UNUSED_SKILLS, n_skills)
+            res.merge(self.boost(E_Attributes.AT_UNUSED_SKILLS, n_skills))
+        return res
 
-    def enable_nightmare(self):
+    def enable_nightmare(self) -> OpResult:
+        res = OpResult('enable_nightmare')
         for data in self.data_all:
             data.enable_nightmare()
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def enable_hell(self):
+    def enable_hell(self) -> OpResult:
+        res = OpResult('enable_hell')
         for data in self.data_all:
             data.enable_hell()
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def enable_nirvana(self):
+    def enable_nirvana(self) -> OpResult:
+        res = OpResult('enable_nirvana')
         for data in self.data_all:
             data.enable_nirvana()
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def enable_godmode(self):
+    def enable_godmode(self) -> OpResult:
+        res = OpResult('enable_godmode')
         for data in self.data_all:
-            print(f"Enabling GOD MODE for {data.get_name(True)}.")
-            data.enable_godmode()
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            res.messages.append(f"Enabling GOD MODE for {data.get_name(True)}.")
+            backup = data.enable_godmode(do_backup=False)
+            if backup is not None:
+                self.write_side_file(data.pfname_humanity, backup)
+            self.save(data, res)
+        return res
 
-    def disable_godmode(self):
+    def disable_godmode(self) -> OpResult:
+        res = OpResult('disable_godmode')
         for data in self.data_all:
-            print(f"Disabling GOD MODE for {data.get_name(True)}.")
+            res.messages.append(f"Disabling GOD MODE for {data.get_name(True)}.")
             data.disable_godmode()
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def redeem_golem(self, data: Data):
+    def redeem_golem(self, data: Data) -> OpResult:
+        res = OpResult('redeem_golem')
         item_analysis = Item(data.data)
         if not data.has_iron_golem:
-            print("There is no golem to redeem.")
-            return
+            res.messages.append("There is no golem to redeem.")
+            return res
         items = item_analysis.get_block_items(E_ItemBlock.IB_IRONGOLEM)
         if not items:
-            return
-        index_golem_code = items[0].index_start - 1
-        data.data = data.data[:index_golem_code] + b'\x00'
+            return res
+        # [Note: Dropping the golem's item also resets the golem flag within the 'kf' header to 0.]
+        data.drop_items(list(items))
         data.place_items_into_storage_maps(items)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        res.n_items_moved = len(items)
+        return self.save(data, res)
 
-    def drop_horadric(self, data: Data, *, do_save: Optional[bool] = None):
+    def drop_horadric(self, data: Data, *, do_save: Optional[bool] = None) -> OpResult:
         """Drops all items from the Horadric Cube. If standalone mode, also saves the results to disk."""
+        res = OpResult('drop_horadric')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         # [Note: Iterate in reversed order, so that dropping front items will not destroy indices for back items.]
         for item in reversed(items):
             data.drop_item(item)
         if do_save is None:
             do_save = self.is_standalone
+        res.n_items_moved = len(items)
         if do_save:
-            data.update_all()
-            data.save2disk()
-            print(f"Dropped {len(items)} items from the Horadric cube.")
+            self.save(data, res)
+            res.messages.append(f"Dropped {len(items)} items from the Horadric cube.")
+        return res
 
-    def empty_sockets_horadric(self, data: Data):
+    def empty_sockets_horadric(self, data: Data) -> OpResult:
+        res = OpResult('empty_sockets_horadric')
         # [Note: A bit convoluted. This function alters item locations and hence item indices are obsoleted.
         #  To compensate, get_cube_contents() is called anew on each iteration.]
         items = list()  # type: List[Item]
@@ -3933,41 +5944,41 @@ class Horadric:
                     found_a_target = True
                     break
         if self.is_standalone:
-            data.update_all()
-            data.save2disk()
-            print(f"Attempts were made to desocket Horadric Cube content. {len(items)} items were involved (socketed and base).")
+            self.save(data, res)
+            res.messages.append(f"Attempts were made to desocket Horadric Cube content. {len(items)} items were involved (socketed and base).")
+        return res
 
-    def set_sockets_horadric(self, data: Data, count: int):
+    def set_sockets_horadric(self, data: Data, count: int) -> OpResult:
+        res = OpResult('set_sockets_horadric')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         for j in reversed(range(len(items))):
             data.set_sockets(items[j], count)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        self.save(data, res)
+        return res
 
-    def dispel_magic_horadric(self, data: Data):
+    def dispel_magic_horadric(self, data: Data) -> OpResult:
+        res = OpResult('dispel_magic_horadric')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         for j in reversed(range(len(items))):
             data.dispel_magic(items[j])
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        self.save(data, res)
+        return res
 
-    def toggle_ethereal(self, data: Data):
+    def toggle_ethereal(self, data: Data) -> OpResult:
+        res = OpResult('toggle_ethereal')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         for item in items:
             data.set_ethereal(item)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        self.save(data, res)
+        return res
 
-    def jewelize_horadric(self, data: Data, tpl: E_ItemTpl):
+    def jewelize_horadric(self, data: Data, tpl: E_ItemTpl) -> OpResult:
+        res = OpResult('jewelize_horadric')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         for item in items:
             data.jewelize(item, do_replace=True, tpl=tpl)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        self.save(data, res)
+        return res
 
     @staticmethod
     def _parse_difficulty_bitmap(data: Data, code: str) -> Dict[E_Progression, str]:
@@ -3983,45 +5994,48 @@ class Horadric:
                 return dict()
         return {difficulty: re.sub("[^0-1]", '.', bm)}
 
-    def set_waypoints(self, code: str):
+    def set_waypoints(self, code: str) -> OpResult:
+        res = OpResult('set_waypoints')
         for data in self.data_all:
             data.waypoint_map = self._parse_difficulty_bitmap(data, code)
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def set_quests(self, code: str):
+    def set_quests(self, code: str) -> OpResult:
+        res = OpResult('set_quests')
         for data in self.data_all:
             data.set_quests_simplified(self._parse_difficulty_bitmap(data, code))
-            if self.is_standalone:
-                data.update_all()
-                data.save2disk()
+            self.save(data, res)
+        return res
 
-    def personalize_horadric(self, data: Data, name: Optional[str] = None):
+    def personalize_horadric(self, data: Data, name: Optional[str] = None) -> OpResult:
         """Within the Horadric Cube, give all adequate items a personalization name.
         :param data: Some Data object.
         :param name: a 2-15 letter name with potentially one hyphen xor underscore.
           May also be None. In that case, existing personalization will be wiped."""
         items = Item(data.data).get_cube_contents(restrict2regular_extended=True)  # type: List[Item]
         if not items:
-            return
+            return OpResult('personalize_horadric')
         cube_named = b''  # type: bytes
         for item_in in items:
             cube_named += item_in.create_personalized_copy(name)
         # [Note: self.insert_horadric already includes an automatic update_all and save action, if self.is_standalone.]
-        self.insert_horadric(data, cube_named)
+        res = self.insert_horadric(data, cube_named)
+        res.operation = 'personalize_horadric'
+        return res
 
-    def regrade_horadric(self, data: Data):
+    def regrade_horadric(self, data: Data) -> OpResult:
+        res = OpResult('regrade_horadric')
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         for item in items:
             data.regrade(item)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        self.save(data, res)
+        return res
 
-    def ensure_horadric(self, data: Data):
+    def ensure_horadric(self, data: Data) -> OpResult:
+        res = OpResult('ensure_horadric')
         if data.has_horadric_cube:
-            return  # << Nothing to do.
+            return res  # << Nothing to do.
         item_master = Item(data.data)
         items_in_non_existing_cube = Item(data.data).get_cube_contents()  # type: List[Item]
         data.drop_items(items_in_non_existing_cube)
@@ -4038,15 +6052,14 @@ class Horadric:
             data.add_items_to_player(int.to_bytes(n_items) + data_tpl_horadric_cube + code)
         else:
             data.add_items_to_player(int.to_bytes(1) + data_tpl_horadric_cube)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
-        print("Horadric Cube has been added to the top left corner of the inventory. Old items in this place have been moved into the cube.")
+        res.n_items_moved = len(items_inventory)
+        self.save(data, res)
+        res.messages.append("Horadric Cube has been added to the top left corner of the inventory. Old items in this place have been moved into the cube.")
+        return res
 
     @staticmethod
-    def grep_horadric(data: Data) -> bytes:
-        """:returns a one-byte prefix with the number of counting items and then the
-        block of item byte code."""
+    def grep_horadric(data: Data) -> OpResult:
+        """:returns the block of item byte code of the Horadric Cube contents as value of the result."""
         items = Item(data.data).get_cube_contents()  # type: List[Item]
         res = b''
         count = 0
@@ -4054,20 +6067,28 @@ class Horadric:
             res += item.data_item
             if item.item_parent != E_ItemParent.IP_ITEM:
                 count = count + 1
-        print(f"Grepped {len(items)} items ({count} counting).")
-        return res
+        result = OpResult('grep_horadric')
+        result.value = res
+        result.n_items_moved = count
+        result.messages.append(f"Grepped {len(items)} items ({count} counting).")
+        return result
 
-    def save_horadric(self, pfname_out: str):
+    def save_horadric(self, pfname_out: str, *, do_write: bool = True) -> OpResult:
         """Writes the horadric cube raw contents to disk. Employs that these contents are in order.
-        Target file structure: Number of main items, bytes block of all cube items."""
+        Target file structure: Number of main items, bytes block of all cube items.
+        :param do_write: If False, the contents are only grepped (see grep_horadric(..))."""
         data = self.data_all[0]
         res = self.grep_horadric(data)
-        with open(expanduser(pfname_out), 'wb') as OUT:
-            OUT.write(res)
-        print(f"Wrote file '{pfname_out}'.")
+        res.operation = 'save_horadric'
+        if do_write:
+            self.write_side_file(pfname_out, res.value)
+            if self._files_deferred is None:
+                res.messages.append(f"Wrote file '{pfname_out}'.")
+        return res
 
-    @staticmethod
-    def create_rune_cube(cmd: str):
+    def create_rune_cube(self, cmd: str, *, do_write: bool = True) -> OpResult:
+        """:param do_write: If False, the items are only created. The cube file is not written."""
+        res = OpResult('create_rune_cube')
         (pfname, runes) = cmd.split(":",1)
         lst_runes = list()  # type: List[Union[str, E_Rune]]
         for r in re.split('\\s*[,;:]\\s*', runes):
@@ -4086,54 +6107,239 @@ class Horadric:
                 item.stash_type = E_ItemStorage.IS_CUBE
                 vol = item.volume
                 if vol is None or any([val != 1 for val in vol]):
-                    _log.warning("Failure to place gimmick into cube. So far only items of size 1x1 are admitted for the command line version.")
+                    res.warn("Failure to place gimmick into cube. So far only items of size 1x1 are admitted for the command line version.")
                     continue
                 item.row = row
                 item.col = col
             if item is None or item.data_item is None:
                 continue
             content = content + item.data_item
-            print(f"Adding: {item}")
-        with open(pfname, 'wb') as OUT:
-            OUT.write(content)
-        print(f"Wrote runic cube with {len(lst_runes)} runes to '{pfname}'")
+            res.messages.append(f"Adding: {item}")
+            res.n_items_moved += 1
+        if do_write:
+            self.write_side_file(pfname, content)
+            if self._files_deferred is None:
+                res.messages.append(f"Wrote runic cube with {len(lst_runes)} runes to '{pfname}'")
+        return res
 
-    def insert_horadric(self, data: Data, items: bytes):
+    def insert_horadric(self, data: Data, items: bytes, *, do_save: bool = True) -> OpResult:
         """Takes a byte block of Horadric cube player items and moves it into the players Horadric Cube.
         Replaces old contents.
-        After this is done the character file is saved automatically."""
-        self.drop_horadric(data, do_save=False)
+        After this is done the character file is saved automatically, unless do_save is False."""
+        res = self.drop_horadric(data, do_save=False)
+        res.operation = 'insert_horadric'
         data.add_items_to_player(items)
-        if self.is_standalone:
-            data.update_all()
-            data.save2disk()
+        if do_save:
+            self.save(data, res)
+        return res
 
-    def load_horadric(self, pfname_in) -> int:
+    def load_horadric(self, pfname_in) -> OpResult:
+        """:returns a result with err 1 if there is not one target character exactly, 2 if pfname_in is no file."""
+        res = OpResult('load_horadric')
         if len(self.data_all) != 1:
-            _log.warning(f"Horadric cube content loading requires one target character exactly.")
-            return 1
+            res.warn(f"Horadric cube content loading requires one target character exactly.", err=1)
+            return res
         if not os.path.isfile(pfname_in):
-            _log.warning(f"File '{pfname_in}' could not be opened for reading,")
-            return 2
+            res.warn(f"File '{pfname_in}' could not be opened for reading,", err=2)
+            return res
         with open(pfname_in, 'rb') as IN:
             code = IN.read()
         data = self.data_all[0]
-        self.insert_horadric(data, code)
-        return 0
+        res.merge(self.insert_horadric(data, code))
+        return res
+
+    def permute_horadric(self, mapping: Dict[int, int]) -> OpResult:
+        """N-way exchange of Horadric Cube contents among self.data_all: Rotations, arbitrary permutations, and
+        pooling of several cubes into one. All cubes are grepped once. Then every altered character gets one splice
+        of its player item block, and (if standalone) all of them are written behind one durability barrier.
+        :param mapping: Index of source character -> index of target character, both within self.data_all.
+          Unmapped characters keep their cube contents, unless others are pooled into them. A character that is
+          a source but no target ends with an empty cube.
+        :returns a result with err 0 on success. 1 if the mapping is invalid, pooled contents do not fit into
+          a target cube, or a target that would receive contents lacks a Horadric Cube. Nothing has been altered then."""
+        res = OpResult('permute_horadric')
+        n = len(self.data_all)
+        if any([not ((0 <= j < n) and (0 <= k < n)) for j, k in mapping.items()]):
+            res.warn(f"Invalid Horadric permutation {mapping} for {n} characters.", err=1)
+            return res
+        contents = [Item(data.data).get_cube_contents() for data in self.data_all]  # type: List[List[Item]]
+        sources_by_target = [list() for _ in range(n)]  # type: List[List[int]]
+        for j in range(n):
+            sources_by_target[mapping.get(j, j)].append(j)
+        contents_new = dict()  # type: Dict[int, List[Item]]
+        for k in range(n):
+            sources = sources_by_target[k]
+            if sources == [k]:
+                continue  # << Keeps its own cube.
+            if len(sources) == 1:
+                contents_new[k] = contents[sources[0]]
+                continue
+            items = self.arrange_horadric(self.data_all[k], [item for j in sources for item in contents[j]])
+            if items is None:
+                res.warn(f"The pooled cube contents of {[self.data_all[j].get_name(True) for j in sources]} do not fit into the cube of {self.data_all[k].get_name(True)}.", err=1)
+                return res
+            contents_new[k] = items
+        lacking = [self.data_all[k].get_name(True) for k, items in contents_new.items() if items and not self.data_all[k].has_horadric_cube]
+        if lacking:
+            res.warn(f"Target characters {lacking} lack a Horadric Cube to receive the contents.", err=1)
+            return res
+        for k, items in contents_new.items():
+            self.splice_player_items(self.data_all[k], contents[k], items)
+            res.n_items_moved += len(items)
+        self.save_all([self.data_all[k] for k in sorted(contents_new)], res)
+        res.messages.append(f"Horadric permutation complete. {len(contents_new)} cubes have been altered.")
+        return res
+
+    @staticmethod
+    def arrange_horadric(data: Data, items: List[Item]) -> Optional[List[Item]]:
+        """Places pooled cube items into the emptied cube of data, first fit. Socketed items follow their parents.
+        :returns the items, as copies with new positions. None, if they do not fit."""
+        smap = '0' * (E_ItemStorage.IS_CUBE.size[0] * E_ItemStorage.IS_CUBE.size[1])
+        n_x = E_ItemStorage.IS_CUBE.size[1]
+        res = list()  # type: List[Item]
+        for item in items:
+            bts = item.data_item
+            item = Item(bts, 0, len(bts))
+            if item.item_parent != E_ItemParent.IP_ITEM:
+                coords = data.find_space_for_item(item, E_ItemStorage.IS_CUBE, smap)
+                if coords is None:
+                    return None
+                item.row, item.col = coords
+                for j in range(item.volume[0]):
+                    for k in range(item.volume[1]):
+                        index = (coords[0] + j) * n_x + coords[1] + k
+                        smap = smap[:index] + '1' + smap[(index + 1):]
+            res.append(item)
+        return res
 
-    def exchange_horadric(self) -> int:
+    @staticmethod
+    def splice_player_items(data: Data, items_old: List[Item], items_new: List[Item]):
+        """Replaces the player items items_old (e.g., the cube contents) of data by items_new, in one splice of the
+        player item block. New items go to the front of the block, like Data.add_items_to_player(..) would put them."""
+        layout = data.block_layout
+        index0, index1 = layout.index[E_ItemBlock.IB_PLAYER]
+        parts = list()  # type: List[bytes]
+        index = index0
+        for item in sorted(items_old, key=lambda x: x.index_start):
+            parts.append(data.data[index:item.index_start])
+            index = item.index_end
+        parts.append(data.data[index:index1])
+        count_old = sum([1 for item in items_old if item.item_parent != E_ItemParent.IP_ITEM])
+        count_new = sum([1 for item in items_new if item.item_parent != E_ItemParent.IP_ITEM])
+        bts = b''.join([item.data_item for item in items_new] + parts)
+        data.data = layout.splice(E_ItemBlock.IB_PLAYER, index0, index1, bts, count_new - count_old)
+
+    def route_items(self, selector: ItemSelector, targets: List[int], storages: List[E_ItemStorage]) -> OpResult:
+        """Moves the selected items of all source characters into the storages of the target characters. Sources are
+        all of self.data_all that are not targets. Items are placed first fit, trying the targets in order, and for
+        each target its storages in order. Socketed items move with their parents. The Horadric Cube itself is never
+        routed, as its contents would be stranded. Targets lacking a Horadric Cube are skipped for IS_CUBE.
+        Every character is parsed once. Placements are computed in memory, against storage maps that are parsed
+        once per target. Then every altered character gets one splice, and (if standalone) all of them are written
+        behind one durability barrier.
+        :param targets: Indices of the target characters within self.data_all.
+        :param storages: Target storages, in order of preference.
+        :returns a result, holding as value the items that could not be placed, as (source index, item). They remain
+          with their sources."""
+        res = OpResult('route_items')
+        sources = [j for j in range(len(self.data_all)) if j not in targets]
+        # > Selection: Stored items with their socketed children. ----------
+        selected = list()  # type: List[Tuple[int, List[Item]]]
+        n_boxes = 0
+        for j in sources:
+            unit = None  # type: Optional[List[Item]]
+            for item in Item(self.data_all[j].data).get_block_items(E_ItemBlock.IB_PLAYER):
+                if item.item_parent == E_ItemParent.IP_ITEM:
+                    if unit is not None:
+                        unit.append(item)
+                    continue
+                unit = [item] if selector.matches(item) else None
+                if (unit is not None) and (item.type_code == 'box'):
+                    unit = None  # << The contents of the Horadric Cube would be left behind.
+                    n_boxes += 1
+                if unit is not None:
+                    selected.append((j, unit))
+        if n_boxes:
+            res.warn(f"Skipped {n_boxes} selected Horadric Cubes. Use --permute_horadric to move cubes with their contents.")
+        # < ----------------------------------------------------------
+        # > Placement. -----------------------------------------------
+        smaps = dict()  # type: Dict[Tuple[int, E_ItemStorage], str]
+        storages_by_target = dict()  # type: Dict[int, List[E_ItemStorage]]
+        for k in targets:
+            has_cube = self.data_all[k].has_horadric_cube
+            storages_by_target[k] = [storage for storage in storages if has_cube or (storage != E_ItemStorage.IS_CUBE)]
+            for storage in storages_by_target[k]:
+                smaps[(k, storage)] = self.data_all[k].get_storage_occupation_maps(storage)
+        items_removed = {j: list() for j in sources}  # type: Dict[int, List[Item]]
+        items_added = {k: list() for k in targets}  # type: Dict[int, List[Item]]
+        unplaced = list()  # type: List[Tuple[int, Item]]
+        for j, unit in selected:
+            parent = unit[0]
+            placement = None  # type: Optional[Tuple[int, E_ItemStorage, Tuple[int, int]]]
+            for k in targets:
+                for storage in storages_by_target[k]:
+                    coords = self.data_all[k].find_space_for_item(parent, storage, smaps[(k, storage)])
+                    if coords is not None:
+                        placement = (k, storage, coords)
+                        break
+                if placement is not None:
+                    break
+            if placement is None:
+                unplaced.append((j, parent))
+                continue
+            k, storage, (row, col) = placement
+            copies = [Item(item.data_item, 0, len(item.data_item)) for item in unit]
+            copies[0].row, copies[0].col, copies[0].stash_type = row, col, storage
+            smap = smaps[(k, storage)]
+            n_x = storage.size[1]
+            for y in range(row, row + parent.volume[0]):
+                smap = smap[:(y * n_x + col)] + '1' * parent.volume[1] + smap[(y * n_x + col + parent.volume[1]):]
+            smaps[(k, storage)] = smap
+            items_removed[j] += unit
+            items_added[k] += copies
+        # < ----------------------------------------------------------
+        data_changed = list()  # type: List[Data]
+        for j, items in list(items_removed.items()) + list(items_added.items()):
+            if items:
+                self.splice_player_items(self.data_all[j], items if j in items_removed else list(), items if j in items_added else list())
+                data_changed.append(self.data_all[j])
+        for j, item in unplaced:
+            res.warn(f"Unable to place {item.type_code} ({item.quality}) of {self.data_all[j].get_name(True)}. It stays where it is.")
+        self.save_all(data_changed, res)
+        res.n_items_moved = sum([len(x) for x in items_added.values()])
+        res.messages.append(f"Routed {res.n_items_moved} items into {len([k for k in targets if items_added[k]])} characters. {len(unplaced)} items could not be placed.")
+        res.value = unplaced
+        return res
+
+    @staticmethod
+    def parse_permutation(code: str, n: int) -> Dict[int, int]:
+        """:param code: 'rotate', or comma separated 'i:j', meaning: The cube of the i-th character goes to the j-th.
+          1-based, in order of the pfnames. E.g. '1:2,2:3,3:1' (rotation) or '2:1,3:1' (pooling into the first).
+        :returns the 0-based mapping for permute_horadric(..).
+        :raises ValueError on syntax errors."""
+        if code == 'rotate':
+            return {j: (j + 1) % n for j in range(n)}
+        mapping = dict()  # type: Dict[int, int]
+        for part in code.split(','):
+            source, target = part.split(':')
+            mapping[int(source) - 1] = int(target) - 1
+        return mapping
+
+    def exchange_horadric(self) -> OpResult:
         if not len(self.data_all) == 2:
-            _log.warning("The Horadric Exchange requires two Character files precisely!")
-            return 1
-        horadric0 = self.grep_horadric(self.data_all[0])
-        horadric1 = self.grep_horadric(self.data_all[1])
-        self.insert_horadric(self.data_all[0], horadric1)
-        self.insert_horadric(self.data_all[1], horadric0)
-        print("Horadric exchange complete.")
-        return 0
+            res = OpResult('exchange_horadric')
+            res.warn("The Horadric Exchange requires two Character files precisely!", err=1)
+            return res
+        res = self.permute_horadric({0: 1, 1: 0})
+        res.operation = 'exchange_horadric'
+        if not res.err:
+            res.messages.append("Horadric exchange complete.")
+        return res
 
     @staticmethod
-    def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
+    def parse_arguments(args: Optional[List[str]] = None, *, exit_on_error: bool = True) -> argparse.Namespace:
+        """:param exit_on_error: If False, invalid arguments raise ValueError, instead of printing the usage and exiting.
+        :returns the parsed arguments."""
         if args is None:
             args = sys.argv[1:]
         desc = """Tool script for doing small scale changes to Diablo II .d2s save game files.
@@ -4143,11 +6349,34 @@ Apply this script to both their .d2s files, using the --exchange flag. Then this
 both files thus, that the Horadric Cube contents of both players switch places."""
         epilog = f"""Example call:
 $ python3 {Path(sys.argv[0]).name} --info conan.d2s ormaline.d2s"""
-        parser = argparse.ArgumentParser(prog='horazons_folly.py', description=desc, epilog=epilog, formatter_class=RawTextHelpFormatter)
+        parser = argparse.ArgumentParser(prog='horazons_folly.py', description=desc, epilog=epilog, formatter_class=RawTextHelpFormatter, exit_on_error=exit_on_error)
         parser.add_argument('--omit_backup', action='store_true',
             help="Per default, target files will be back-upped to .backup files. For safety. This option will disable that safety.")
         parser.add_argument('--pfname_backup', type=str, help='State a pfname to the backup file. Per default a timestamped name will be used. If there are multiple files to backup, the given name will be prefixed with each character\'s name.')
+        parser.add_argument('--backup_store', type=str, help="Back up into the deduplicating store in this directory instead of writing loose .backup files. Identical states are stored once.")
+        parser.add_argument('--dry_run', '--dry-run', action='store_true', help="Apply all requested operations to in-memory copies only. Report per file the altered fields, the items added, removed and moved, the size delta and the new checksum. Writes nothing, not even backups. Works with --batch, too.")
+        parser.add_argument('--transaction', action='store_true', help="Apply all requested operations in memory first. Then write each altered file once, atomically. If any operation fails, no file is written at all.")
+        parser.add_argument('--job', type=str, help="Run the JSON job file of this pfname: Steps of operations over named characters, e.g.\n"
+                            '{"characters": {"A": "a.d2s", "B": "b.d2s"}, "steps": [{"character": "A", "save_horadric": "a.cube"}, {"character": "B", "load_horadric": "a.cube"}, {"character": "B", "regrade_horadric": true}]}\n'
+                            "Each file is read once and written once, after all steps have succeeded. Replaces the pfnames.")
+        parser.add_argument('--job_report', type=str, default='-', help="With --job: Write the JSON report of per-step timings to this pfname. Default: '-', for stdout.")
+        parser.add_argument('--serve', type=str, help="Run as local daemon, serving JSON-RPC requests on the Unix socket of this pfname. Keeps tables and recently used saves parsed. See class HoradricServer for the methods. Backup arguments apply to every altering request.")
+        parser.add_argument('--serve_cache', type=int, default=32, help="With --serve: Number of parsed saves to keep.")
+        parser.add_argument('--roster', type=str, help="Report the info of every .d2s file in this directory, or matching this glob pattern, parsed by a pool of processes. Each report is written as soon as it is ready. Replaces the pfnames.")
+        parser.add_argument('--roster_workers', type=int, default=0, help="With --roster: Number of worker processes. Default: One per CPU.")
+        parser.add_argument('--roster_out', type=str, help="With --roster: Write one '<fname>.txt' per file into this directory instead of to stdout.")
+        parser.add_argument('--roster_ordered', action='store_true', help="With --roster: Write the reports in order of pfnames, rather than in order of completion.")
+        parser.add_argument('--batch', type=str, help="Apply the requested operations to every .d2s file in this directory, or matching this glob pattern, using a pool of processes. Each file is written once. Replaces the pfnames.")
+        parser.add_argument('--batch_workers', type=int, default=0, help="With --batch: Number of worker processes. Default: One per CPU.")
+        parser.add_argument('--batch_summary', type=str, default='-', help="With --batch: Write the JSON summary of per-file results and errors to this pfname. Default: '-', for stdout.")
+        parser.add_argument('--backup_archive', type=str, help="Append backups to compressed, indexed per-character archives in this directory instead of writing loose .backup files.")
+        parser.add_argument('--gc_backups', '--gc-backups', type=str, help=f"With --backup_store: Prune backups by this retention policy. 'default' is '{RetentionPolicy.spec_default}': Keep all from the last day, hourly for a week, daily for a month. The newest backup of each character is always kept.")
+        parser.add_argument('--backup_delta', type=int, default=0, help="With --backup_store: Store only every n-th backup of a character in full, and binary diffs against the previous state in between.")
         parser.add_argument('--exchange_horadric', action='store_true', help="Flag. Requires that there are precisely 2 character pfnames given. This will exchange their Horadric Cube contents.")
+        parser.add_argument('--permute_horadric', type=str, help="Redistribute the Horadric Cube contents among all given characters at once. 'rotate' passes each cube on to the next character (the last one's to the first). Else comma separated 'i:j', meaning: The cube of the i-th character goes to the j-th. E.g. '1:2,2:3,3:1'. Several cubes going to one character are pooled, if they fit.")
+        parser.add_argument('--route_items', type=str, help="Move the selected stored items of all source characters into the target characters. Selection by ';' separated criteria, e.g. 'type=rin,amu;quality=unique,set;storage=stash'. An empty string selects all stored items. Items that do not fit stay where they are.")
+        parser.add_argument('--route_targets', type=str, help="With --route_items: Comma separated 1-based indices of the target characters among the pfnames. All others are sources. Default: The last pfname.")
+        parser.add_argument('--route_storage', type=str, default='stash,inventory,cube', help="With --route_items: Target storages, in order of preference. Default: 'stash,inventory,cube'.")
         parser.add_argument('--create_rune_cube', type=str, nargs='?', const='enigmatic_rune_cube.cube:jah,ith,ber', help="pfname, ':', then a comma separated list of up to 12 rune names and/or gem codes, /[tasredb][0-4]/. Creates a cube content with these runes and socketables.")
         parser.add_argument('--drop_horadric', action='store_true', help="Flag. If given, the Horadric Cube contents of the targeted character will be removed.")
         parser.add_argument('--save_horadric', type=str, help="Write the items found in the Horadric Cube to disk with the given pfname. Only one character allowed.")
@@ -4180,10 +6409,22 @@ $ python3 {Path(sys.argv[0]).name} --info conan.d2s ormaline.d2s"""
         parser.add_argument('--set_quests', type=str, help="Set quests as optional prefix /INDEX_DIFFICULTY-/ and bitmap /.{27}/ where 0/1 means reset/completed and everything else is ignored.")
         parser.add_argument('--personalize', type=str,help="Personalize the extended items within the Horadric Cube, using the given string that would be a valid character name.")
         parser.add_argument('--depersonalize', action='store_true', help="Remove personalization from extended items within the Horadric Cube.")
+        parser.add_argument('--startup_report', '--startup-report', type=str, help="Time module import, table loading, argument parsing and first file read. Write the seconds per phase as JSON to the given pfname. '-' for stdout.")
         parser.add_argument('pfnames', nargs='*', type=str, help='List of path and filenames to target .d2s character files.')
-        parsed = parser.parse_args(args)  # type: argparse.Namespace
+        if exit_on_error:
+            parsed = parser.parse_args(args)  # type: argparse.Namespace
+        else:
+            try:
+                parsed, args_unknown = parser.parse_known_args(args)
+            except argparse.ArgumentError as e:
+                raise ValueError(str(e))
+            if args_unknown:
+                raise ValueError(f"Unrecognized arguments: {' '.join(args_unknown)}")
         return parsed
 
+t_import_end = time.perf_counter()  # << For --startup_report.
+
 if __name__ == '__main__':
     hor = Horadric()
-    print("Done.")
+    if not hor.is_stdout_json:
+        print("Done.")
@@ -30,7 +30,10 @@ from __future__ import annotations
 
 import os
 import re
+import gc
+import marshal
 import logging
+import threading
 import argparse
 #from Tools.i18n.pygettext import is_literal_string
 from collections import OrderedDict as odict
@@ -39,12 +42,16 @@ from numbers import Number
 from pathlib import Path
 from math import ceil, floor
 from shutil import which
-from typing import List, Dict, Optional, Union, Tuple, OrderedDict, Any
+from typing import List, Dict, Optional, Union, Tuple, OrderedDict, Any, Sequence, Callable
 from enum import Enum
 
 
 # > Config.sys. ------------------------------------------------------
 pfname_mods_tsv = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'mods.tsv'))
+# Build-once cache of the parsed static tables. Regenerated automatically whenever a source .tsv changes.
+# If this ends with '.py', the snapshot is a generated Python module instead of a marshal file. None disables it.
+# If this location is not writable (e.g., a system-wide installation), the user's cache directory is used instead.
+pfname_tables_snapshot = str(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'tables.snapshot'))  # type: Optional[str]
 # < ------------------------------------------------------------------
 
 
@@ -115,6 +122,142 @@ redundant_skills = {
 }
 
 
+class TableSnapshot:
+    """Build-once cache of parsed static tables (mods.tsv here, item_codes.tsv and armor_weapons.tsv in
+    horazons_folly.py). All tables share a single snapshot file, so that a cold start costs one file read.
+    Each table is stored as plain marshal-friendly data under its name, keyed by size, mtime and hash of its
+    source .tsv. Stale or missing tables are rebuilt from source and the snapshot is rewritten.
+    The snapshot lives next to this module, or in the user's cache directory, if that is not writable. See
+    get_pfnames_default()."""
+    version = 2
+    """Bump this whenever the stored representation of any table changes."""
+    lock = threading.RLock()
+    cache = None  # type: Optional[Dict[str, Any]]
+    """In-memory copy of the snapshot. Read on first use."""
+
+    @staticmethod
+    def get_source_key(pfname: str) -> Tuple[int, int]:
+        """:returns (size, mtime in ns) of the given file. (-1, -1) if it does not exist."""
+        try:
+            stat = os.stat(pfname)
+        except OSError:
+            return -1, -1
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def get_source_hash(pfname: str) -> str:
+        """:returns the sha1 hex digest of the given file's content. Empty string if it cannot be read."""
+        import hashlib  # << Only needed for stale snapshots. Not worth its import time on every start.
+        try:
+            with open(pfname, 'rb') as IN:
+                return hashlib.sha1(IN.read()).hexdigest()
+        except OSError:
+            return ''
+
+    @staticmethod
+    def get_pfnames_default() -> List[str]:
+        """:returns the default snapshot locations, in order of preference: pfname_tables_snapshot, then the same
+        file name within the user's cache directory. Empty, if pfname_tables_snapshot is None."""
+        if pfname_tables_snapshot is None:
+            return list()
+        pname_cache = os.environ.get('LOCALAPPDATA' if os.name == 'nt' else 'XDG_CACHE_HOME')
+        if not pname_cache:
+            pname_cache = os.path.join(os.path.expanduser('~'), '.cache')
+        return [pfname_tables_snapshot, os.path.join(pname_cache, 'horadric_exchange', os.path.basename(pfname_tables_snapshot))]
+
+    @staticmethod
+    def read(pfname: Optional[str] = None) -> Dict[str, Any]:
+        """Reads a snapshot file. Either marshal, or a generated Python module, if pfname ends with '.py'.
+        :param pfname: Defaults to the most recently written usable one of get_pfnames_default().
+        :returns the snapshot dict. Empty, if there is no usable snapshot."""
+        if pfname is None:
+            pfnames = [pfname for pfname in TableSnapshot.get_pfnames_default() if os.path.isfile(pfname)]
+            for pfname in sorted(pfnames, key=os.path.getmtime, reverse=True):
+                res = TableSnapshot.read(pfname)
+                if res:
+                    return res
+            return dict()
+        if not os.path.isfile(pfname):
+            return dict()
+        try:
+            if pfname.endswith('.py'):
+                import importlib.util
+                spec = importlib.util.spec_from_file_location('tables_snapshot', pfname)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                res = module.snapshot
+            else:
+                with open(pfname, 'rb') as IN:
+                    bts = IN.read()
+                # [Note: Bulk-creating many small containers triggers needless cyclic garbage collection runs.]
+                is_gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    res = marshal.loads(bts)
+                finally:
+                    if is_gc_enabled:
+                        gc.enable()
+        except Exception as err:
+            _log.warning(f"Ignoring unreadable table snapshot '{pfname}': {err}")
+            return dict()
+        if (not isinstance(res, dict)) or res.get('version') != TableSnapshot.version:
+            return dict()
+        return res
+
+    @staticmethod
+    def write(snapshot: Dict[str, Any], pfname: Optional[str] = None) -> bool:
+        """Writes the snapshot atomically. Failure (e.g., a read-only installation) is no crime, merely slower.
+        :param pfname: Defaults to the first writable one of get_pfnames_default().
+        :returns True if and only if writing succeeded."""
+        if pfname is None:
+            # [Note: any(..) stops at the first location written.]
+            return any(TableSnapshot.write(snapshot, pfname) for pfname in TableSnapshot.get_pfnames_default())
+        pfname_tmp = f"{pfname}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(pfname), exist_ok=True)
+            if pfname.endswith('.py'):
+                with open(pfname_tmp, 'w') as OUT:
+                    OUT.write('"""Generated by incubus.TableSnapshot. Do not edit. Rebuilt whenever a source .tsv changes."""\n')
+                    OUT.write(f"snapshot = {snapshot!r}\n")
+            else:
+                with open(pfname_tmp, 'wb') as OUT:
+                    marshal.dump(snapshot, OUT)
+            os.replace(pfname_tmp, pfname)
+        except OSError as err:
+            _log.debug(f"Failure to write table snapshot '{pfname}': {err}")
+            try:
+                os.remove(pfname_tmp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    @staticmethod
+    def get(name: str, pfname_source: str, build: Callable[[], Any]) -> Any:
+        """:param name: Name of the table within the snapshot. E.g., 'mods'.
+        :param pfname_source: The .tsv file the table is parsed from.
+        :param build: Parses the table from pfname_source and returns it as marshal-friendly data.
+        :returns the table data. From the snapshot if it is current, else freshly built (and stored). Thread-safe."""
+        with TableSnapshot.lock:
+            if TableSnapshot.cache is None:
+                TableSnapshot.cache = TableSnapshot.read()
+                TableSnapshot.cache['version'] = TableSnapshot.version
+            snapshot = TableSnapshot.cache
+            size, mtime = TableSnapshot.get_source_key(pfname_source)
+            entry = snapshot.get(name)  # type: Optional[Dict[str, Any]]
+            if (entry is not None) and (entry['size'], entry['mtime']) == (size, mtime):
+                return entry['data']
+            sha1 = TableSnapshot.get_source_hash(pfname_source)
+            if (entry is not None) and entry['size'] == size and entry['sha1'] == sha1:
+                # [Note: Touched, but unaltered. E.g., by a fresh checkout. Merely refreshing the key.]
+                entry['mtime'] = mtime
+            else:
+                entry = {'size': size, 'mtime': mtime, 'sha1': sha1, 'data': build()}
+                snapshot[name] = entry
+            TableSnapshot.write(snapshot)
+            return entry['data']
+
+
 class E_ColumnType(Enum):
     CT_NO = 0
     CT_NAME = 1
@@ -139,11 +282,255 @@ class E_StateMod(Enum):
     SM_INVALID_VALUE = 2
 
 
+class ParamDecoder:
+    """Precompiled form of a single modification parameter template, like '>6i50'. Built once per mods.tsv row
+    parameter, so that decoding a mod is merely a sequence of width reads."""
+    cache_ids_by_name = dict()  # type: Dict[str, Dict[str, int]]
+    """Reverse lookups of lower case skill ('s') and class ('c') names to their ids. For encoding. Filled on demand."""
+
+    def __init__(self, param: str, label: str = ''):
+        """:param param: A mod parameter like '>6i50'. See ./doc/general_science/readme_mods.txt for details.
+        :param label: The matching label column from mods.tsv. E.g., ',%'. Prefix and suffix are split at the comma."""
+        code = ModificationParameter.parse(param)
+        if code is None:
+            raise ValueError(f"Invalid modification parameter '{param}' encountered.")
+        self.param = param  # type: str
+        self.n_bits = code['n_bits']  # type: int
+        self.tp = code['tp']  # type: str
+        self.offset = code['offset']  # type: int
+        self.relation = code['relation']  # type: str
+        self.literal = None if code['literal'] is None else ModificationParameter.binary2int(code['literal'])  # type: Optional[int]
+        prefix_suffix = label.split(',', 1)
+        if len(prefix_suffix) < 2:
+            prefix_suffix.append('')
+        self.prefix = prefix_suffix[0]  # type: str
+        self.suffix = prefix_suffix[1]  # type: str
+
+    def to_snapshot(self) -> Tuple[str, int, str, int, str, Optional[int], str, str]:
+        """:returns this decoder as marshal-friendly tuple. For the table snapshot."""
+        return self.param, self.n_bits, self.tp, self.offset, self.relation, self.literal, self.prefix, self.suffix
+
+    @staticmethod
+    def from_snapshot(entry: Tuple[str, int, str, int, str, Optional[int], str, str]) -> ParamDecoder:
+        """Inverse of to_snapshot(..). Skips parsing the parameter template."""
+        res = ParamDecoder.__new__(ParamDecoder)
+        res.param, res.n_bits, res.tp, res.offset, res.relation, res.literal, res.prefix, res.suffix = entry
+        return res
+
+    def decode(self, raw: int) -> Optional[Union[int, float]]:
+        """Translates a raw little endian read of self.n_bits into an in-game value. Skill and class ids are returned raw."""
+        if self.literal is not None:
+            return self.literal
+        elif self.tp == 'i':
+            return raw - self.offset
+        elif self.tp == 'f':
+            return float(raw) / (2 ** self.offset)
+        elif self.tp in ('s', 'c'):
+            return raw
+        return None
+
+    @staticmethod
+    def get_ids_by_name(tp: str) -> Dict[str, int]:
+        """:param tp: 's' for skills, 'c' for classes.
+        :returns a dict mapping lower case names to ids. Empty for other types."""
+        if tp not in ParamDecoder.cache_ids_by_name:
+            if tp == 's':
+                names = [(j, ModificationParameter.get_name_skill(j)) for j in range(512)]
+                res = {name.lower(): j for j, name in names if name != 'no skill' and not name.startswith('unknown')}
+            elif tp == 'c':
+                res = {ModificationParameter.get_name_class(j).lower(): j for j in range(7)}
+            else:
+                res = dict()
+            ParamDecoder.cache_ids_by_name[tp] = res
+        return ParamDecoder.cache_ids_by_name[tp]
+
+    @property
+    def range(self) -> Tuple[int, int]:
+        """:returns the valid range of raw values for this parameter."""
+        if self.literal is not None:
+            return self.literal, self.literal
+        return 0, (1 << self.n_bits) - 1
+
+    def encode(self, val: Optional[Union[int, float, str]]) -> int:
+        """Inverse of decode(..). Translates an in-game value into the raw value to be stored in self.n_bits.
+        :param val: In-game value. Skills and classes may also be given by name. None is admissible for literals only.
+          Fractional values are rounded to the nearest step for 'f' parameters, and rejected for all others.
+        :returns the raw value.
+        :raises ValueError if val does not fit this parameter."""
+        if self.literal is not None:
+            if (val is not None) and (val != self.literal):
+                raise ValueError(f"Parameter '{self.param}' is the literal '{self.literal}'. Cannot set it to '{val}'.")
+            return self.literal
+        elif val is None:
+            raise ValueError(f"Parameter '{self.param}' requires a value.")
+        elif isinstance(val, str):
+            lookup = ParamDecoder.get_ids_by_name(self.tp)
+            if val.lower() not in lookup:
+                raise ValueError(f"Parameter '{self.param}' does not know a skill or class named '{val}'.")
+            raw = lookup[val.lower()]
+        elif self.tp == 'f':
+            raw = round((2 ** self.offset) * val)
+        elif val != int(val):
+            raise ValueError(f"Parameter '{self.param}' requires an integer value, not '{val}'.")
+        elif self.tp == 'i':
+            raw = int(val) + self.offset
+        else:
+            raw = int(val)
+        if not (0 <= raw < (1 << self.n_bits)):
+            raise ValueError(f"Value '{val}' is out of range for parameter '{self.param}'.")
+        return raw
+
+    def is_relation_ok(self, raw: int, raw_prior: Optional[int]) -> bool:
+        """:returns True if and only if the raw value satisfies this parameter's relation to the preceding raw value."""
+        if (not self.relation) or (raw_prior is None):
+            return True
+        elif self.relation == '=':
+            return raw == raw_prior
+        elif self.relation == '>':
+            return raw >= raw_prior
+        raise ValueError(f"Unsupported relation symbol '{self.relation}' encountered.")
+
+    def to_str(self, raw: int) -> str:
+        """:returns the human-readable, labelled value. E.g., '+(12)%'."""
+        if self.tp == 's':
+            value = '(' + ModificationParameter.get_name_skill(raw) + ')'
+        elif self.tp == 'c':
+            value = '(' + ModificationParameter.get_name_class(raw) + ')'
+        else:
+            value = f'({self.decode(raw)})'
+        return self.prefix + value + self.suffix
+
+    def __str__(self) -> str:
+        return self.param
+
+
+class ModSpec:
+    """Precompiled mods.tsv row. Holds the decoders for all parameters of one modification."""
+    def __init__(self, id_mod: int, name: str, params: Tuple[ParamDecoder, ...], line: Dict[E_ColumnType, str]):
+        self.id_mod = id_mod  # type: int
+        self.name = name  # type: str
+        self.params = params  # type: Tuple[ParamDecoder, ...]
+        self.line = line  # type: Dict[E_ColumnType, str]
+        self.n_bits = 9 + sum([param.n_bits for param in params])  # type: int
+        """Total bit width of this mod, including its 9-bit id."""
+
+    def encode(self, values: Sequence[Optional[Union[int, float, str]]]) -> int:
+        """Translates in-game values into this mod's packed bits, id included. Bit j of the result is the j-th bit.
+        :param values: One value per parameter. Literal parameters may be omitted entirely, or be passed as None.
+        :returns the packed mod of length self.n_bits.
+        :raises ValueError if the values do not fit the parameters or violate their relations."""
+        params = self.params
+        if len(values) != len(params):
+            params = [param for param in params if param.literal is None]
+            if len(values) != len(params):
+                raise ValueError(f"Mod '{self.name}' expects {len(self.params)} values, or {len(params)} without literals. Got {len(values)}.")
+            values = iter(values)
+            values = [None if param.literal is not None else next(values) for param in self.params]
+        res = self.id_mod
+        index = 9
+        raw_prior = None  # type: Optional[int]
+        for param, val in zip(self.params, values):
+            raw = param.encode(val)
+            if not param.is_relation_ok(raw, raw_prior):
+                raise ValueError(f"Value '{val}' of mod '{self.name}' violates relation '{param.relation}' of parameter '{param.param}' to its predecessor.")
+            res |= raw << index
+            index += param.n_bits
+            raw_prior = raw
+        return res
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.id_mod}): {', '.join([str(param) for param in self.params])}"
+
+
 class TableMods:
     """Wrapper class for the mods.tsv content. For easy access to core features."""
-    def __init__(self, pfname: Optional[str] = None):
+    def __init__(self, pfname: Optional[str] = None, data: Optional[Dict[str, Dict[E_ColumnType, str]]] = None,
+                 compiled: Optional[List[Optional[ModSpec]]] = None):
+        """:param pfname: mods.tsv file to be read. Defaults to pfname_mods_tsv.
+        :param data: Already read mods.tsv content, as returned by read_mods_tsv(..). If given, pfname is not read.
+        :param compiled: Already compiled data, as returned by compile(..). If given, data is not compiled again."""
         self.pfname = pfname
-        self.data = TableMods.read_mods_tsv(pfname)
+        self.data = TableMods.read_mods_tsv(pfname) if data is None else data
+        self.compiled = TableMods.compile(self.data) if compiled is None else compiled  # type: List[Optional[ModSpec]]
+        """512 entries, indexed by integer mod id. None for ids that are unknown to mods.tsv."""
+        self.compiled_by_name = dict()  # type: Dict[str, Optional[ModSpec]]
+        """Lower case mod names to ModSpecs. None for names that are ambiguous in mods.tsv."""
+        for spec in self.compiled:
+            if spec is not None:
+                key = spec.name.lower()
+                self.compiled_by_name[key] = None if key in self.compiled_by_name else spec
+
+    @staticmethod
+    def load(pfname: Optional[str] = None) -> TableMods:
+        """:returns a TableMods from the given mods.tsv. Via TableSnapshot, so that a current snapshot saves parsing
+        the rows as well as compiling them."""
+        if not pfname:
+            pfname = pfname_mods_tsv
+        rows, specs = TableSnapshot.get('mods', pfname, lambda: TableMods.to_snapshot(TableMods.read_mods_tsv(pfname)))
+        data = TableMods.snapshot2data(rows)
+        compiled = [None] * 512  # type: List[Optional[ModSpec]]
+        for id_int, id_mod, name, params in specs:
+            compiled[id_int] = ModSpec(id_int, name, tuple([ParamDecoder.from_snapshot(param) for param in params]), data[id_mod])
+        return TableMods(pfname, data, compiled)
+
+    @staticmethod
+    def to_snapshot(data: Dict[str, Dict[E_ColumnType, str]]) -> Tuple[Dict[str, Dict[int, str]], List[Tuple[int, str, str, List[Tuple]]]]:
+        """:returns the rows (see data2snapshot(..)) and their compiled ModSpecs (see compile(..)), as marshal-friendly
+        data. The latter as (integer id, id string, name, parameters as of ParamDecoder.to_snapshot())."""
+        specs = [(spec.id_mod, spec.line[E_ColumnType.CT_ID], spec.name, [param.to_snapshot() for param in spec.params])
+                 for spec in TableMods.compile(data) if spec is not None]
+        return TableMods.data2snapshot(data), specs
+
+    @staticmethod
+    def data2snapshot(data: Dict[str, Dict[E_ColumnType, str]]) -> Dict[str, Dict[int, str]]:
+        """:returns data in marshal-friendly form. Column types are replaced by their int values."""
+        return {id_mod: {key.value: data[id_mod][key] for key in data[id_mod]} for id_mod in data}
+
+    @staticmethod
+    def snapshot2data(data: Dict[str, Dict[int, str]]) -> Dict[str, Dict[E_ColumnType, str]]:
+        """Inverse of data2snapshot(..)."""
+        return {id_mod: {E_ColumnType(key): data[id_mod][key] for key in data[id_mod]} for id_mod in data}
+
+    @staticmethod
+    def compile(data: Dict[str, Dict[E_ColumnType, str]]) -> List[Optional[ModSpec]]:
+        """Compiles the rows as read by read_mods_tsv(..) into a list of 512 ModSpecs, indexed by integer mod id."""
+        res = [None] * 512  # type: List[Optional[ModSpec]]
+        keys_param = [E_ColumnType.CT_PARAM_0, E_ColumnType.CT_PARAM_1, E_ColumnType.CT_PARAM_2, E_ColumnType.CT_PARAM_3, E_ColumnType.CT_PARAM_4]
+        for id_mod in data:
+            line = data[id_mod]
+            params = list()  # type: List[ParamDecoder]
+            try:
+                for j in range(len(keys_param)):
+                    if not line[keys_param[j]]:
+                        break
+                    params.append(ParamDecoder(line[keys_param[j]], line[E_ColumnType(j + 3)]))
+            except ValueError as err:
+                _log.warning(f"Ignoring mod '{id_mod}' of invalid parameter: {err}")
+                continue
+            id_int = ModificationParameter.binary2int(id_mod)
+            res[id_int] = ModSpec(id_int, line[E_ColumnType.CT_NAME], tuple(params), line)
+        return res
+
+    def get_spec(self, id_mod: int) -> Optional[ModSpec]:
+        """:param id_mod: Integer modification id in 0..511.
+        :returns the compiled ModSpec for that id. Or None, if that id is unknown."""
+        return self.compiled[id_mod] if 0 <= id_mod < 512 else None
+
+    def get_spec_by_key(self, key: Union[int, str]) -> ModSpec:
+        """:param key: Integer modification id or the modification's name from mods.tsv (case-insensitive).
+        :returns the compiled ModSpec.
+        :raises ValueError if the mod is unknown or if its name is ambiguous."""
+        if isinstance(key, str):
+            if key.lower() not in self.compiled_by_name:
+                raise ValueError(f"Unknown modification '{key}'.")
+            spec = self.compiled_by_name[key.lower()]
+            if spec is None:
+                raise ValueError(f"Modification name '{key}' is ambiguous in mods.tsv. Please use its integer id.")
+            return spec
+        spec = self.get_spec(key)
+        if spec is None:
+            raise ValueError(f"Unknown modification id '{key}'.")
+        return spec
 
     @staticmethod
     def read_mods_tsv(pfname: Optional[str] = None) -> Dict[str, Dict[E_ColumnType, str]]:
@@ -268,7 +655,7 @@ class ModificationParameter:
             res['n_bits'] = int(groups_all[1]) if len(groups_all[1]) else 0
         res['tp'] = groups_all[2]
         res['offset'] = int(groups_all[3]) if len(groups_all[3]) else 0
-        ModificationParameter.cache_parsed['param'] = res
+        ModificationParameter.cache_parsed[param] = res
         return res
 
     @property
@@ -396,8 +783,7 @@ class ModificationParameter:
         if code is None:
             _log.warning(f"This ModificationParameter has no valid parameter to check against: '{self.param}'.")
             return False
-        regexp = '^[0-9]{' + str(code['n_bits']) + '}$'
-        is_fit = bool(re.match(regexp, binary))
+        is_fit = (len(binary) == code['n_bits']) and (binary.isdigit() or not binary)
         if is_fit and self.has_relation and (binary_prior is not None):
             if code['relation'] == '=':
                 is_fit = (int(binary[::-1], 2) == int(binary_prior[::-1], 2))
@@ -446,111 +832,167 @@ class ModificationParameter:
 class ModificationItem:
     """Small class for analyzing one specific modification. Like, e.g., oSkill Teleport +1:
       '100001100011011000100000' (i.e., 9-bit-id oskill: 100001100 Teleport: 011011000 "+1": 100000)
-    :param binary: Binary string describing an entire item modification set. Comprising ids and all attached parameters.
+    :param binary: Entire item modification set. Comprising ids and all attached parameters. Either as little endian
+      binary string, or as int whose bit j is the j-th bit of the modification set.
     :param index0: Starting index within binary this specific Modification Item is concerned with.
-    :param table_mods: Modification lookup table."""
-    def __init__(self, binary: str, index0: int, table_mods: TableMods):
-        self.binary = str(binary)
+    :param table_mods: Modification lookup table.
+    :param n_bits: Number of bits of binary. Mandatory if binary is an int (leading zeros are invisible in ints)."""
+    def __init__(self, binary: Union[str, int], index0: int, table_mods: TableMods, n_bits: Optional[int] = None):
+        if isinstance(binary, str):
+            if not bool(re.match("^[0-1]*$", binary)):
+                _log.error(f"Invalid binary source string '{binary}' encountered at index0 == '{index0}'. This hints at a bug in mods.tsv.")
+                binary = ''
+            n_bits = len(binary)
+            binary = int(binary[::-1], 2) if binary else 0
+        elif n_bits is None:
+            raise ValueError("Integer modification binaries require an explicit n_bits.")
+        self.value = binary  # type: int
+        self.n_bits = n_bits  # type: int
         self.index0 = index0
-        if (len(binary) < (9 + index0)) or not bool(re.match("^[0-1]+$", binary)):
-            _log.error(f"Invalid binary source string '{binary}' encountered at index0 == '{index0}'. This hints at a bug in mods.tsv.")
+        if n_bits < (9 + index0):
+            _log.error(f"Binary source of length '{n_bits}' is too short for a mod at index0 == '{index0}'. This hints at a bug in mods.tsv.")
         self.table_mods = table_mods
-        self.parsed = self.parse_parameters(self.binary, self.index0, self.table_mods)
+        self.parsed = self.parse_parameters(self.value, self.n_bits, self.index0, self.table_mods)
+
+    @property
+    def binary(self) -> str:
+        """:returns the entire modification set as little endian binary string. Rendered on demand."""
+        return ModificationSet.int2binary(self.value, self.n_bits)
+
+    @property
+    def id_mod_int(self) -> Optional[int]:
+        """:returns the 9-bit id of this mod as integer. None if there are not enough bits left."""
+        return None if self.n_bits < (9 + self.index0) else (self.value >> self.index0) & 0x1ff
 
     @property
     def id_mod(self) -> Optional[str]:
-        """:returns the id of this mod if such a """
-        return None if len(self.binary) < (9 + self.index0) else self.binary[self.index0:(9+self.index0)]
+        """:returns the id of this mod as little endian binary string. None if there are not enough bits left."""
+        id_mod = self.id_mod_int
+        return None if id_mod is None else ModificationSet.int2binary(id_mod, 9)
 
     @property
     def is_valid(self) -> bool:
         return True if (self.parsed is not None) and (self.parsed['is_valid']) else False
 
     @staticmethod
-    def parse_parameters(binary: str, index0: int, table: TableMods) -> Dict[str, Any]:
+    def parse_parameters(value: int, n_bits: int, index0: int, table: TableMods) -> Dict[str, Any]:
         """Attempts to parse the given binary into a list of parameters. If successful, this will describe an
         entire magical property.
-        :param binary: A little endian binary string describing a complete modification set.
+        :param value: Complete modification set as int. Bit j of value is the j-th bit of the set.
+        :param n_bits: Length of the modification set in bits.
         :param index0: Index within binary of the modification id we are interested in.
         :param table: Table of known modification specifications.
         :returns dict.
           'is_valid': bool. Was a known modification type found and could it be parsed?
           'index0': int. Repeats the given index0. I.e., the first bit of the 9-bit-long id for this mod.
           'index1': index within binary of the first entry beyond this modification item.
-            May be == len(binary) if this is the last item or if this modification could not be identified,
+            May be == n_bits if this is the last item or if this modification could not be identified,
             making it a residual (which is not valid).
-          'parameters': List of ModificationParameter. Will be empty if this not 'is_valid'.
-            Else will hold the entire list of ModificationParameters this item is concerned with."""
+          'spec': The compiled ModSpec of this mod. None if the id is unknown.
+          'n_bits_discovered': Parameter bit width of an unknown mod, as determined by ModificationSet.resync(..).
+            None if not applicable.
+          'parameters': List of 4-tuples (ParamDecoder, index0, index1, raw int value). Will be empty if this not
+            'is_valid'. Else will hold the entire list of parameters this item is concerned with, and where they are
+            sited in binary."""
         # [Note: Initializing as failure case, leading to a residual binary. Anything better needs to be earned.]
         res = {
             'is_valid': False,
             'index0': index0,
-            'index1': len(binary),
-            'parameters': list()  # type: List[ModificationParameter]
+            'index1': n_bits,
+            'spec': None,
+            'parameters': list(),  # type: List[Tuple[ParamDecoder, int, int, int]]
+            'n_bits_discovered': None
         }  # type: Dict[str, Any]
-        if len(binary) < (index0 + 9):
+        if n_bits < (index0 + 9):
             return res
-        id_mod = binary[index0:(index0 + 9)]
-        spec = table.get_line_by_id(id_mod)
+        spec = table.get_spec((value >> index0) & 0x1ff)
+        res['spec'] = spec
         if spec is None:
             return res
-        params = list()
-        index_prior = None
+        if n_bits < (index0 + spec.n_bits):
+            _log.error(f"Given binary is too short for mod '{spec.name}' of length '{spec.n_bits}' being sited at index '{index0}': '{ModificationSet.int2binary(value, n_bits)}'.")
+            return res
+        params = list()  # type: List[Tuple[ParamDecoder, int, int, int]]
+        raw_prior = None  # type: Optional[int]
         index_current = index0 + 9
-        for key in [E_ColumnType.CT_PARAM_0, E_ColumnType.CT_PARAM_1, E_ColumnType.CT_PARAM_2, E_ColumnType.CT_PARAM_3, E_ColumnType.CT_PARAM_4]:
-            if not spec[key]:
-                break
-            param = ModificationParameter(spec[key])
-            acceptable = param.set_indices(binary, index_current, index_prior)
-            if not acceptable:
+        for param in spec.params:
+            index_next = index_current + param.n_bits
+            raw = (value >> index_current) & ((1 << param.n_bits) - 1)
+            if not param.is_relation_ok(raw, raw_prior):
+                _log.error(f"Given binary '{ModificationSet.int2binary(raw, param.n_bits)}' at index0 '{index_current}' does not fit template '{param.param}.")
                 return res
-            params.append(param)
-            index_prior = index_current
-            index_current = param.index1
+            params.append((param, index_current, index_next, raw))
+            raw_prior = raw
+            index_current = index_next
         res['index1'] = index_current
         res['parameters'] = params
         res['is_valid'] = True
         return res
 
     def __str__(self) -> str:
-        spec = self.table_mods.get_line_by_id(self.id_mod)
+        spec = self.parsed['spec']  # type: Optional[ModSpec]
         if spec is None:
-            return f"Hitherto unknown modification[{self.parsed['index0']}:{self.parsed['index1']}] with id '{self.binary[self.parsed['index0']:(self.parsed['index0']+9)]}'."
-        res = f"{spec[E_ColumnType.CT_NAME]}[{self.parsed['index0']}:{self.parsed['index1']}]"
-        params = self.parsed['parameters']  # type: List[ModificationParameter]
+            id_mod = self.binary[self.parsed['index0']:(self.parsed['index0'] + 9)]
+            res = f"Hitherto unknown modification[{self.parsed['index0']}:{self.parsed['index1']}] with id '{id_mod}'"
+            if self.parsed['n_bits_discovered'] is not None:
+                res += f" of resynchronised parameter width {self.parsed['n_bits_discovered']}"
+            return res + "."
+        res = f"{spec.name}[{self.parsed['index0']}:{self.parsed['index1']}]"
+        params = self.parsed['parameters']  # type: List[Tuple[ParamDecoder, int, int, int]]
         if params:
             res += '('
             for j in range(len(params)):
-                param = params[j]
-                param_binary = self.binary[param.index0:param.index1]
-                if param.is_skill:
-                    value = '(' + param.get_name_skill(param_binary) + ')'
-                elif param.is_class:
-                    value = '(' + param.get_name_class(param_binary) + ')'
-                else:
-                    value = f'({param.bin2val_templated(param_binary)})'
-                prefix_suffix = spec[E_ColumnType(j + 3)].split(',', 1)
-                if len(prefix_suffix) < 2:
-                    prefix_suffix.append('')
-                value = prefix_suffix[0] + value + prefix_suffix[1]
+                param, index0, index1, raw = params[j]
+                value = param.to_str(raw)
                 if j > 0:
                     value = ', ' + value
-                res += str(param) + value
+                res += f"{param.param}[{index0}:{index1}]" + value
             res += ')'
         return res
 
+
 class ModificationSet:
     """Master class parsing a given Item's entire modification binary."""
-    cache_table_mods = TableMods()  # type: TableMods
+    cache_table_mods = None  # type: Optional[TableMods]
+    """Table of known mods. Loaded on first use. Access via get_table_mods()."""
+    lock_table_mods = threading.Lock()
+    cache_widths_discovered = dict()  # type: Dict[int, int]
+    """Integer ids of mods unknown to [1], mapped to the parameter bit width that resync(..) has confirmed for them."""
+    cache_widths_votes = dict()  # type: Dict[int, Dict[int, set]]
+    """Per unknown mod id and candidate width: Hashes of the distinct mod-sections that resynchronised with it."""
+    lock_widths = threading.Lock()
+    n_votes_confirmation = 3
+    """Number of distinct mod-sections that have to agree on a width, and none on another, for confirming it."""
+    n_bits_resync_max = 48
+    """Largest parameter bit width resync(..) will try for an unknown mod. Known mods carry at most 29 bits."""
 
-    def __init__(self, binary: str):
-        """:param binary: Complete binary of a complete mod-section."""
-        self.binary = binary
+    def __init__(self, binary: Union[str, bytes, int], index0: int = 0, index1: Optional[int] = None):
+        """:param binary: Complete binary of a complete mod-section. Either a little endian binary string, or raw item
+          bytes, or an int whose bit j is the j-th bit of the item. Bytes and ints are read at a bit cursor, without
+          ever turning them into strings.
+        :param index0: Bit index within binary where the mod-section begins.
+        :param index1: Bit index within binary where the mod-section ends. Defaults to the end of binary.
+          Mandatory, if binary is an int."""
+        if isinstance(binary, str):
+            n_bits_total = len(binary)
+            binary = int(binary[::-1], 2) if binary else 0
+        elif isinstance(binary, (bytes, bytearray)):
+            n_bits_total = 8 * len(binary)
+            binary = int.from_bytes(binary, 'little')
+        elif index1 is None:
+            raise ValueError("Integer modification binaries require an explicit index1.")
+        else:
+            n_bits_total = index1
+        if index1 is None:
+            index1 = n_bits_total
+        self.n_bits = max(index1 - index0, 0)  # type: int
+        self.value = (binary >> index0) & ((1 << self.n_bits) - 1)  # type: int
         self.items_modification = list()  # type: List[ModificationItem]
+        self.widths_discovered = dict()  # type: Dict[int, int]
         index0 = 0
-        while index0 < len(self.binary):
-            mod = ModificationItem(self.binary, index0, self.cache_table_mods)
-            if mod.id_mod == '111111111':
+        while index0 < self.n_bits:
+            mod = ModificationItem(self.value, index0, self.get_table_mods(), self.n_bits)
+            if mod.id_mod_int == 0x1ff:
                 # [Note: 512 is the code for the terminal id. It is no mod per se and should not be part of a mod list.]
                 break
             self.items_modification.append(mod)
@@ -558,10 +1000,161 @@ class ModificationSet:
                 # [Note: A non-valid mod is designed to hold the unparsable remainder binary and should be part of
                 #  the modification list. Its chief problem is the first mod within it being hitherto unknown in [1].
                 #  It is quite possible that all other modifications beyond this first unknown one are quite known.
-                #  However, we would not know, because it is unclear at what index their ids would begin.]
-                break
+                #  However, we would not know, because it is unclear at what index their ids would begin.
+                #  Unless resync(..) finds a width that makes the rest of the binary fall into place.]
+                width = self.resync(index0) if mod.parsed['spec'] is None else None
+                if width is None:
+                    break
+                mod.parsed['index1'] = index0 + 9 + width
+                mod.parsed['n_bits_discovered'] = width
             index0 = mod.parsed['index1']
 
+    def resync(self, index0: int) -> Optional[int]:
+        """Attempts to determine the parameter bit width of the mod at index0 that is unknown to [1]. All candidate
+        widths up to n_bits_resync_max are tried. Among those after which the remainder decodes cleanly (see
+        count_known_mods(..)), the one decoding the most known mods wins. The smallest one, in case of ties. It is
+        accepted for this mod-section, and counts as a vote for it. See vote_width(..). Further unknown mods within the
+        remainder are only accepted with discovered widths.
+        [Note: A width that merely runs into nine 1-bits within parameters would pass as terminated, if the
+         terminator did not have to be followed by padding only. And it would decode no known mod behind it.]
+        :returns the parameter bit width (excluding the 9-bit id). None if no width makes the remainder decode cleanly."""
+        id_mod = (self.value >> index0) & 0x1ff
+        width = self.get_width_discovered(id_mod)
+        if width is not None:
+            return width if (index0 + 9 + width) <= self.n_bits else None
+        memo = dict()  # type: Dict[int, int]
+        width_best = None  # type: Optional[int]
+        n_best = -1
+        for width in range(min(self.n_bits_resync_max, self.n_bits - index0 - 9) + 1):
+            n = self.count_known_mods(index0 + 9 + width, memo)
+            if n > n_best:
+                width_best, n_best = width, n
+        if width_best is None:
+            return None
+        _log.info(f"Unknown mod id '{id_mod}' resynchronised with a parameter width of {width_best} bits, followed by {n_best} known mods.")
+        self.widths_discovered[id_mod] = width_best
+        self.vote_width(id_mod, width_best, hash((self.value, self.n_bits)))
+        return width_best
+
+    def get_width_discovered(self, id_mod: int) -> Optional[int]:
+        """:returns the width discovered for the unknown mod id_mod within this mod-section, else the confirmed one.
+        None, if there is neither."""
+        if id_mod in self.widths_discovered:
+            return self.widths_discovered[id_mod]
+        return self.cache_widths_discovered.get(id_mod)
+
+    @staticmethod
+    def vote_width(id_mod: int, width: int, key: int):
+        """Records that the mod-section with hash key resynchronised with width for the unknown mod id_mod.
+        [Note: The first width that decodes cleanly may be a coincidence of a single item. Hence, a width is cached
+         class-wide only once n_votes_confirmation distinct mod-sections have agreed on it, and none on another one.]"""
+        with ModificationSet.lock_widths:
+            votes = ModificationSet.cache_widths_votes.setdefault(id_mod, dict())
+            votes.setdefault(width, set()).add(key)
+            if (len(votes) == 1) and (len(votes[width]) >= ModificationSet.n_votes_confirmation):
+                ModificationSet.cache_widths_discovered[id_mod] = width
+                _log.info(f"Unknown mod id '{id_mod}' confirmed with a parameter width of {width} bits.")
+
+    @staticmethod
+    def reset_widths_discovered():
+        """Forgets all widths discovered and votes, e.g. ahead of parsing files of another mod table version."""
+        with ModificationSet.lock_widths:
+            ModificationSet.cache_widths_discovered.clear()
+            ModificationSet.cache_widths_votes.clear()
+
+    def decodes_cleanly(self, index0: int, memo: Optional[Dict[int, int]] = None) -> bool:
+        """:returns True if and only if the binary from index0 on is a sequence of valid mods (or mods of discovered
+        width), ending exactly at the end of the binary, or at the 0x1ff terminator followed by 0-bit padding only.
+        :param memo: See count_known_mods(..)."""
+        return self.count_known_mods(index0, dict() if memo is None else memo) >= 0
+
+    def count_known_mods(self, index0: int, memo: Dict[int, int]) -> int:
+        """:returns the number of mods known to [1] that the binary from index0 on decodes into, if it decodes cleanly.
+        See decodes_cleanly(..). Else -1.
+        :param memo: Memoization over index0. Shared between calls of the same resync(..)."""
+        if index0 not in memo:
+            if index0 == self.n_bits:
+                res = 0
+            elif self.n_bits - index0 < 9:
+                res = -1
+            else:
+                id_mod = (self.value >> index0) & 0x1ff
+                spec = self.get_table_mods().get_spec(id_mod)
+                if id_mod == 0x1ff:
+                    res = 0 if (self.value >> (index0 + 9)) == 0 else -1  # << Padding only behind the terminator.
+                elif spec is not None:
+                    index1 = index0 + spec.n_bits
+                    res = -1
+                    if index1 <= self.n_bits and self.is_spec_fitting(spec, index0):
+                        res = self.count_known_mods(index1, memo)
+                        res = (res + 1) if res >= 0 else -1
+                elif self.get_width_discovered(id_mod) is not None:
+                    res = self.count_known_mods(index0 + 9 + self.get_width_discovered(id_mod), memo)
+                else:
+                    res = -1
+            memo[index0] = res
+        return memo[index0]
+
+    def is_spec_fitting(self, spec: ModSpec, index0: int) -> bool:
+        """:returns True if and only if the parameters of the mod at index0 satisfy the relations of spec.
+        Quiet variant of ModificationItem.parse_parameters(..) for searching."""
+        raw_prior = None  # type: Optional[int]
+        index = index0 + 9
+        for param in spec.params:
+            raw = (self.value >> index) & ((1 << param.n_bits) - 1)
+            if not param.is_relation_ok(raw, raw_prior):
+                return False
+            raw_prior = raw
+            index += param.n_bits
+        return True
+
+    @staticmethod
+    def get_table_mods() -> TableMods:
+        """:returns the table of known mods from mods.tsv. Loaded on first call. Thread-safe."""
+        if ModificationSet.cache_table_mods is None:
+            with ModificationSet.lock_table_mods:
+                if ModificationSet.cache_table_mods is None:
+                    ModificationSet.cache_table_mods = TableMods.load()
+        return ModificationSet.cache_table_mods
+
+    @staticmethod
+    def encode_int(entries: Sequence[Tuple[Union[int, str], Sequence[Optional[Union[int, float, str]]]]],
+                   table: Optional[TableMods] = None) -> Tuple[int, int]:
+        """Builds a complete mod-section from structured values. The inverse to parsing.
+        :param entries: List of (mod, values). mod is either the integer mod id or its (unambiguous) name from mods.tsv.
+          values hold one in-game value per parameter. See ModSpec.encode(..).
+        :param table: Modification lookup table. Defaults to ModificationSet.get_table_mods().
+        :returns (value, n_bits) of the packed section, including the 0x1ff terminator. Bit j of value is the j-th bit.
+        :raises ValueError if any entry is unknown, out of range or violates a relation."""
+        if table is None:
+            table = ModificationSet.get_table_mods()
+        res = 0
+        index = 0
+        for key, values in entries:
+            spec = table.get_spec_by_key(key)
+            res |= spec.encode(values) << index
+            index += spec.n_bits
+        res |= 0x1ff << index
+        return res, index + 9
+
+    @staticmethod
+    def encode(entries: Sequence[Tuple[Union[int, str], Sequence[Optional[Union[int, float, str]]]]],
+               table: Optional[TableMods] = None) -> str:
+        """Like encode_int(..), but returns the packed mod-section as little endian binary string, ready for
+        being spliced into an item bitmap. E.g., [('Magic Find', [30])]."""
+        value, n_bits = ModificationSet.encode_int(entries, table)
+        return ModificationSet.int2binary(value, n_bits)
+
+    @staticmethod
+    def int2binary(value: int, n_bits: int) -> str:
+        """:returns the n_bits lowest bits of value as little endian binary string."""
+        return '{:0{width}b}'.format(value & ((1 << n_bits) - 1), width=n_bits)[::-1] if n_bits > 0 else ''
+
+    @property
+    def binary(self) -> str:
+        """:returns the mod-section as little endian binary string. Rendered on demand."""
+        return self.int2binary(self.value, self.n_bits)
+
     def __str__(self):
         res = self.binary + "\n"
         for mod in self.items_modification:
@@ -573,7 +1166,7 @@ if __name__ == '__main__':
     mods = TableMods()
     #ms = ModificationSet(example_infinity)
     example = '10011100010010100001001010000110100100'
-    mi = ModificationItem(example,0,ModificationSet.cache_table_mods)
+    mi = ModificationItem(example,0,ModificationSet.get_table_mods())
     # #<< id: 001000110 lvl(20): 001010 skill(53): 101011000; val(100): 00100110
     print(mi)
     print('Done.')